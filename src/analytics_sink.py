@@ -0,0 +1,117 @@
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler
+
+import redis
+
+from util import LOG_FORMAT
+
+logger = logging.getLogger(__name__)
+
+
+class _SinkHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the records of the analytics logger go to this handler only, so
+        # unlike `QueueHandler` they are neither copied nor formatted here
+        return record
+
+
+class AnalyticsSink:
+    """AnalyticsSink
+
+    Takes analytics log records off the request path. Loggers get a
+    `QueueHandler` that only appends the record to an in-memory queue; a
+    writer thread drains the queue in batches of up to `max_batch` records,
+    appends them to the log file in `LOG_FORMAT`, the format
+    `AnalyticsLogReader` parses, with a single write, and, with a Redis
+    client, publishes them to `stream` with a single pipeline round trip.
+    """
+
+    def __init__(
+        self,
+        file_path: str | None,
+        redis_client: redis.Redis | None = None,
+        stream: str = "analytics:queries",
+        stream_max_length: int = 1_000_000,
+        max_batch: int = 1_000,
+    ):
+        self.file_path = file_path
+        self.redis_client = redis_client
+        self.stream = stream
+        self.stream_max_length = stream_max_length
+        self.max_batch = max_batch
+        self.records_written = 0
+        self._formatter = logging.Formatter(LOG_FORMAT)
+        self._queue: queue.SimpleQueue[logging.LogRecord | None] = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+
+    def handler(self) -> QueueHandler:
+        return _SinkHandler(self._queue)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run, name="analytics-sink", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Writes everything that was logged so far and stops the writer."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        file = None if self.file_path is None else open(self.file_path, "a")
+        try:
+            stopped = False
+            while not stopped:
+                records = [self._queue.get()]
+                while len(records) < self.max_batch:
+                    try:
+                        records.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stopped = None in records
+                records = [record for record in records if record is not None]
+                if records:
+                    self._write(file, records)
+        finally:
+            if file is not None:
+                file.close()
+
+    def _write(self, file, records: list[logging.LogRecord]) -> None:
+        try:
+            if file is not None:
+                file.write("".join(f"{self._formatter.format(r)}\n" for r in records))
+                file.flush()
+            if self.redis_client is not None:
+                self._publish(records)
+            self.records_written += len(records)
+        except Exception as e:
+            # losing analytics must never take the writer down
+            logger.error(f"Failed to write {len(records)} analytics records: {e}")
+
+    def _publish(self, records: list[logging.LogRecord]) -> None:
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for record in records:
+            pipeline.xadd(
+                self.stream,
+                dict(ts=record.created, message=record.getMessage()),
+                maxlen=self.stream_max_length,
+                approximate=True,
+            )
+        try:
+            pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Analytics stream {self.stream} unavailable: {e}")
+
+
+def make_analytics_sink(
+    file_path: str | None, redis_url: str, stream: str | None
+) -> AnalyticsSink:
+    if stream is None:
+        return AnalyticsSink(file_path)
+    return AnalyticsSink(file_path, redis.Redis.from_url(redis_url), stream)
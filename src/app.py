@@ -1,19 +1,44 @@
+import atexit
 import json
 import logging
+import threading
 from dataclasses import asdict
 from flask import Flask, request, render_template_string
 from flask_sse import sse
 
+from autocomplete.log_reader import AnalyticsLogReader
 from autocomplete.mermaid import Mermaid
-from autocomplete.subgraph_cache_trie import SubgraphCacheTrie
-from search.inverted_index import InvertedIndex
-from pickle_store import PickleStore
-from util import add_file_handler, get_static_file
+from autocomplete.popularity import DecayedPopularity
+from autocomplete.trie_delta import TrieDeltaStore
+from autocomplete.compact_trie import CompactTrie
+from analytics_sink import make_analytics_sink
+from background_loader import BackgroundLoader
+from search.embedding_cache import EmbeddingCache
+from search.result_cache import make_result_cache, result_cache_key
+from pickle_store import Artifact, PickleStore
+from segment_store import SegmentStore
+from util import get_static_file
 from env import (
+    AUTOCOMPLETE_TOP_K,
+    POPULARITY_HALF_LIFE_SECONDS,
     TRIE_STORAGE_PATH,
+    TRIE_DELTA_PATH,
     QUERY_LOG_PATH,
+    ANALYTICS_REDIS_STREAM,
     REDIS_URL,
     INVERTED_INDEX_STORAGE_PATH,
+    HNSW_EF_SEARCH,
+    SEARCH_MODE,
+    SEARCH_FUSION,
+    SEARCH_PARALLEL_RETRIEVAL,
+    SEARCH_BATCH_MAX_QUERIES,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_TTL_SECONDS,
+    QUERY_CACHE_WARM_SIZE,
+    INDEX_WARMUP_QUERIES,
+    RESULT_CACHE_BACKEND,
+    RESULT_CACHE_SIZE,
+    RESULT_CACHE_TTL_SECONDS,
 )
 
 # Flask application config
@@ -23,23 +48,136 @@ app.register_blueprint(sse, url_prefix="/stream")
 
 # logging config
 app.logger.setLevel(logging.INFO)
+# queries are written to the log by a background thread, off the request path
+ANALYTICS_SINK = make_analytics_sink(QUERY_LOG_PATH, REDIS_URL, ANALYTICS_REDIS_STREAM)
+ANALYTICS_SINK.start()
+atexit.register(ANALYTICS_SINK.stop)
 analytics_logger = logging.Logger("analytics")
-add_file_handler(analytics_logger, QUERY_LOG_PATH)
+analytics_logger.addHandler(ANALYTICS_SINK.handler())
 
 # static pages
 HTML_HOME = get_static_file("index.html")
 HTML_TRIE = get_static_file("trie.html")
 
-# inverted index config
-INVERTED_INDEX_STORAGE = PickleStore(INVERTED_INDEX_STORAGE_PATH)
-INVERTED_INDEX = INVERTED_INDEX_STORAGE.get_latest(InvertedIndex).artifact
+
+def _head_queries() -> list[str]:
+    log_reader = AnalyticsLogReader(QUERY_LOG_PATH, None)
+    log_reader.unique_count()
+    return log_reader.top_queries(QUERY_CACHE_WARM_SIZE)
+
+
+def _load_inverted_index(previous: Artifact | None = None) -> Artifact | None:
+    global HEAD_QUERIES
+    previous_index = previous.artifact if previous is not None else None
+    inverted_index_blob = INVERTED_INDEX_STORAGE.get_latest(previous=previous_index)
+    if inverted_index_blob is None:
+        return None
+    inverted_index = inverted_index_blob.artifact
+    # embeddings only depend on the model, so a reload keeps the cached ones
+    if previous_index is not None and (
+        previous_index.model_name == inverted_index.model_name
+    ):
+        inverted_index.query_cache = previous_index.query_cache
+    else:
+        inverted_index.query_cache = EmbeddingCache(
+            QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SECONDS
+        )
+    # validating and warming the index both use the head of the query log
+    HEAD_QUERIES = _head_queries()
+    return inverted_index_blob
+
+
+def _validate_inverted_index(inverted_index_blob: Artifact, head_queries: list[str]):
+    inverted_index = inverted_index_blob.artifact
+    if inverted_index.total_docs == 0:
+        raise ValueError(f"Empty inverted index: {inverted_index_blob.file_path}")
+    for query in head_queries[:INDEX_WARMUP_QUERIES] or ["search"]:
+        for result in inverted_index.top_k(query, mode="hybrid"):
+            if not result.url:
+                raise ValueError(f"Result without url for {query!r}: {result}")
+
+
+def _warm_inverted_index(
+    inverted_index_blob: Artifact, head_queries: list[str]
+) -> Artifact:
+    inverted_index = inverted_index_blob.artifact
+    # the search time candidate list size is not tied to the snapshot
+    inverted_index.config.ef_search = HNSW_EF_SEARCH
+    # pre-compute embeddings for the head queries so they never hit the model
+    warmed = inverted_index.warm_query_cache(head_queries)
+    # and touch the graph and postings pages the most popular queries need
+    for query in head_queries[:INDEX_WARMUP_QUERIES]:
+        inverted_index.top_k(query, mode=SEARCH_MODE, fusion=SEARCH_FUSION)
+    app.logger.info(f"Warmed query embedding cache with {warmed} queries")
+    return inverted_index_blob
+
+
+def _swap_inverted_index(inverted_index_blob: Artifact):
+    global INVERTED_INDEX
+    INVERTED_INDEX = inverted_index_blob
+
+
+def _catch_up_trie(trie: CompactTrie) -> int:
+    """Applies the deltas written since `trie` was saved, in place."""
+    applied = 0
+    with TRIE_DELTA_LOCK:
+        for seq, bucket_counts in TRIE_DELTAS.since(trie.delta_seq):
+            trie.apply_delta(seq, bucket_counts)
+            applied += 1
+    return applied
+
+
+def _swap_trie(trie_blob: Artifact):
+    global AUTOCOMPLETE_TRIE
+    AUTOCOMPLETE_TRIE = trie_blob.artifact
+    # pick up the deltas that were applied to the old trie while warming
+    _catch_up_trie(AUTOCOMPLETE_TRIE)
+    # notify clients to pull the new trie graph
+    with app.app_context():
+        sse.publish({"event": "new trie!"}, type="content-updates")
+
+
+# inverted index config; the index is kept together with the file it was
+# loaded from so that a single rebind swaps both the index and its generation.
+# the crawler adds segments as it goes, a load only opens the new ones
+INVERTED_INDEX_STORAGE = SegmentStore(INVERTED_INDEX_STORAGE_PATH)
+# the most popular queries of the log, read once per load of the index
+HEAD_QUERIES: list[str] = []
+INVERTED_INDEX = _load_inverted_index()
+_warm_inverted_index(INVERTED_INDEX, HEAD_QUERIES)
+INVERTED_INDEX_LOADER = BackgroundLoader(
+    "inverted index",
+    load=lambda: _load_inverted_index(previous=INVERTED_INDEX),
+    swap=_swap_inverted_index,
+    validate=lambda blob: _validate_inverted_index(blob, HEAD_QUERIES),
+    warm=lambda blob: _warm_inverted_index(blob, HEAD_QUERIES),
+    active_generation=INVERTED_INDEX.generation,
+)
+RESULT_CACHE = make_result_cache(
+    RESULT_CACHE_BACKEND, REDIS_URL, RESULT_CACHE_SIZE, RESULT_CACHE_TTL_SECONDS
+)
 
 # autocomplete config
 TRIE_STORAGE = PickleStore(TRIE_STORAGE_PATH)
-try:
-    AUTOCOMPLETE_TRIE = TRIE_STORAGE.get_latest(SubgraphCacheTrie).artifact
-except AttributeError as e:
-    AUTOCOMPLETE_TRIE = SubgraphCacheTrie()
+TRIE_DELTAS = TrieDeltaStore(TRIE_DELTA_PATH)
+TRIE_DELTA_LOCK = threading.Lock()
+trie_blob = TRIE_STORAGE.get_latest(CompactTrie)
+AUTOCOMPLETE_TRIE = (
+    CompactTrie(
+        top_k=AUTOCOMPLETE_TOP_K,
+        popularity=DecayedPopularity(POPULARITY_HALF_LIFE_SECONDS),
+    )
+    if trie_blob is None
+    else trie_blob.artifact
+)
+_catch_up_trie(AUTOCOMPLETE_TRIE)
+TRIE_LOADER = BackgroundLoader(
+    "trie",
+    load=lambda: TRIE_STORAGE.get_latest(CompactTrie),
+    swap=_swap_trie,
+    warm=lambda trie_blob: _catch_up_trie(trie_blob.artifact),
+    active_generation=None if trie_blob is None else trie_blob.generation,
+)
 MERMAID = Mermaid()
 
 
@@ -53,9 +191,7 @@ def autocomplete():
     query = request.get_json()["query"]
     if query == "":
         return json.dumps([])
-    node = AUTOCOMPLETE_TRIE.find(query)
-    suggestions = [] if node is None else node.cache_sorted_keys
-    return suggestions
+    return AUTOCOMPLETE_TRIE.suggest(query)
 
 
 @app.route("/search", methods=["POST"])
@@ -63,17 +199,100 @@ def search():
     query = request.form["query"]
     analytics_logger.info(query)
     app.logger.info(f"Received query: {query}")
-    search_results = INVERTED_INDEX.top_k(query)
-    return [asdict(result) for result in search_results]
+    params = dict(
+        k=request.form.get("k", 10, type=int),
+        mode=request.form.get("mode", SEARCH_MODE),
+        fusion=request.form.get("fusion", SEARCH_FUSION),
+        lexical_weight=request.form.get("lexical_weight", 1.0, type=float),
+        vector_weight=request.form.get("vector_weight", 1.0, type=float),
+        ef=request.form.get("ef", None, type=int),
+    )
+    if params["k"] < 1:
+        return dict(error="k must be at least 1"), 400
+    inverted_index_blob = INVERTED_INDEX
+    cache_key = result_cache_key(inverted_index_blob.generation, query, **params)
+    if RESULT_CACHE is not None:
+        cached_results = RESULT_CACHE.get(cache_key)
+        if cached_results is not None:
+            return cached_results
+    try:
+        search_results = inverted_index_blob.artifact.top_k(
+            query, parallel=SEARCH_PARALLEL_RETRIEVAL, **params
+        )
+    except ValueError as e:
+        return dict(error=str(e)), 400
+    results = [asdict(result) for result in search_results]
+    if RESULT_CACHE is not None:
+        RESULT_CACHE.put(cache_key, results)
+    return results
+
+
+@app.route("/search/batch", methods=["POST"])
+def search_batch():
+    body = request.get_json()
+    if not isinstance(body, dict):
+        return dict(error="The body must be a JSON object"), 400
+    queries = body.get("queries")
+    if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+        return dict(error="queries must be a list of strings"), 400
+    if len(queries) > SEARCH_BATCH_MAX_QUERIES:
+        return dict(error=f"At most {SEARCH_BATCH_MAX_QUERIES} queries"), 400
+    app.logger.info(f"Received batch of {len(queries)} queries")
+    try:
+        params = dict(
+            k=int(body.get("k", 10)),
+            mode=body.get("mode", SEARCH_MODE),
+            fusion=body.get("fusion", SEARCH_FUSION),
+            lexical_weight=float(body.get("lexical_weight", 1.0)),
+            vector_weight=float(body.get("vector_weight", 1.0)),
+            ef=None if body.get("ef") is None else int(body["ef"]),
+        )
+    except (TypeError, ValueError) as e:
+        return dict(error=f"Invalid search parameter: {e}"), 400
+    if params["k"] < 1:
+        return dict(error="k must be at least 1"), 400
+    inverted_index_blob = INVERTED_INDEX
+    cache_keys = [
+        result_cache_key(inverted_index_blob.generation, query, **params)
+        for query in queries
+    ]
+    results = [None] * len(queries)
+    if RESULT_CACHE is not None:
+        results = [RESULT_CACHE.get(cache_key) for cache_key in cache_keys]
+    missing = [i for i, cached_results in enumerate(results) if cached_results is None]
+    try:
+        search_results = inverted_index_blob.artifact.top_k_many(
+            [queries[i] for i in missing], **params
+        )
+    except ValueError as e:
+        return dict(error=str(e)), 400
+    for i, query_results in zip(missing, search_results):
+        results[i] = [asdict(result) for result in query_results]
+        if RESULT_CACHE is not None:
+            RESULT_CACHE.put(cache_keys[i], results[i])
+    return results
+
+
+@app.route("/search/stats", methods=["GET"])
+def search_stats():
+    return dict(
+        generation=INVERTED_INDEX.generation,
+        vector_backend=INVERTED_INDEX.artifact.vector_backend,
+        query_cache=INVERTED_INDEX.artifact.query_cache.stats(),
+        result_cache=None if RESULT_CACHE is None else RESULT_CACHE.stats(),
+    )
 
 
 @app.route("/inverted-index/load", methods=["POST"])
 def load_inverted_index():
-    global INVERTED_INDEX
-    inverted_index_blob = INVERTED_INDEX_STORAGE.get_latest(InvertedIndex)
-    INVERTED_INDEX = inverted_index_blob.artifact
-    app.logger.info(f"Loaded new inverted index: {inverted_index_blob.file_path}")
-    return dict(status="OK")
+    started = INVERTED_INDEX_LOADER.start()
+    status = "LOADING" if started else "ALREADY_LOADING"
+    return dict(status=status, load=INVERTED_INDEX_LOADER.status()), 202
+
+
+@app.route("/inverted-index/status", methods=["GET"])
+def inverted_index_status():
+    return INVERTED_INDEX_LOADER.status()
 
 
 @app.route("/trie", methods=["GET"])
@@ -83,13 +302,26 @@ def trie():
 
 @app.route("/trie/load", methods=["POST"])
 def load_trie():
-    global AUTOCOMPLETE_TRIE
-    trie_blob = TRIE_STORAGE.get_latest(SubgraphCacheTrie)
-    AUTOCOMPLETE_TRIE = trie_blob.artifact
-    app.logger.info(f"Loaded new trie: {trie_blob.file_path}")
-    # notify clients to pull the new trie graph
-    sse.publish({"event": "new trie!"}, type="content-updates")
-    return dict(status="OK")
+    started = TRIE_LOADER.start()
+    status = "LOADING" if started else "ALREADY_LOADING"
+    return dict(status=status, load=TRIE_LOADER.status()), 202
+
+
+@app.route("/trie/deltas", methods=["POST"])
+def apply_trie_deltas():
+    trie = AUTOCOMPLETE_TRIE
+    if TRIE_DELTAS.oldest_seq() > trie.delta_seq + 1:
+        # the deltas this trie is missing were folded into a newer trie
+        started = TRIE_LOADER.start()
+        status = "LOADING" if started else "ALREADY_LOADING"
+        return dict(status=status, load=TRIE_LOADER.status()), 202
+    applied = _catch_up_trie(trie)
+    return dict(status="APPLIED", applied=applied, delta_seq=trie.delta_seq)
+
+
+@app.route("/trie/status", methods=["GET"])
+def trie_status():
+    return TRIE_LOADER.status()
 
 
 @app.route("/trie/graph", methods=["GET"])
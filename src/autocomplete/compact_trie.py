@@ -0,0 +1,281 @@
+import heapq
+import os
+from array import array
+from collections import deque
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+from autocomplete.popularity import DecayedPopularity
+
+
+class CompactNode:
+    """CompactNode
+
+    Radix trie node. Chains of single-child nodes are collapsed into one node
+    whose `edge` holds the whole run of characters, leaves carry no children
+    dict at all, and a terminal node stores only the integer id of its query.
+    The full key is never stored, it is rebuilt from the edges on demand.
+    `top` holds the ids of the best ranked queries below the node.
+    """
+
+    __slots__ = ("edge", "children", "query_id", "parent", "top")
+
+    def __init__(self, edge: str = "", parent: Optional["CompactNode"] = None):
+        self.edge = edge
+        self.children: dict[str, "CompactNode"] | None = None
+        self.query_id = -1
+        self.parent = parent
+        self.top: tuple[int, ...] = ()
+
+    @property
+    def is_terminal(self) -> bool:
+        return self.query_id >= 0
+
+    @property
+    def key(self) -> str:
+        edges = []
+        node = self
+        while node is not None:
+            edges.append(node.edge)
+            node = node.parent
+        return "".join(reversed(edges))
+
+    def child(self, c: str) -> Optional["CompactNode"]:
+        return None if self.children is None else self.children.get(c)
+
+
+class CompactTrie:
+    """CompactTrie
+
+    Autocomplete trie that keeps every query exactly once, in a string table
+    indexed by an integer query id, with the scores in a parallel flat array.
+    Scores are plain counts, or with `popularity` forward decayed counts.
+    Nodes only reference query ids, so memory grows with the number of
+    distinct queries instead of with the sum of their prefixes as it does for
+    `SubgraphCacheTrie`.
+
+    Every node keeps the ids of its `top_k` best ranked queries. A node's list
+    is always the best of its own query and its children's lists, so an update
+    only walks up the ancestors for as long as the changed query is in, or
+    enters, their list, and a suggestion is a single lookup.
+    """
+
+    def __init__(self, top_k: int = 10, popularity: DecayedPopularity | None = None):
+        self.top_k = top_k
+        self.popularity = popularity
+        # sequence number of the last `TrieDeltaStore` delta applied
+        self.delta_seq = 0
+        self.root = CompactNode()
+        self._queries: list[str | None] = []
+        self._scores = array("d")
+        self._free_ids: list[int] = []
+
+    @classmethod
+    def from_items(
+        cls,
+        items: Iterable[Tuple[str, float]],
+        top_k: int = 10,
+        popularity: DecayedPopularity | None = None,
+    ) -> "CompactTrie":
+        trie = cls(top_k=top_k, popularity=popularity)
+        for key, count in items:
+            trie.insert(key, count)
+        return trie
+
+    def __len__(self) -> int:
+        return len(self._queries) - len(self._free_ids)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __getstate__(self) -> dict:
+        # the nodes are cheap to rebuild, only the queries and scores are kept
+        return dict(
+            top_k=self.top_k,
+            popularity=self.popularity,
+            delta_seq=self.delta_seq,
+            items=list(self.items()),
+        )
+
+    def __setstate__(self, state: dict):
+        self.__init__(top_k=state["top_k"], popularity=state.get("popularity"))
+        self.delta_seq = state["delta_seq"]
+        for key, count in state["items"]:
+            self.insert(key, count)
+
+    def items(self) -> Iterator[Tuple[str, float]]:
+        for query_id, query in enumerate(self._queries):
+            if query is not None:
+                yield query, self._scores[query_id]
+
+    def scores(self, now: float) -> Iterator[Tuple[str, float]]:
+        """The queries with their scores decayed to `now`."""
+        decay = 1.0 if self.popularity is None else self.popularity.decay(now)
+        for query, score in self.items():
+            yield query, score * decay
+
+    def get(self, key: str) -> Optional[float]:
+        node, consumed = self._walk(key)
+        if node is None or consumed != len(key) or not node.is_terminal:
+            return None
+        return self._scores[node.query_id]
+
+    def insert(self, key: str, score: float) -> CompactNode:
+        node = self._insert_node(key)
+        if node.is_terminal:
+            increased = score > self._scores[node.query_id]
+            if score == self._scores[node.query_id]:
+                return node
+            self._scores[node.query_id] = score
+        elif self._free_ids:
+            increased = True
+            node.query_id = self._free_ids.pop()
+            self._queries[node.query_id] = key
+            self._scores[node.query_id] = score
+        else:
+            increased = True
+            node.query_id = len(self._queries)
+            self._queries.append(key)
+            self._scores.append(score)
+        self._update_top(node, node.query_id, increased)
+        return node
+
+    def increment(self, key: str, score: float) -> CompactNode:
+        return self.insert(key, (self.get(key) or 0) + score)
+
+    def apply_delta(self, seq: int, bucket_counts: Dict[int, Dict[str, int]]):
+        """Adds query counts grouped by the start of their time bucket."""
+        if seq <= self.delta_seq:
+            return
+        for bucket, counts in bucket_counts.items():
+            weight = 1.0
+            if self.popularity is not None:
+                weight = self.popularity.weight(int(bucket))
+            for key, count in counts.items():
+                self.increment(key, count * weight)
+        self.delta_seq = seq
+
+    def decay(self, now: float, min_score: float) -> int:
+        """Moves the popularity landmark to `now` and deletes the queries
+        whose decayed score fell below `min_score`. Returns how many."""
+        if self.popularity is not None:
+            # every score shrinks by the same factor, so no ranking changes
+            scores = np.frombuffer(self._scores, dtype=np.float64)
+            scores *= self.popularity.rebase(now)
+        evicted = [query for query, score in self.items() if score < min_score]
+        for query in evicted:
+            self.delete(query)
+        return len(evicted)
+
+    def delete(self, key: str):
+        node, consumed = self._walk(key)
+        if node is None or consumed != len(key) or not node.is_terminal:
+            return
+        query_id = node.query_id
+        node.query_id = -1
+        self._update_top(node, query_id, increased=False)
+        self._queries[query_id] = None
+        self._scores[query_id] = 0
+        self._free_ids.append(query_id)
+        self._compact(node)
+
+    def suggest(self, prefix: str) -> list[str]:
+        """The `top_k` queries starting with `prefix`, most popular first."""
+        node, _ = self._walk(prefix)
+        if node is None:
+            return []
+        return [self._queries[query_id] for query_id in node.top]
+
+    def bfs(self) -> Iterator[CompactNode]:
+        queue = deque([self.root])
+        while queue:
+            current_node = queue.popleft()
+            if current_node.children:
+                queue.extend(current_node.children.values())
+            yield current_node
+
+    def _walk(self, prefix: str) -> Tuple[Optional[CompactNode], int]:
+        """Returns the topmost node whose key starts with `prefix`, and how
+        many characters of its key were consumed to get there."""
+        node = self.root
+        i = 0
+        while i < len(prefix):
+            child = node.child(prefix[i])
+            if child is None or not child.edge.startswith(
+                prefix[i : i + len(child.edge)]
+            ):
+                return None, i
+            node = child
+            i += len(child.edge)
+        return node, i
+
+    def _insert_node(self, key: str) -> CompactNode:
+        node = self.root
+        i = 0
+        while i < len(key):
+            child = node.child(key[i])
+            if child is None:
+                leaf = CompactNode(key[i:], node)
+                if node.children is None:
+                    node.children = dict()
+                node.children[key[i]] = leaf
+                return leaf
+            edge = child.edge
+            common = len(os.path.commonprefix((edge, key[i : i + len(edge)])))
+            if common < len(edge):
+                # split the edge where the new key diverges from it
+                middle = CompactNode(edge[:common], node)
+                middle.top = child.top
+                node.children[key[i]] = middle
+                child.edge = edge[common:]
+                child.parent = middle
+                middle.children = {child.edge[0]: child}
+                child = middle
+            node = child
+            i += common
+        return node
+
+    def _compact(self, node: CompactNode):
+        """Removes or merges a node that no longer ends a query."""
+        if node is self.root or node.is_terminal:
+            return
+        parent = node.parent
+        if not node.children:
+            del parent.children[node.edge[0]]
+            if not parent.children:
+                parent.children = None
+            self._compact(parent)
+        elif len(node.children) == 1:
+            (child,) = node.children.values()
+            child.edge = node.edge + child.edge
+            child.parent = parent
+            parent.children[child.edge[0]] = child
+
+    def _rank(self, query_id: int) -> Tuple[float, int]:
+        # most popular first, ties go to the lower query id
+        return -self._scores[query_id], query_id
+
+    def _best(self, query_ids: Iterable[int]) -> tuple[int, ...]:
+        return tuple(heapq.nsmallest(self.top_k, query_ids, key=self._rank))
+
+    def _update_top(self, node: CompactNode, query_id: int, increased: bool):
+        """Re-ranks the lists of `node` and its ancestors after the count of
+        `query_id` went up or down. Above the first node where the query is
+        neither in nor enters the list, no list can change."""
+        while node is not None:
+            top = node.top
+            if query_id in top and not increased:
+                # it may drop out, so the runner-up has to come from below
+                candidates = [] if not node.is_terminal else [node.query_id]
+                for child in (node.children or dict()).values():
+                    candidates.extend(child.top)
+                new_top = self._best(candidates)
+            elif query_id in top or increased:
+                new_top = self._best(set(top) | {query_id})
+            else:
+                return
+            if query_id not in top and query_id not in new_top:
+                return
+            node.top = new_top
+            node = node.parent
@@ -1,48 +1,130 @@
+import glob
+import heapq
 import os
-from typing import Dict, Optional, Tuple, Iterator
+import re
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import BinaryIO, Dict, List, Optional, Tuple
 
-from collections import defaultdict
+from autocomplete.popularity import bucket_start
+
+# the query is whatever follows the last " - " of a line, and the hour of the
+# first timestamp on the line is the time bucket it is counted in
+QUERY_PATTERN = re.compile(
+    rb"^\D*(?:(\d{4}-\d\d-\d\d \d\d):\d\d:\d\d)?.* - (.*)$", re.MULTILINE
+)
+CHUNK_SIZE = 1 << 22
 
 
 class AnalyticsLogReader:
+    """AnalyticsLogReader
+
+    Counts the queries in the analytics log. The log is read in large binary
+    chunks and only complete lines are counted, so the offset checkpoint
+    always sits on a chunk boundary and a half-written last line is picked up
+    on the next read. The checkpoint also records the inode of the log, so a
+    rotated log is detected, and a log that shrank is read from the start.
+
+    Besides the lifetime `counts`, the queries are counted per hour of their
+    timestamp in `bucket_counts`, keyed by the start of the hour.
+    """
 
-    def __init__(self, log_file_path: str, log_offset_file_path: str):
+    def __init__(
+        self,
+        log_file_path: str,
+        log_offset_file_path: Optional[str],
+        chunk_size: int = CHUNK_SIZE,
+    ):
         self.log_file_path = log_file_path
         self.log_offset_file_path = log_offset_file_path
+        self.chunk_size = chunk_size
         self.bytes_read = 0
-        self.counts = defaultdict(int)
+        self.counts: Counter[str] = Counter()
+        self.bucket_counts: Dict[int, Counter[str]] = defaultdict(Counter)
+        self._bucket_starts: Dict[bytes, int] = dict()
 
-    def _get_log_offset(self) -> int:
+    def _get_checkpoint(self) -> Tuple[int, Optional[int]]:
+        # without an offset file the whole log is read on every call
+        if self.log_offset_file_path is None:
+            return 0, None
         if not os.path.exists(self.log_offset_file_path):
-            return 0
+            return 0, None
         with open(self.log_offset_file_path, "r") as file:
-            try:
-                offset = int(file.read().strip())
-            except ValueError:
-                offset = 0
-        return offset
+            fields = file.read().split()
+        try:
+            offset = int(fields[0])
+            # offset files written before rotation detection have no inode
+            inode = int(fields[1]) if len(fields) > 1 else None
+        except (ValueError, IndexError):
+            return 0, None
+        return offset, inode
+
+    def _get_log_offset(self) -> int:
+        return self._get_checkpoint()[0]
 
-    def _set_log_offset(self, offset: int):
+    def _set_checkpoint(self, offset: int, inode: int):
+        if self.log_offset_file_path is None:
+            return
         with open(self.log_offset_file_path, "w") as file:
-            file.write(str(offset))
-
-    def _unread_lines(self, offset: Optional[int]) -> Iterator[Tuple[str, int]]:
-        with open(self.log_file_path, "r") as file:
-            if offset is not None:
-                file.seek(offset)
-            while True:
-                line = file.readline()
-                if not line:
-                    break
-                yield line, file.tell()
+            file.write(f"{offset} {inode}")
+
+    def _rotated_file_path(self, inode: int) -> Optional[str]:
+        for path in glob.glob(f"{glob.escape(self.log_file_path)}.*"):
+            if os.stat(path).st_ino == inode:
+                return path
+        return None
+
+    def _bucket_start(self, hour: bytes) -> int:
+        if hour not in self._bucket_starts:
+            if hour:
+                timestamp = datetime.strptime(hour.decode(), "%Y-%m-%d %H").timestamp()
+            else:
+                # lines without a timestamp count as seen now
+                timestamp = time.time()
+            self._bucket_starts[hour] = bucket_start(timestamp)
+        return self._bucket_starts[hour]
+
+    def _count(self, lines: bytes):
+        for (hour, query), count in Counter(QUERY_PATTERN.findall(lines)).items():
+            query = query.decode("utf-8", errors="replace").strip()
+            self.counts[query] += count
+            self.bucket_counts[self._bucket_start(hour)][query] += count
+
+    def _count_chunks(self, file: BinaryIO, offset: int) -> int:
+        """Counts the complete lines after `offset` and returns the offset
+        just past the last of them."""
+        file.seek(offset)
+        remainder = b""
+        while chunk := file.read(self.chunk_size):
+            chunk = remainder + chunk
+            end = chunk.rfind(b"\n") + 1
+            remainder = chunk[end:]
+            if end:
+                self._count(chunk[:end])
+                offset += end
+        return offset
 
     def unique_count(self) -> Dict[str, int]:
-        offset = self._get_log_offset()
-        last_offset = offset
-        for line, new_offset in self._unread_lines(offset):
-            query = line.rsplit(" - ", 1)[-1].strip()
-            self.counts[query] += 1
-            last_offset = new_offset
-        self._set_log_offset(last_offset)
-        self.bytes_read = last_offset - offset
+        offset, inode = self._get_checkpoint()
+        self.bytes_read = 0
+        with open(self.log_file_path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            if inode is not None and inode != stat.st_ino:
+                # the log was rotated, finish the old one if it is still there
+                rotated_file_path = self._rotated_file_path(inode)
+                if rotated_file_path is not None:
+                    with open(rotated_file_path, "rb") as rotated_file:
+                        self.bytes_read += self._count_chunks(rotated_file, offset)
+                        self.bytes_read -= offset
+                offset = 0
+            elif stat.st_size < offset:
+                # the log was truncated in place
+                offset = 0
+            last_offset = self._count_chunks(file, offset)
+        self._set_checkpoint(last_offset, stat.st_ino)
+        self.bytes_read += last_offset - offset
         return self.counts
+
+    def top_queries(self, n: int) -> List[str]:
+        return heapq.nlargest(n, self.counts, key=self.counts.get)
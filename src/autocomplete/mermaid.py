@@ -1,4 +1,5 @@
 from typing import Dict
+from autocomplete.compact_trie import CompactNode, CompactTrie
 from autocomplete.trie import Node, Trie
 
 
@@ -8,18 +9,21 @@ class Mermaid:
         self.node_ids: Dict[str, str] = dict()
         self.node_counter: int = -1
 
-    def _id(self, node: Node) -> str:
+    def _id(self, node: Node | CompactNode) -> str:
         if node.key not in self.node_ids:
             self.node_counter += 1
             self.node_ids[node.key] = f"n{self.node_counter}"
         return self.node_ids[node.key]
 
-    def _name(self, node: Node) -> str:
+    def _name(self, node: Node | CompactNode) -> str:
         if node.key == "":
             return " "
+        # compact nodes stand for a whole run of characters
+        if isinstance(node, CompactNode):
+            return node.edge
         return node.key[-1]
 
-    def render_trie(self, trie: Trie) -> str:
+    def render_trie(self, trie: Trie | CompactTrie) -> str:
         mermaid_text = "graph TD\n"
         # declare nodes
         for node in trie.bfs():
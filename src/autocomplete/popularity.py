@@ -0,0 +1,42 @@
+import math
+import time
+from dataclasses import dataclass, field
+
+# queries are counted in fixed one hour buckets
+BUCKET_SECONDS = 3600
+
+
+def bucket_start(timestamp: float) -> int:
+    return int(timestamp) // BUCKET_SECONDS * BUCKET_SECONDS
+
+
+@dataclass
+class DecayedPopularity:
+    """DecayedPopularity
+
+    Exponentially decayed popularity with a half life, kept as forward decay:
+    a query seen at time t adds 2 ** ((t - landmark) / half_life) to its
+    value, so values never have to be decayed as time passes and compare the
+    same way their decayed scores do. The score at time `now` is the value
+    times `decay(now)`. Moving the landmark forward with `rebase` keeps the
+    values from overflowing.
+    """
+
+    half_life_seconds: float
+    landmark: float = field(default_factory=time.time)
+
+    def weight(self, timestamp: float) -> float:
+        return 2.0 ** ((timestamp - self.landmark) / self.half_life_seconds)
+
+    def decay(self, now: float) -> float:
+        return 2.0 ** ((self.landmark - now) / self.half_life_seconds)
+
+    def rebase(self, landmark: float) -> float:
+        """Moves the landmark and returns the factor to scale values by."""
+        factor = self.decay(landmark)
+        self.landmark = landmark
+        return factor
+
+    def __post_init__(self):
+        if not math.isfinite(self.half_life_seconds) or self.half_life_seconds <= 0:
+            raise ValueError(f"Invalid half life: {self.half_life_seconds}")
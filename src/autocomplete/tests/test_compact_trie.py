@@ -0,0 +1,131 @@
+import pickle
+import random
+
+from autocomplete.compact_trie import CompactTrie
+from autocomplete.subgraph_cache_trie import SubgraphCacheTrie
+
+
+def _edges(node) -> dict:
+    return {child.edge: _edges(child) for child in (node.children or dict()).values()}
+
+
+def test_insert():
+    t = CompactTrie()
+    t.insert("all", 1)
+    t.insert("any", 2)
+    t.insert("an", 3)
+    assert _edges(t.root) == {"a": {"ll": {}, "n": {"y": {}}}}
+    assert len(t) == 3
+    assert t.get("an") == 3
+    assert t.get("a") is None
+    assert t.get("anyway") is None
+
+    assert t.suggest("") == ["an", "any", "all"]
+    assert t.suggest("a") == ["an", "any", "all"]
+    assert t.suggest("al") == ["all"]
+    assert t.suggest("an") == ["an", "any"]
+    assert t.suggest("some") == []
+
+    t.insert("all", 5)
+    assert t.suggest("a") == ["all", "an", "any"]
+    assert len(t) == 3
+
+
+def test_delete():
+    t = CompactTrie()
+    t.insert("all", 1)
+    t.insert("any", 2)
+    t.insert("an", 3)
+    t.delete("all")
+    assert "all" not in t
+    assert _edges(t.root) == {"an": {"y": {}}}
+    assert t.suggest("a") == ["an", "any"]
+
+    t.delete("an")
+    assert _edges(t.root) == {"any": {}}
+    assert t.suggest("an") == ["any"]
+    # deleting a missing key or a bare prefix is a no-op
+    t.delete("some")
+    t.delete("a")
+    assert t.suggest("") == ["any"]
+
+    # freed query ids are reused
+    t.insert("ant", 4)
+    assert len(t._queries) == 3
+    assert t.suggest("an") == ["ant", "any"]
+
+
+def test_matches_subgraph_cache_trie():
+    queries = {
+        "fire": 3,
+        "fireplace": 7,
+        "firewood": 2,
+        "floor": 5,
+        "flooring": 5,
+        "garage": 1,
+        "garage door": 4,
+    }
+    compact = CompactTrie.from_items(queries.items())
+    reference = SubgraphCacheTrie()
+    for key, count in queries.items():
+        reference.insert(key, count)
+    for prefix in ["", "f", "fi", "fire", "firep", "fl", "floor", "g", "garage "]:
+        assert compact.suggest(prefix) == reference.find(prefix).cache_sorted_keys
+
+
+def test_pickle():
+    t = CompactTrie.from_items([("all", 1), ("any", 2), ("an", 3)])
+    t.delete("any")
+    t.apply_delta(3, {0: dict(an=1)})
+    loaded = pickle.loads(pickle.dumps(t))
+    assert loaded.delta_seq == 3
+    assert dict(loaded.items()) == {"all": 1, "an": 4}
+    assert loaded.suggest("a") == ["an", "all"]
+    assert _edges(loaded.root) == _edges(t.root)
+
+
+def test_top_k():
+    t = CompactTrie(top_k=2)
+    t.insert("all", 1)
+    t.insert("any", 2)
+    t.insert("an", 3)
+    assert t.root.top == t.root.child("a").top
+    assert t.suggest("a") == ["an", "any"]
+    assert t.suggest("al") == ["all"]
+
+    # a query below the cut does not touch its ancestors
+    before = t.root.top
+    t.insert("alley", 1)
+    assert t.root.top is before
+    assert t.suggest("al") == ["all", "alley"]
+
+    # a rising query enters the lists, a falling one makes room
+    t.insert("alley", 10)
+    assert t.suggest("") == ["alley", "an"]
+    t.insert("alley", 0)
+    assert t.suggest("") == ["an", "any"]
+    assert t.suggest("al") == ["all", "alley"]
+    t.delete("an")
+    assert t.suggest("") == ["any", "all"]
+
+
+def test_top_k_matches_full_sort():
+    random.seed(7)
+    t = CompactTrie(top_k=3)
+    counts = dict()
+    words = ["".join(random.choices("abc", k=random.randint(1, 5))) for _ in range(60)]
+    for _ in range(2_000):
+        word = random.choice(words)
+        if random.random() < 0.2:
+            t.delete(word)
+            counts.pop(word, None)
+        else:
+            count = random.randint(0, 20)
+            t.insert(word, count)
+            counts[word] = count
+    for prefix in set(word[:i] for word in words for i in range(6)):
+        expected = sorted(
+            (key for key in counts if key.startswith(prefix)),
+            key=lambda key: (-counts[key], t._queries.index(key)),
+        )[:3]
+        assert t.suggest(prefix) == expected
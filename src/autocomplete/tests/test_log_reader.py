@@ -2,6 +2,7 @@ import os
 import random
 import string
 from contextlib import contextmanager
+from datetime import datetime
 
 from autocomplete.log_reader import AnalyticsLogReader
 
@@ -79,3 +80,108 @@ def test():
         reader.unique_count() == dict()
         assert reader._get_log_offset() == expected_log_offset
         assert reader.bytes_read == 0
+
+
+def test_without_offset_file():
+    with random_filenames() as (log_file_path, _):
+        with open(log_file_path, "wb") as file:
+            file.write(ANALYTICS_LOG_FIXTURE_SEG1)
+
+        reader = AnalyticsLogReader(log_file_path, None)
+        assert reader.unique_count() == dict(
+            fireplace=1,
+            floor=2,
+            garage=1,
+            kitchen=1,
+        )
+        assert reader._get_log_offset() == 0
+        assert reader.top_queries(2) == ["floor", "fireplace"]
+        assert reader.top_queries(10) == ["floor", "fireplace", "garage", "kitchen"]
+
+
+def test_small_chunks_and_partial_line():
+    with random_filenames() as (log_file_path, offset_file_path):
+        with open(log_file_path, "wb") as file:
+            file.write(ANALYTICS_LOG_FIXTURE_SEG1)
+            # a line that is still being written
+            file.write(b"2024-03-29 03:57:07,420 - analytics - INFO - do")
+
+        reader = AnalyticsLogReader(log_file_path, offset_file_path, chunk_size=7)
+        assert reader.unique_count() == dict(fireplace=1, floor=2, garage=1, kitchen=1)
+        assert reader._get_log_offset() == len(ANALYTICS_LOG_FIXTURE_SEG1)
+
+        with open(log_file_path, "ab") as file:
+            file.write(b"or\n")
+        assert reader.unique_count()["door"] == 1
+        assert reader.bytes_read == len(ANALYTICS_LOG_FIXTURE_SEG2.split(b"\n")[0]) + 1
+
+
+def test_rotation():
+    with random_filenames() as (log_file_path, offset_file_path):
+        with open(log_file_path, "wb") as file:
+            file.write(ANALYTICS_LOG_FIXTURE_SEG1)
+        reader = AnalyticsLogReader(log_file_path, offset_file_path)
+        reader.unique_count()
+
+        # more lines land in the log right before it is rotated
+        with open(log_file_path, "ab") as file:
+            file.write(ANALYTICS_LOG_FIXTURE_SEG2)
+        os.rename(log_file_path, f"{log_file_path}.1")
+        with open(log_file_path, "wb") as file:
+            file.write(ANALYTICS_LOG_FIXTURE_SEG1)
+        try:
+            reader = AnalyticsLogReader(log_file_path, offset_file_path)
+            assert reader.unique_count() == dict(
+                fireplace=1,
+                floor=2,
+                garage=2,
+                kitchen=1,
+                door=1,
+                sink=1,
+                lights=1,
+            )
+            assert reader.bytes_read == len(ANALYTICS_LOG_FIXTURE_SEG1) + len(
+                ANALYTICS_LOG_FIXTURE_SEG2
+            )
+            assert reader._get_log_offset() == len(ANALYTICS_LOG_FIXTURE_SEG1)
+        finally:
+            os.remove(f"{log_file_path}.1")
+
+
+def test_truncation():
+    with random_filenames() as (log_file_path, offset_file_path):
+        with open(log_file_path, "wb") as file:
+            file.write(ANALYTICS_LOG_FIXTURE_SEG1 + ANALYTICS_LOG_FIXTURE_SEG2)
+        AnalyticsLogReader(log_file_path, offset_file_path).unique_count()
+
+        with open(log_file_path, "wb") as file:
+            file.write(ANALYTICS_LOG_FIXTURE_SEG1)
+        reader = AnalyticsLogReader(log_file_path, offset_file_path)
+        assert reader.unique_count() == dict(fireplace=1, floor=2, garage=1, kitchen=1)
+
+
+def test_legacy_offset_file():
+    with random_filenames() as (log_file_path, offset_file_path):
+        with open(log_file_path, "wb") as file:
+            file.write(ANALYTICS_LOG_FIXTURE_SEG1 + ANALYTICS_LOG_FIXTURE_SEG2)
+        with open(offset_file_path, "w") as file:
+            file.write(str(len(ANALYTICS_LOG_FIXTURE_SEG1)))
+
+        reader = AnalyticsLogReader(log_file_path, offset_file_path)
+        assert reader.unique_count() == dict(door=1, sink=1, lights=1, garage=1)
+
+
+def test_bucket_counts():
+    with random_filenames() as (log_file_path, offset_file_path):
+        with open(log_file_path, "wb") as file:
+            file.write(ANALYTICS_LOG_FIXTURE_SEG1)
+            file.write(b"INFO:analytics:2024-03-29 04:01:00,000 - floor\n")
+
+        reader = AnalyticsLogReader(log_file_path, offset_file_path)
+        reader.unique_count()
+        three_am = datetime(2024, 3, 29, 3).timestamp()
+        assert reader.bucket_counts == {
+            three_am: dict(fireplace=1, floor=2, garage=1, kitchen=1),
+            three_am + 3600: dict(floor=1),
+        }
+        assert reader.counts["floor"] == 3
@@ -1,3 +1,4 @@
+from autocomplete.compact_trie import CompactTrie
 from autocomplete.trie import Trie
 from autocomplete.mermaid import Mermaid
 
@@ -24,3 +25,22 @@ def test_mermaid_graph():
 \tn3 --> n5
 """
     )
+
+
+def test_mermaid_compact_trie():
+    mmd = Mermaid()
+    t = CompactTrie.from_items([("all", 1), ("any", 2), ("an", 3)])
+    assert (
+        mmd.render_trie(t)
+        == """graph TD
+\tn0[ ]
+\tn1[a]
+\tn2[ll]
+\tn3[n]
+\tn4[y]
+\tn0 --> n1
+\tn1 --> n2
+\tn1 --> n3
+\tn3 --> n4
+"""
+    )
@@ -0,0 +1,44 @@
+import pytest
+
+from autocomplete.compact_trie import CompactTrie
+from autocomplete.popularity import BUCKET_SECONDS, DecayedPopularity, bucket_start
+
+DAY = 24 * 3600
+
+
+def test_decayed_popularity():
+    popularity = DecayedPopularity(half_life_seconds=DAY, landmark=0.0)
+    assert popularity.weight(0.0) == 1.0
+    assert popularity.weight(2 * DAY) == 4.0
+    assert popularity.decay(DAY) == 0.5
+    # a count's score halves every half life
+    assert popularity.weight(0.0) * popularity.decay(3 * DAY) == 0.125
+
+    assert popularity.rebase(2 * DAY) == 0.25
+    assert popularity.landmark == 2 * DAY
+    assert popularity.weight(2 * DAY) == 1.0
+
+    with pytest.raises(ValueError):
+        DecayedPopularity(half_life_seconds=0)
+
+
+def test_bucket_start():
+    assert bucket_start(0) == 0
+    assert bucket_start(BUCKET_SECONDS + 59.5) == BUCKET_SECONDS
+
+
+def test_trending_beats_stale():
+    t = CompactTrie(popularity=DecayedPopularity(half_life_seconds=DAY, landmark=0.0))
+    # six searches a week ago against one search today
+    t.apply_delta(1, {0: dict(floor=6)})
+    t.apply_delta(2, {7 * DAY: dict(flowers=1)})
+    assert t.suggest("f") == ["flowers", "floor"]
+    scores = dict(t.scores(7 * DAY))
+    assert scores["flowers"] == 1.0
+    assert scores["floor"] == 6 / 2**7
+
+    # rebasing keeps the ranking and evicts what decayed below the minimum
+    assert t.decay(7 * DAY, min_score=0.5) == 1
+    assert t.popularity.landmark == 7 * DAY
+    assert dict(t.items()) == dict(flowers=1.0)
+    assert t.suggest("f") == ["flowers"]
@@ -0,0 +1,49 @@
+import tempfile
+
+import pytest
+
+from autocomplete.compact_trie import CompactTrie
+from autocomplete.trie_delta import TrieDeltaStore
+
+
+def test_append_since_prune():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        deltas = TrieDeltaStore(temp_dir)
+        assert deltas.latest_seq() == 0
+        assert list(deltas.since(0)) == []
+        assert deltas.append(dict(floor=2, garage=1)) == 1
+        assert deltas.append(dict(garage=1, door=1)) == 2
+        assert deltas.append(dict(sink=1)) == 3
+        assert list(deltas.since(1)) == [
+            (2, dict(garage=1, door=1)),
+            (3, dict(sink=1)),
+        ]
+
+        deltas.prune(3)
+        assert deltas.oldest_seq() == 3
+        assert deltas.append(dict(lights=1)) == 4
+        assert [seq for seq, _ in deltas.since(0)] == [3, 4]
+
+
+def test_missing_dir():
+    with pytest.raises(FileNotFoundError):
+        TrieDeltaStore("/tmp/does/not/exist")
+
+
+def test_apply_delta():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        deltas = TrieDeltaStore(temp_dir)
+        deltas.append({3600: dict(floor=2, garage=1)})
+        deltas.append({3600: dict(garage=1), 7200: dict(garage=1, door=1)})
+
+        t = CompactTrie()
+        t.insert("fireplace", 1)
+        for seq, increments in deltas.since(t.delta_seq):
+            t.apply_delta(seq, increments)
+        assert dict(t.items()) == dict(fireplace=1, floor=2, garage=3, door=1)
+        assert t.delta_seq == 2
+
+        # deltas that were already applied are skipped
+        t.apply_delta(2, {7200: dict(garage=2, door=1)})
+        assert t.get("garage") == 3
+        assert t.suggest("") == ["garage", "floor", "fireplace", "door"]
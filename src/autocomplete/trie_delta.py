@@ -0,0 +1,59 @@
+import glob
+import json
+import os
+from typing import Dict, Iterator, Tuple
+
+
+class TrieDeltaStore:
+    """TrieDeltaStore
+
+    Sequence of small delta files, each holding the query counts read from
+    the query log in one run of `log_reader_cron`, grouped by time bucket. A
+    trie records the sequence number of the last delta applied to it, so a
+    server can catch up by applying only the deltas written after its trie.
+    """
+
+    prefix = "trie_delta"
+
+    def __init__(self, dir: str):
+        if not os.path.isdir(dir):
+            raise FileNotFoundError(f"Directory does not exist: {dir}")
+        self.dir = dir
+
+    def _path(self, seq: int) -> str:
+        return f"{self.dir}/{self.prefix}_{seq:012d}.json"
+
+    def _seqs(self) -> list[int]:
+        return sorted(
+            int(os.path.basename(path)[len(self.prefix) + 1 : -len(".json")])
+            for path in glob.glob(f"{self.dir}/{self.prefix}_*.json")
+        )
+
+    def oldest_seq(self) -> int:
+        seqs = self._seqs()
+        return seqs[0] if seqs else 0
+
+    def latest_seq(self) -> int:
+        seqs = self._seqs()
+        return seqs[-1] if seqs else 0
+
+    def append(self, bucket_counts: Dict[int, Dict[str, int]]) -> int:
+        seq = self.latest_seq() + 1
+        tmp_path = f"{self._path(seq)}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(bucket_counts, file, separators=(",", ":"))
+        os.rename(tmp_path, self._path(seq))
+        return seq
+
+    def since(self, seq: int) -> Iterator[Tuple[int, Dict[str, Dict[str, int]]]]:
+        for delta_seq in self._seqs():
+            if delta_seq > seq:
+                with open(self._path(delta_seq), "r") as file:
+                    yield delta_seq, json.load(file)
+
+    def prune(self, seq: int):
+        """Deletes the deltas before `seq`. Delta `seq` itself is kept so that
+        sequence numbers keep increasing."""
+        for delta_seq in self._seqs():
+            if delta_seq < seq:
+                os.remove(self._path(delta_seq))
@@ -0,0 +1,102 @@
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Optional
+
+from pickle_store import Artifact
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LoadStatus:
+    # idle -> loading -> validating -> warming -> idle, or failed
+    state: str = field(default="idle")
+    active_generation: str | None = field(default=None)
+    pending_generation: str | None = field(default=None)
+    started_at: float | None = field(default=None)
+    finished_at: float | None = field(default=None)
+    error: str | None = field(default=None)
+
+
+class BackgroundLoader:
+    """BackgroundLoader
+
+    Loads a new artifact on a background thread, validates it, warms it up and
+    only then hands it to `swap`, which is expected to rebind a single global
+    so requests see either the old or the new artifact, never a partial one.
+    Requests keep being served by the active artifact the whole time.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        load: Callable[[], Optional[Artifact]],
+        swap: Callable[[Artifact], None],
+        validate: Callable[[Artifact], None] | None = None,
+        warm: Callable[[Artifact], None] | None = None,
+        active_generation: str | None = None,
+    ):
+        self.name = name
+        self._load = load
+        self._swap = swap
+        self._validate = validate
+        self._warm = warm
+        self._status = LoadStatus(active_generation=active_generation)
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> bool:
+        """Starts a load unless one is already running; returns whether it did."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._status.state = "loading"
+            self._status.pending_generation = None
+            self._status.started_at = time.time()
+            self._status.finished_at = None
+            self._status.error = None
+            self._thread = threading.Thread(
+                target=self._run, name=f"{self.name}-loader", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def wait(self, timeout: float | None = None) -> None:
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def status(self) -> dict:
+        with self._lock:
+            return asdict(self._status)
+
+    def _set_state(self, state: str, **changes) -> None:
+        with self._lock:
+            self._status.state = state
+            for key, value in changes.items():
+                setattr(self._status, key, value)
+
+    def _run(self) -> None:
+        try:
+            artifact = self._load()
+            if artifact is None:
+                raise FileNotFoundError(f"No {self.name} found to load")
+            self._set_state("validating", pending_generation=artifact.generation)
+            if self._validate is not None:
+                self._validate(artifact)
+            self._set_state("warming")
+            if self._warm is not None:
+                self._warm(artifact)
+            self._swap(artifact)
+            self._set_state(
+                "idle",
+                active_generation=artifact.generation,
+                pending_generation=None,
+                finished_at=time.time(),
+            )
+            logger.info(f"Swapped in {self.name}: {artifact.file_path}")
+        except Exception as e:
+            logger.exception(f"Failed to load {self.name}")
+            self._set_state("failed", error=repr(e), finished_at=time.time())
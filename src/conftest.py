@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+
+class DummyModel:
+    KEYWORDS0 = {"lorem", "ipsum"}
+    KEYWORDS1 = {"type", "hint", "iterators", "iterator"}
+
+    def encode(self, text: str | list[str], batch_size: int = 32) -> np.ndarray:
+        if isinstance(text, list):
+            return np.stack([self._encode_one(t) for t in text])
+        return self._encode_one(text)
+
+    def _encode_one(self, text: str) -> np.ndarray:
+        tokens = text.lower().split()
+        vec = np.array(
+            [
+                sum(t in self.KEYWORDS0 for t in tokens),
+                sum(t in self.KEYWORDS1 for t in tokens),
+            ],
+            dtype=np.float32,
+        )
+        if not vec.any():
+            vec = np.array([len(tokens), 0.0], dtype=np.float32)
+        return vec
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return 2
+
+
+@pytest.fixture
+def model() -> DummyModel:
+    return DummyModel()
@@ -2,7 +2,86 @@
 QUERY_LOG_OFFSET_PATH = "logs/query_log_offset.txt"
 QUERY_LOG_PATH = "logs/query.log"
 REDIS_URL = "redis://redis"
+# Redis stream the queries are also published to, None to only write the log
+ANALYTICS_REDIS_STREAM = None
 TRIE_STORAGE_PATH = "pickles/autocomplete_tries"
+TRIE_DELTA_PATH = "pickles/autocomplete_trie_deltas"
+# query count deltas applied in place before they are folded into a new trie
+TRIE_DELTAS_PER_SNAPSHOT = 20
+# suggestions are ranked by exponentially decayed popularity; queries whose
+# decayed count drops below the minimum are evicted when deltas are folded
+POPULARITY_HALF_LIFE_SECONDS = 7 * 24 * 3600.0
+POPULARITY_MIN_SCORE = 0.5
+# suggestions kept per trie node and returned per keystroke
+AUTOCOMPLETE_TOP_K = 10
 
 # search index
 INVERTED_INDEX_STORAGE_PATH = "pickles/inverted_indexes"
+# crawler worker processes for tokenizing and embedding pages; None uses every
+# core and 0 indexes inside the crawler process
+INDEXING_PROCESSES = None
+# HNSW graph parameters, M and ef_construction only apply to newly built
+# indexes; ef_search is the candidate list size per query, raise it for
+# recall and lower it for latency (see search/benchmark.py)
+HNSW_MAX_ELEMENTS = 100_000
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# "hnsw", "flat" for a scan over a matrix stored as FLAT_VECTOR_DTYPE, or
+# "auto" for flat search up to FLAT_MAX_DOCS documents and hnsw above
+VECTOR_BACKEND = "auto"
+FLAT_VECTOR_DTYPE = "float32"
+FLAT_MAX_DOCS = 200_000
+# "float16", "int8" and "pq" (product quantization, one byte per slice of
+# PQ_SUBVECTORS dimensions) shrink the scanned flat matrix; the best
+# k * FLAT_RERANK_FACTOR hits are re-scored against full precision vectors
+# that stay on disk
+FLAT_RERANK_FACTOR = 10
+PQ_SUBVECTORS = 48
+SEARCH_MODE = "hybrid"
+SEARCH_FUSION = "rrf"
+SEARCH_PARALLEL_RETRIEVAL = True
+# queries accepted by one /search/batch request
+SEARCH_BATCH_MAX_QUERIES = 256
+QUERY_CACHE_SIZE = 10_000
+QUERY_CACHE_TTL_SECONDS = 3600.0
+QUERY_CACHE_WARM_SIZE = 1_000
+# the index is a list of segments, every crawler checkpoint adds one with the
+# pages crawled since; INDEX_MERGE_FACTOR segments of about the same size are
+# merged into one in the background, segments of up to INDEX_MERGE_MIN_DOCS
+# documents count as the same size
+INDEX_MERGE_FACTOR = 10
+INDEX_MERGE_MIN_DOCS = 1_000
+# head queries run against a freshly loaded index before it is swapped in
+INDEX_WARMUP_QUERIES = 20
+# "memory", "redis" (shared by all server replicas) or None to disable
+RESULT_CACHE_BACKEND = "memory"
+RESULT_CACHE_SIZE = 10_000
+RESULT_CACHE_TTL_SECONDS = 300.0
+
+# crawler
+# open HTTP connections, in total and to any one host; pages whose static HTML
+# is a script shell are rendered by at most CRAWLER_BROWSERS headless browsers
+CRAWLER_MAX_CONNECTIONS = 100
+CRAWLER_MAX_CONNECTIONS_PER_HOST = 4
+CRAWLER_FETCH_TIMEOUT_SECONDS = 15.0
+CRAWLER_BROWSERS = 2
+CRAWLER_WORKERS = 128
+# politeness: fetches per second to any one host, and how many may follow
+# each other without waiting
+CRAWLER_HOST_RATE = 1.0
+CRAWLER_HOST_BURST = 2
+# URLs already crawled, kept across crawls: "fingerprints" is exact at 16 to
+# 32 bytes per URL, "bloom" takes about 2.5 bytes at a 1e-4 chance of skipping
+# a new URL
+CRAWLER_SEEN_SET_BACKEND = "fingerprints"
+CRAWLER_SEEN_SET_CAPACITY = 1 << 20
+CRAWLER_SEEN_SET_PATH = "pickles/crawler_seen_urls.npz"
+# every CRAWLER_CHECKPOINT_SECONDS the pages indexed since the last one are
+# saved as a segment, the server is told to load it and the frontier is
+# committed to CRAWLER_CHECKPOINT_PATH, a crawl that is killed resumes from
+# there; only the newest CRAWLER_GENERATIONS_KEPT lists of segments are kept
+CRAWLER_CHECKPOINT_PATH = "pickles/crawler_frontier.sqlite"
+CRAWLER_CHECKPOINT_SECONDS = 300.0
+CRAWLER_GENERATIONS_KEPT = 10
+CRAWLER_MAX_DEPTH = 3
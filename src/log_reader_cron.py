@@ -1,25 +1,70 @@
 import sys
 import logging
-from typing import Dict
+import time
 
+from autocomplete.compact_trie import CompactTrie
 from autocomplete.subgraph_cache_trie import SubgraphCacheTrie
 from pickle_store import PickleStore
 from autocomplete.log_reader import AnalyticsLogReader
+from autocomplete.popularity import DecayedPopularity
+from autocomplete.trie_delta import TrieDeltaStore
 from util import notify_server
-from env import QUERY_LOG_PATH, TRIE_STORAGE_PATH, QUERY_LOG_OFFSET_PATH
+from env import (
+    AUTOCOMPLETE_TOP_K,
+    POPULARITY_HALF_LIFE_SECONDS,
+    POPULARITY_MIN_SCORE,
+    QUERY_LOG_OFFSET_PATH,
+    QUERY_LOG_PATH,
+    TRIE_DELTA_PATH,
+    TRIE_DELTAS_PER_SNAPSHOT,
+    TRIE_STORAGE_PATH,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("log_reader")
 
 
-def _update_trie(trie: SubgraphCacheTrie, query_counts: Dict[str, int]):
-    for key, count in query_counts.items():
-        trie.insert(key, count)
+def _update_trie(trie: CompactTrie, delta_store: TrieDeltaStore):
+    for seq, bucket_counts in delta_store.since(trie.delta_seq):
+        trie.apply_delta(seq, bucket_counts)
+
+
+def _load_trie(trie_storage: PickleStore, now: float) -> CompactTrie:
+    pkld_trie = trie_storage.get_latest(CompactTrie)
+    if pkld_trie is not None:
+        trie = pkld_trie.artifact
+        if (
+            trie.top_k == AUTOCOMPLETE_TOP_K
+            and trie.popularity is not None
+            and trie.popularity.half_life_seconds == POPULARITY_HALF_LIFE_SECONDS
+        ):
+            return trie
+        # carry the scores as of now over to a trie with the current settings
+        rebuilt_trie = CompactTrie.from_items(
+            trie.scores(now),
+            top_k=AUTOCOMPLETE_TOP_K,
+            popularity=DecayedPopularity(POPULARITY_HALF_LIFE_SECONDS, now),
+        )
+        rebuilt_trie.delta_seq = trie.delta_seq
+        return rebuilt_trie
+    # carry the counts over from a trie written before the compact format
+    pkld_trie = trie_storage.get_latest(SubgraphCacheTrie)
+    if pkld_trie is not None and pkld_trie.artifact is not None:
+        return CompactTrie.from_items(
+            pkld_trie.artifact.root.cache.items(),
+            top_k=AUTOCOMPLETE_TOP_K,
+            popularity=DecayedPopularity(POPULARITY_HALF_LIFE_SECONDS, now),
+        )
+    return CompactTrie(
+        top_k=AUTOCOMPLETE_TOP_K,
+        popularity=DecayedPopularity(POPULARITY_HALF_LIFE_SECONDS, now),
+    )
 
 
 if __name__ == "__main__":
     log_reader = AnalyticsLogReader(QUERY_LOG_PATH, QUERY_LOG_OFFSET_PATH)
     trie_storage = PickleStore(TRIE_STORAGE_PATH)
+    delta_store = TrieDeltaStore(TRIE_DELTA_PATH)
 
     # munge the log and generate counts for queries
     query_counts = log_reader.unique_count()
@@ -30,17 +75,28 @@ if __name__ == "__main__":
         logger.info("No new log entries found in the log. Skipping trie update.")
         sys.exit(0)
 
-    # build a trie with subgraph caching for fast access
-    pkld_trie = trie_storage.get_latest(SubgraphCacheTrie)
-    trie = (
-        pkld_trie.artifact if pkld_trie and pkld_trie.artifact else SubgraphCacheTrie()
-    )
-    _update_trie(trie, query_counts)
-    logger.info("SubgraphCacheTrie loaded.")
+    # the server applies the new counts to its trie in place
+    seq = delta_store.append(log_reader.bucket_counts)
+    logger.info(f"Trie delta {seq} written.")
+    if (
+        trie_storage.latest_path(CompactTrie) is not None
+        and seq - delta_store.oldest_seq() < TRIE_DELTAS_PER_SNAPSHOT
+    ):
+        status_code = notify_server("trie/deltas")
+        logger.info(f"Server response for applying trie delta {seq}: {status_code}")
+        sys.exit(0)
+
+    # every so often, fold the deltas into the latest compact trie
+    now = time.time()
+    trie = _load_trie(trie_storage, now)
+    _update_trie(trie, delta_store)
+    evicted = trie.decay(now, POPULARITY_MIN_SCORE)
+    logger.info(f"CompactTrie loaded with {len(trie)} queries, {evicted} evicted.")
 
     # save the trie to a file
     pkl_file_name = trie_storage.save(trie)
-    logger.info(f"SubgraphCacheTrie saved to {pkl_file_name}")
+    logger.info(f"CompactTrie saved to {pkl_file_name}")
+    delta_store.prune(trie.delta_seq)
 
     # tell the server to pick up the new trie
     status_code = notify_server("trie/load")
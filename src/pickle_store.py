@@ -5,14 +5,20 @@ from dataclasses import dataclass
 from typing import Optional, Type
 from datetime import datetime
 
+from autocomplete.compact_trie import CompactTrie
 from autocomplete.subgraph_cache_trie import SubgraphCacheTrie
 from search.inverted_index import InvertedIndex
+from search.segmented_index import SegmentedIndex
 
 
 @dataclass
 class Artifact:
     file_path: str
-    artifact: SubgraphCacheTrie | InvertedIndex
+    artifact: CompactTrie | SubgraphCacheTrie | InvertedIndex | SegmentedIndex
+
+    @property
+    def generation(self) -> str:
+        return os.path.splitext(os.path.basename(self.file_path))[0]
 
 
 class PickleStore:
@@ -22,7 +28,7 @@ class PickleStore:
             raise FileNotFoundError(f"Directory does not exist: {dir}")
         self.dir = dir
 
-    def save(self, obj: SubgraphCacheTrie | InvertedIndex) -> str:
+    def save(self, obj: CompactTrie | SubgraphCacheTrie | InvertedIndex) -> str:
         now = datetime.now()
         formatted_date = now.strftime("%Y%m%d%H%M%S")
         file_prefix = self._file_prefix(type(obj))
@@ -31,12 +37,19 @@ class PickleStore:
             pickle.dump(obj, file)
         return pkl_file_name
 
-    def get_latest(self, typ: SubgraphCacheTrie | InvertedIndex) -> Optional[Artifact]:
+    def latest_path(
+        self, typ: CompactTrie | SubgraphCacheTrie | InvertedIndex
+    ) -> Optional[str]:
         file_prefix = self._file_prefix(typ)
         matching_files = glob.glob(f"{self.dir}/{file_prefix}_*.pkl")
-        if not matching_files:
+        return sorted(matching_files)[-1] if matching_files else None
+
+    def get_latest(
+        self, typ: CompactTrie | SubgraphCacheTrie | InvertedIndex
+    ) -> Optional[Artifact]:
+        latest_file_path = self.latest_path(typ)
+        if latest_file_path is None:
             return None
-        latest_file_path = sorted(matching_files)[-1]
 
         # Torch pickles may contain tensors saved on non-CPU devices
         # (e.g. Apple's "mps"). When loading on a machine without that
@@ -79,7 +92,9 @@ class PickleStore:
         return Artifact(latest_file_path, trie)
 
     def _file_prefix(self, typ: Type) -> str:
-        if typ == SubgraphCacheTrie:
+        if typ == CompactTrie:
+            return "compact_trie"
+        elif typ == SubgraphCacheTrie:
             return "trie"
         elif typ == InvertedIndex:
             return "inverted_index"
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from typing import Callable
+
+from web_crawler.node import Node
+from search.inverted_index import InvertedIndex
+from search.pipeline import ParallelAnalyzer
+
+logger = logging.getLogger(__name__)
+
+
+class BatchIndexer:
+    """BatchIndexer
+
+    Ingestion stage between the crawler workers and the `InvertedIndex`.
+    Workers hand over crawled nodes with `put`; a single consumer task groups
+    them into batches of up to `batch_size` nodes (or whatever arrived within
+    `flush_interval` seconds) and runs `InvertedIndex.insert_many` in an
+    executor, so embedding never blocks the event loop and the index is only
+    ever mutated from one place.
+
+    With an `analyzer` the tokenization and embedding of up to one batch per
+    worker process run concurrently, and only the merge of the results into
+    the index happens in this process, one batch at a time.
+
+    `save` runs between merges, so a saved index contains exactly the
+    documents whose ids it returns. It also returns the ids of the documents
+    of batches that failed to index, which are not retried. Given `fresh`,
+    the saved index is then replaced by a new one, e.g. to write each batch
+    of documents as a segment of its own.
+    """
+
+    def __init__(
+        self,
+        inverted_index: InvertedIndex,
+        batch_size: int = 64,
+        flush_interval: float = 5.0,
+        encode_batch_size: int = 32,
+        analyzer: ParallelAnalyzer | None = None,
+    ):
+        self.index = inverted_index
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.encode_batch_size = encode_batch_size
+        self.analyzer = analyzer
+        self.docs_indexed = 0
+        # bounded so that a slow model applies back pressure to the crawlers
+        self._queue: asyncio.Queue[Node | None] = asyncio.Queue(maxsize=batch_size * 4)
+        self._in_flight = asyncio.Semaphore(
+            1 if analyzer is None else analyzer.processes
+        )
+        self._merge_lock = asyncio.Lock()
+        self._indexed_ids: list[str] = []
+        self._failed_ids: list[str] = []
+        self._flushes: set[asyncio.Task] = set()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def put(self, node: Node) -> None:
+        await self._queue.put(node)
+
+    async def save(
+        self,
+        save: Callable[[InvertedIndex], object],
+        fresh: Callable[[], InvertedIndex] | None = None,
+    ) -> tuple[list[str], list[str]]:
+        """Runs `save` on the index in an executor while no batch is merged
+        into it, then continues with the index `fresh` returns, if any.
+        Returns the ids of the documents merged since the previous call and
+        of those that failed to index."""
+        loop = asyncio.get_running_loop()
+        async with self._merge_lock:
+            await loop.run_in_executor(None, save, self.index)
+            if fresh is not None:
+                self.index = fresh()
+            indexed_ids, self._indexed_ids = self._indexed_ids, []
+            failed_ids, self._failed_ids = self._failed_ids, []
+        return indexed_ids, failed_ids
+
+    async def close(self) -> None:
+        """Flushes everything that was put so far and stops the consumer."""
+        await self._queue.put(None)
+        await self._task
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        closed = False
+        while not closed:
+            batch = []
+            node = await self._queue.get()
+            deadline = loop.time() + self.flush_interval
+            while node is not None:
+                batch.append(node)
+                if len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    node = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            closed = node is None
+            if batch:
+                await self._in_flight.acquire()
+                flush = asyncio.create_task(self._flush(loop, batch))
+                self._flushes.add(flush)
+                flush.add_done_callback(self._flushes.discard)
+        await asyncio.gather(*self._flushes)
+
+    async def _flush(self, loop: asyncio.AbstractEventLoop, batch: list[Node]):
+        try:
+            if self.analyzer is None:
+                async with self._merge_lock:
+                    await loop.run_in_executor(
+                        None, self.index.insert_many, batch, self.encode_batch_size
+                    )
+                    self._indexed_ids += [node.id for node in batch]
+            else:
+                word_counts, embeddings = await asyncio.wrap_future(
+                    self.analyzer.submit([node.text for node in batch])
+                )
+                async with self._merge_lock:
+                    await loop.run_in_executor(
+                        None, self.index.add_analyzed, batch, word_counts, embeddings
+                    )
+                    self._indexed_ids += [node.id for node in batch]
+            self.docs_indexed += len(batch)
+        except Exception as e:
+            logger.error(f"Failed to index batch of {len(batch)} documents: {e}")
+            self._failed_ids += [node.id for node in batch]
+        finally:
+            self._in_flight.release()
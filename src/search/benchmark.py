@@ -0,0 +1,213 @@
+import argparse
+import itertools
+import time
+from dataclasses import asdict, dataclass
+
+import hnswlib
+import numpy as np
+
+from search.snapshot import read_meta
+from search.vector_index import FlatVectorIndex, IndexConfig, load_vector_index
+
+
+@dataclass
+class BenchmarkResult:
+    """BenchmarkResult
+
+    Recall@k of one HNSW configuration against exact cosine search, its
+    single-threaded query throughput and the time it took to build.
+    """
+
+    M: int
+    ef_construction: int
+    ef_search: int
+    recall: float
+    qps: float
+    build_seconds: float
+
+
+@dataclass
+class FlatBenchmarkResult:
+    """FlatBenchmarkResult
+
+    Recall@k and query throughput of a flat scan over vectors compressed as
+    `dtype`, with the best `k * rerank_factor` re-ranked at full precision,
+    and the bytes it scans per vector.
+    """
+
+    dtype: str
+    rerank_factor: int
+    recall: float
+    qps: float
+    bytes_per_vector: float
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+def brute_force_knn(data: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """The labels of the exact `k` nearest neighbours by cosine similarity,
+    nearest first, one row per query."""
+    k = min(k, len(data))
+    similarities = _normalize(queries) @ _normalize(data).T
+    top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(similarities, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def recall_at_k(labels: np.ndarray, ground_truth: np.ndarray) -> float:
+    hits = sum(len(set(row) & set(truth)) for row, truth in zip(labels, ground_truth))
+    return hits / ground_truth.size
+
+
+def build_index(data: np.ndarray, M: int, ef_construction: int) -> hnswlib.Index:
+    index = hnswlib.Index(space="cosine", dim=data.shape[1])
+    index.init_index(max_elements=len(data), ef_construction=ef_construction, M=M)
+    index.add_items(data, np.arange(len(data)))
+    return index
+
+
+def run(
+    data: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10,
+    Ms: tuple[int, ...] = (16,),
+    ef_constructions: tuple[int, ...] = (200,),
+    ef_searches: tuple[int, ...] = (16, 32, 64, 128, 256),
+) -> list[BenchmarkResult]:
+    """Builds an index for every `M` and `ef_construction` and measures
+    every `ef_search` on it. Queries run one at a time, the way `/search`
+    runs them."""
+    ground_truth = brute_force_knn(data, queries, k)
+    k = ground_truth.shape[1]
+    results = []
+    for M, ef_construction in itertools.product(Ms, ef_constructions):
+        start = time.perf_counter()
+        index = build_index(data, M, ef_construction)
+        build_seconds = time.perf_counter() - start
+        for ef_search in ef_searches:
+            index.set_ef(max(k, ef_search))
+            start = time.perf_counter()
+            labels = np.stack(
+                [index.knn_query(query, k, num_threads=1)[0][0] for query in queries]
+            )
+            seconds = time.perf_counter() - start
+            results.append(
+                BenchmarkResult(
+                    M=M,
+                    ef_construction=ef_construction,
+                    ef_search=ef_search,
+                    recall=recall_at_k(labels, ground_truth),
+                    qps=len(queries) / seconds,
+                    build_seconds=build_seconds,
+                )
+            )
+    return results
+
+
+def run_flat(
+    data: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10,
+    dtypes: tuple[str, ...] = ("float32", "float16", "int8", "pq"),
+    rerank_factors: tuple[int, ...] = (0, 4),
+    pq_subvectors: int = 48,
+) -> list[FlatBenchmarkResult]:
+    ground_truth = brute_force_knn(data, queries, k)
+    k = ground_truth.shape[1]
+    results = []
+    for dtype, rerank_factor in itertools.product(dtypes, rerank_factors):
+        if dtype == "float32" and rerank_factor > 0:
+            continue
+        config = IndexConfig(
+            flat_dtype=dtype,
+            rerank_factor=rerank_factor,
+            pq_subvectors=pq_subvectors,
+            # train the product quantizer even on small data sets
+            pq_train_size=min(len(data), IndexConfig.pq_train_size),
+        )
+        index = FlatVectorIndex(data.shape[1], config)
+        index.add(data, np.arange(len(data)))
+        start = time.perf_counter()
+        hits = [index.search(query[np.newaxis], k, None, 1)[0] for query in queries]
+        seconds = time.perf_counter() - start
+        labels = np.array([[label for label, _ in row] for row in hits])
+        results.append(
+            FlatBenchmarkResult(
+                dtype=dtype,
+                rerank_factor=rerank_factor,
+                recall=recall_at_k(labels, ground_truth),
+                qps=len(queries) / seconds,
+                bytes_per_vector=index.code_bytes / len(index),
+            )
+        )
+    return results
+
+
+def snapshot_vectors(dir: str) -> np.ndarray:
+    """The document embeddings of an `InvertedIndex` snapshot."""
+    meta = read_meta(dir)
+    vectors = load_vector_index(
+        meta.get("vector_backend", "hnsw"),
+        dir,
+        meta["dim"],
+        IndexConfig(**meta.get("index_config", dict())),
+    )
+    return vectors.items()[0]
+
+
+def _format(value) -> str:
+    return f"{value:.4g}" if isinstance(value, float) else str(value)
+
+
+def _ints(value: str) -> list[int]:
+    return [int(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recall@k and QPS of vector search settings against exact search"
+    )
+    parser.add_argument("--snapshot", help="index snapshot dir, random data if unset")
+    parser.add_argument("--docs", type=int, default=10_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--M", type=_ints, default=[8, 16, 32])
+    parser.add_argument("--ef-construction", type=_ints, default=[100, 200])
+    parser.add_argument("--ef-search", type=_ints, default=[16, 32, 64, 128, 256])
+    parser.add_argument("--flat-dtypes", default="float32,float16,int8,pq")
+    parser.add_argument("--rerank-factors", type=_ints, default=[0, 4])
+    parser.add_argument("--pq-subvectors", type=int, default=48)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.snapshot is not None:
+        data = snapshot_vectors(args.snapshot)
+        # perturbed documents stand in for queries near the indexed content
+        queries = data[rng.choice(len(data), args.queries)]
+        queries = queries + rng.normal(0, 0.1 * queries.std(), queries.shape)
+    else:
+        # clustered like real embeddings, uniformly random vectors have no
+        # neighbourhoods for any index to find
+        centers = rng.normal(size=(max(1, args.docs // 100), args.dim))
+        data = centers[rng.integers(len(centers), size=args.docs)]
+        data = (data + 0.5 * rng.normal(size=data.shape)).astype(np.float32)
+        queries = centers[rng.integers(len(centers), size=args.queries)]
+        queries = queries + 0.5 * rng.normal(size=queries.shape)
+    queries = queries.astype(np.float32)
+    results = run(data, queries, args.k, args.M, args.ef_construction, args.ef_search)
+    results += run_flat(
+        data,
+        queries,
+        args.k,
+        args.flat_dtypes.split(","),
+        args.rerank_factors,
+        args.pq_subvectors,
+    )
+    for result in results:
+        print(
+            " ".join(f"{key}={_format(value)}" for key, value in asdict(result).items())
+        )
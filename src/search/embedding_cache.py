@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """EmbeddingCache
+
+    Bounded, thread-safe LRU cache of query -> float32 embedding. Entries
+    expire `ttl_seconds` after they were computed. Queries are normalized by
+    collapsing whitespace so trivially different spellings of a head query
+    share one entry, and the normalized form is what gets encoded.
+
+    The model runs outside of the lock, so two threads missing on the same
+    query at once may both compute it; the last write wins.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10_000,
+        ttl_seconds: float | None = 3600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[float, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # the lock cannot be pickled and cached embeddings are cheap to recompute,
+    # so only the configuration travels with a pickled index
+    def __getstate__(self) -> dict:
+        return dict(max_size=self.max_size, ttl_seconds=self.ttl_seconds)
+
+    def __setstate__(self, state: dict):
+        self.__init__(**state)
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.split())
+
+    def get(self, query: str) -> np.ndarray | None:
+        key = self.normalize(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, query: str, embedding: np.ndarray) -> None:
+        key = self.normalize(query)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        # cached arrays are shared between requests, guard against mutation
+        embedding.setflags(write=False)
+        with self._lock:
+            self._entries[key] = (self._clock(), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(
+        self, query: str, compute: Callable[[str], np.ndarray]
+    ) -> np.ndarray:
+        embedding = self.get(query)
+        if embedding is None:
+            embedding = np.asarray(compute(self.normalize(query)), dtype=np.float32)
+            self.put(query, embedding)
+        return embedding
+
+    def get_or_compute_many(
+        self,
+        queries: list[str],
+        compute_many: Callable[[list[str]], np.ndarray],
+    ) -> np.ndarray:
+        """Looks up every query and computes all misses in one batch. Returns
+        one row per query."""
+        embeddings = [self.get(query) for query in queries]
+        missing = list(
+            dict.fromkeys(
+                self.normalize(query)
+                for query, embedding in zip(queries, embeddings)
+                if embedding is None
+            )
+        )
+        if missing:
+            computed = dict(
+                zip(missing, np.asarray(compute_many(missing), dtype=np.float32))
+            )
+            for query, embedding in computed.items():
+                self.put(query, embedding)
+            embeddings = [
+                computed[self.normalize(query)] if embedding is None else embedding
+                for query, embedding in zip(queries, embeddings)
+            ]
+        return np.stack(embeddings)
+
+    def warm(
+        self,
+        queries: Iterable[str],
+        compute_many: Callable[[list[str]], np.ndarray],
+    ) -> int:
+        """Computes and caches every query that is not cached yet in one batch.
+        Returns the number of queries that were computed."""
+        with self._lock:
+            missing = list(
+                dict.fromkeys(
+                    key
+                    for key in map(self.normalize, queries)
+                    if key not in self._entries
+                )
+            )
+        if not missing:
+            return 0
+        # most popular queries come first; keep them if the batch overflows and
+        # insert them last so they are the most recently used entries
+        missing = missing[: self.max_size]
+        embeddings = compute_many(missing)
+        for query, embedding in reversed(list(zip(missing, embeddings))):
+            self.put(query, embedding)
+        return len(missing)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                size=len(self._entries),
+                max_size=self.max_size,
+                hits=self.hits,
+                misses=self.misses,
+            )
+
+    def _expired(self, entry: tuple[float, np.ndarray]) -> bool:
+        if self.ttl_seconds is None:
+            return False
+        return self._clock() - entry[0] > self.ttl_seconds
@@ -0,0 +1,48 @@
+from collections import defaultdict
+
+FUSION_METHODS = ("rrf", "weighted")
+
+Ranking = list[tuple[int, float]]
+
+
+def reciprocal_rank_fusion(
+    rankings: list[Ranking], weights: list[float], k: int = 60
+) -> Ranking:
+    """reciprocal_rank_fusion
+
+    Combines rankings using only the rank of each document in each list, so
+    scores on different scales (BM25 vs cosine similarity) can be merged
+    without calibration. `k` dampens the influence of the very top ranks.
+    """
+    scores = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, (label, _) in enumerate(ranking):
+            scores[label] += weight / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def weighted_score_fusion(rankings: list[Ranking], weights: list[float]) -> Ranking:
+    """weighted_score_fusion
+
+    Min-max normalizes the scores of each ranking to [0, 1] and sums them
+    with the given weights. Documents missing from a ranking contribute 0.
+    """
+    scores = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        if not ranking:
+            continue
+        values = [score for _, score in ranking]
+        low, high = min(values), max(values)
+        spread = high - low
+        for label, score in ranking:
+            normalized = (score - low) / spread if spread > 0 else 1.0
+            scores[label] += weight * normalized
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def fuse(rankings: list[Ranking], weights: list[float], method: str = "rrf") -> Ranking:
+    if method == "rrf":
+        return reciprocal_rank_fusion(rankings, weights)
+    elif method == "weighted":
+        return weighted_score_fusion(rankings, weights)
+    raise ValueError(f"Unknown fusion method: {method}")
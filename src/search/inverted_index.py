@@ -1,12 +1,39 @@
-from dataclasses import dataclass, field
-from collections import defaultdict
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from collections import Counter
 
-import hnswlib
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
-from web_crawler.node import Node
-from search.tokenizer import tokenize
+from web_crawler.node import Node, fingerprint
+from search.embedding_cache import EmbeddingCache
+from search.fusion import FUSION_METHODS, fuse
+from search.postings import FrozenPostings, Postings
+from search.snapshot import StringTable, open_array, read_meta, write_array
+from search.snapshot import write_meta, write_strings
+from search.tokenizer import iter_tokens, tokenize
+from search.vector_index import IndexConfig, load_vector_index, make_vector_index
+
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+
+
+def word_count(text: str | None) -> tuple[dict[str, int], int]:
+    if text is None:
+        return dict(), 0
+    counts = Counter(iter_tokens(text))
+    return counts, sum(counts.values())
+
+
+def encode(
+    model: SentenceTransformer, texts: list[str], batch_size: int = 32
+) -> np.ndarray:
+    return np.asarray(model.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+
+# runs the vector retrieval of a hybrid query next to the lexical one; model
+# inference and the vector search both release the GIL for most of their work
+_RETRIEVAL_EXECUTOR = ThreadPoolExecutor(thread_name_prefix="retrieval")
 
 
 @dataclass
@@ -17,71 +44,497 @@ class SearchResult:
     score: float | None = field(default=None)
 
 
-class InvertedIndex:
+class _Searcher:
+    """_Searcher
+
+    The query flow of `InvertedIndex` and `SegmentedIndex`: validating the
+    mode, running lexical, vector or hybrid retrieval and fusing the hits.
+    Subclasses provide `total_docs`, `_lexical_top_k`, `_vector_top_k`,
+    `_vector_top_k_many` and `_search_result`.
+    """
+
+    def top_k(
+        self,
+        query: str,
+        k: int = 10,
+        mode: str = "vector",
+        fusion: str = "rrf",
+        lexical_weight: float = 1.0,
+        vector_weight: float = 1.0,
+        parallel: bool = False,
+        ef: int | None = None,
+    ) -> list[SearchResult]:
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f"Unknown fusion method: {fusion}")
+        if self.total_docs == 0:
+            return []
+        k = min(k, self.total_docs)
+        if mode == "lexical":
+            hits = self._lexical_top_k(query, k)
+        elif mode == "vector":
+            hits = self._vector_top_k(query, k, ef)
+        else:
+            if parallel:
+                vector_future = _RETRIEVAL_EXECUTOR.submit(
+                    self._vector_top_k, query, k, ef
+                )
+                lexical_hits = self._lexical_top_k(query, k)
+                vector_hits = vector_future.result()
+            else:
+                lexical_hits = self._lexical_top_k(query, k)
+                vector_hits = self._vector_top_k(query, k, ef)
+            hits = fuse(
+                [lexical_hits, vector_hits],
+                [lexical_weight, vector_weight],
+                method=fusion,
+            )[:k]
+        return [self._search_result(label, score) for label, score in hits]
+
+    def top_k_many(
+        self,
+        queries: list[str],
+        k: int = 10,
+        mode: str = "vector",
+        fusion: str = "rrf",
+        lexical_weight: float = 1.0,
+        vector_weight: float = 1.0,
+        ef: int | None = None,
+    ) -> list[list[SearchResult]]:
+        """top_k_many
+
+        `top_k` for many queries at once. The queries that are not in the
+        query cache are embedded with a single model call and all of them are
+        searched with a single knn query, which hnswlib runs on its own
+        threads.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f"Unknown fusion method: {fusion}")
+        if self.total_docs == 0:
+            return [[] for _ in queries]
+        k = min(k, self.total_docs)
+        if mode == "lexical":
+            hits = [self._lexical_top_k(query, k) for query in queries]
+        elif mode == "vector":
+            hits = self._vector_top_k_many(queries, k, ef)
+        else:
+            hits = [
+                fuse(
+                    [lexical_hits, vector_hits],
+                    [lexical_weight, vector_weight],
+                    method=fusion,
+                )[:k]
+                for lexical_hits, vector_hits in zip(
+                    [self._lexical_top_k(query, k) for query in queries],
+                    self._vector_top_k_many(queries, k, ef),
+                )
+            ]
+        return [
+            [self._search_result(label, score) for label, score in query_hits]
+            for query_hits in hits
+        ]
+
+
+class InvertedIndex(_Searcher):
+    """InvertedIndex
+
+    BM25 postings and a vector index over the same documents. Inserting a
+    document whose id is already indexed replaces it. Deleted documents are
+    tombstoned: their postings are skipped and their vectors marked as
+    deleted until `compact` drops them and renumbers the rest.
+    """
 
     def __init__(
         self,
         model: SentenceTransformer | None = None,
         model_name: str = "sentence-transformers/paraphrase-MiniLM-L3-v2",
+        query_cache: EmbeddingCache | None = None,
+        config: IndexConfig | None = None,
     ):
-        self._words_per_doc: dict[str, int] = defaultdict(int)
-        self._doc_id_to_url: dict[str, str] = dict()
-        self._doc_id_to_title: dict[str, str] = dict()
+        self._config = config if config is not None else IndexConfig()
+        # document metadata is indexed by ordinal, which is also the vector label
+        self._doc_ids: list[str] = []
+        self._urls: list[str] = []
+        self._titles: list[str | None] = []
+        self._has_text: list[bool] = []
+        self._deleted: set[int] = set()
+        self._inverted_index = Postings()
+        self._model_name = model_name
         self._model = model if model is not None else SentenceTransformer(model_name)
-        embedding_dim = self._model.get_sentence_embedding_dimension()
-        self._hnsw = hnswlib.Index(space="cosine", dim=embedding_dim)
-        self._hnsw.init_index(max_elements=100_000, ef_construction=200, M=16)
-        self._id_to_label: dict[str, int] = {}
-        self._label_to_id: dict[int, str] = {}
+        self._vectors = make_vector_index(
+            self._config.backend_for(0),
+            self._model.get_sentence_embedding_dimension(),
+            self._config,
+        )
+        self._id_to_label: dict[str, int] | None = {}
+        self._fingerprints: np.ndarray | None = None
         self._next_label = 0
+        self._read_only = False
+        self._query_cache = query_cache if query_cache is not None else EmbeddingCache()
 
     @property
     def total_docs(self):
-        return len(self._doc_id_to_url)
+        return self._next_label - len(self._deleted)
+
+    @property
+    def num_deleted(self) -> int:
+        """Deleted documents whose space is only reclaimed by `compact`."""
+        return len(self._deleted)
+
+    @property
+    def config(self) -> IndexConfig:
+        return self._config
+
+    @property
+    def vector_backend(self) -> str:
+        return self._vectors.name
+
+    @property
+    def model_name(self) -> str:
+        return self._model_name
+
+    @property
+    def model(self) -> SentenceTransformer:
+        return self._model
+
+    @property
+    def total_terms(self):
+        return len(self._inverted_index)
+
+    @property
+    def query_cache(self) -> EmbeddingCache:
+        return self._query_cache
+
+    @query_cache.setter
+    def query_cache(self, query_cache: EmbeddingCache):
+        self._query_cache = query_cache
+
+    def warm_query_cache(self, queries: list[str], batch_size: int = 32) -> int:
+        return self._query_cache.warm(
+            queries, lambda batch: self._encode(batch, batch_size)
+        )
 
     def insert(self, doc: Node) -> None:
-        _, total = self._word_count(doc.text)
-        self._words_per_doc[doc.id] = total
-        self._doc_id_to_url[doc.id] = doc.url
-        self._doc_id_to_title[doc.id] = doc.title
-        if doc.text is not None:
-            embedding = self._model.encode(doc.text).astype(np.float32)
-            if self._next_label >= self._hnsw.get_max_elements():
-                self._hnsw.resize_index(self._next_label * 2)
-            self._hnsw.add_items(embedding, self._next_label)
-            self._id_to_label[doc.id] = self._next_label
-            self._label_to_id[self._next_label] = doc.id
-            self._next_label += 1
-
-    def _word_count(self, text: str) -> dict[str, int]:
-        counts = defaultdict(int)
-        tokens = tokenize(text)
-        total = 0
-        for word in tokens:
-            counts[word] += 1
-            total += 1
-        return counts, total
+        self.insert_many([doc])
+
+    def insert_many(self, docs: list[Node], batch_size: int = 32) -> None:
+        word_counts = [word_count(doc.text) for doc in docs]
+        # one forward pass over the whole batch and one add_items call for
+        # the resulting matrix are much cheaper than per-document calls
+        texts = [doc.text for doc in docs if doc.text is not None]
+        embeddings = self._encode(texts, batch_size) if texts else None
+        self.add_analyzed(docs, word_counts, embeddings)
+
+    def add_analyzed(
+        self,
+        docs: list[Node],
+        word_counts: list[tuple[dict[str, int], int]],
+        embeddings: np.ndarray | None,
+    ) -> None:
+        """add_analyzed
+
+        Adds documents whose terms were already counted and whose texts were
+        already embedded, e.g. by a worker process. `word_counts` has one
+        entry per document and `embeddings` one row per document with text.
+        Documents that are already indexed are replaced.
+        """
+        if self._read_only:
+            raise TypeError("Indexes loaded from a snapshot are read-only")
+        last = {doc.id: i for i, doc in enumerate(docs)}
+        if len(last) < len(docs):
+            # of a document that is in the batch twice only the last one counts
+            keep = sorted(last.values())
+            if embeddings is not None:
+                rows = np.cumsum([doc.text is not None for doc in docs]) - 1
+                embeddings = np.asarray(embeddings)[
+                    [rows[i] for i in keep if docs[i].text is not None]
+                ]
+            docs = [docs[i] for i in keep]
+            word_counts = [word_counts[i] for i in keep]
+        self.delete_many([doc.id for doc in docs])
+        labels = range(self._next_label, self._next_label + len(docs))
+        embedded_labels = []
+        for label, doc, (counts, total) in zip(labels, docs, word_counts):
+            self._doc_ids.append(doc.id)
+            self._urls.append(doc.url)
+            self._titles.append(doc.title)
+            self._has_text.append(doc.text is not None)
+            self.id_to_label[doc.id] = label
+            if doc.text is not None:
+                self._inverted_index.add(label, counts, total)
+                embedded_labels.append(label)
+        self._next_label += len(docs)
+        if not embedded_labels:
+            return
+        self._vectors.add(embeddings, np.asarray(embedded_labels))
+        backend = self._config.backend_for(len(self._vectors))
+        if backend != self._vectors.name:
+            # the index outgrew exact search, build a graph from its vectors
+            vectors = make_vector_index(backend, self._vectors.dim, self._config)
+            vectors.add(*self._vectors.items())
+            self._vectors = vectors
+
+    def delete(self, doc_id: str) -> bool:
+        return self.delete_many([doc_id]) == 1
+
+    def delete_many(self, doc_ids: list[str]) -> int:
+        """Deletes the documents that are indexed and returns how many."""
+        if self._read_only:
+            raise TypeError("Indexes loaded from a snapshot are read-only")
+        labels = [
+            self.id_to_label.pop(doc_id)
+            for doc_id in set(doc_ids)
+            if doc_id in self.id_to_label
+        ]
+        embedded_labels = [label for label in labels if self._has_text[label]]
+        for label in embedded_labels:
+            self._inverted_index.delete(label)
+        if embedded_labels:
+            self._vectors.delete(np.asarray(embedded_labels))
+        self._deleted.update(labels)
+        return len(labels)
+
+    def compact(self) -> None:
+        """compact
+
+        Drops the deleted documents for good: the others are renumbered
+        densely, the postings are rewritten without them and the vector index
+        is rebuilt from the remaining vectors, which for HNSW means building a
+        new graph.
+        """
+        if self._read_only:
+            raise TypeError("Indexes loaded from a snapshot are read-only")
+        if not self._deleted:
+            return
+        compacted = self.merged([self], self._config)
+        self._doc_ids = compacted._doc_ids
+        self._urls = compacted._urls
+        self._titles = compacted._titles
+        self._has_text = compacted._has_text
+        self._inverted_index = compacted._inverted_index
+        self._vectors = compacted._vectors
+        self._next_label = compacted._next_label
+        self._deleted = set()
+        self._id_to_label = None
+
+    @classmethod
+    def merged(
+        cls, indexes: list["InvertedIndex"], config: IndexConfig
+    ) -> "InvertedIndex":
+        """merged
+
+        A new index with the documents of all `indexes` that are not deleted,
+        in order, built from their postings and vectors without analyzing or
+        embedding anything again. The indexes have to be writable.
+        """
+        index = cls(
+            model=indexes[0].model,
+            model_name=indexes[0].model_name,
+            query_cache=indexes[0].query_cache,
+            config=config,
+        )
+        ordinals, embeddings, labels = [], [], []
+        for part in indexes:
+            live = [
+                label for label in range(part._next_label) if label not in part._deleted
+            ]
+            part_ordinals = np.full(part._next_label, -1, dtype=np.int64)
+            part_ordinals[live] = np.arange(len(live)) + index._next_label
+            ordinals.append(part_ordinals)
+            index._doc_ids += [part._doc_ids[label] for label in live]
+            index._urls += [part._urls[label] for label in live]
+            index._titles += [part._titles[label] for label in live]
+            index._has_text += [part._has_text[label] for label in live]
+            index._next_label += len(live)
+            part_embeddings, part_labels = part._vectors.items()
+            embeddings.append(part_embeddings)
+            labels.append(part_ordinals[part_labels])
+        index._inverted_index = Postings.merged(
+            [part._inverted_index for part in indexes], ordinals
+        )
+        embeddings, labels = np.concatenate(embeddings), np.concatenate(labels)
+        order = np.argsort(labels)
+        index._vectors = make_vector_index(
+            config.backend_for(len(labels)), index._vectors.dim, config
+        )
+        if len(labels):
+            index._vectors.add(embeddings[order], labels[order])
+        index._id_to_label = None
+        return index
+
+    def _encode(self, texts: list[str], batch_size: int = 32) -> np.ndarray:
+        return encode(self._model, texts, batch_size)
+
+    @property
+    def id_to_label(self) -> dict[str, int]:
+        # snapshots do not store this mapping, it is rebuilt on first use
+        if self._id_to_label is None:
+            self._id_to_label = {
+                doc_id: label
+                for label, doc_id in enumerate(self._doc_ids)
+                if label not in self._deleted
+            }
+        return self._id_to_label
+
+    @property
+    def fingerprints(self) -> np.ndarray:
+        """The `Node.fingerprint` of the document of every label. Snapshots
+        store them, so opening one does not read every document id."""
+        if self._fingerprints is not None:
+            return self._fingerprints
+        fingerprints = np.fromiter(
+            (fingerprint(doc_id) for doc_id in self._doc_ids),
+            dtype=np.uint64,
+            count=self._next_label,
+        )
+        if self._read_only:
+            self._fingerprints = fingerprints
+        return fingerprints
 
     def num_words_in_doc(self, doc_id: str) -> int:
-        return self._words_per_doc[doc_id]
+        return self._inverted_index.doc_length(self.id_to_label[doc_id])
+
+    def _lexical_top_k(self, query: str, k: int) -> list[tuple[int, float]]:
+        return self._inverted_index.bm25(tokenize(query), k)
 
-    def top_k(self, query: str, k: int = 10) -> list[SearchResult]:
-        if self._next_label == 0:
+    def _vector_top_k(
+        self, query: str, k: int, ef: int | None = None
+    ) -> list[tuple[int, float]]:
+        query_embedding = self._query_cache.get_or_compute(
+            query, lambda text: self._model.encode(text).astype(np.float32)
+        )
+        return self._knn(query_embedding[np.newaxis], k, ef, num_threads=1)[0]
+
+    def _vector_top_k_many(
+        self, queries: list[str], k: int, ef: int | None = None
+    ) -> list[list[tuple[int, float]]]:
+        if not queries:
             return []
-        k = min(k, self._next_label)
-        query_embedding = self._model.encode(query).astype(np.float32)
-        self._hnsw.set_ef(max(k, 10))
-        labels, distances = self._hnsw.knn_query(query_embedding, k)
-        results = []
-        for label, distance in zip(labels[0], distances[0]):
-            doc_id = self._label_to_id[label]
-            score = 1.0 - float(distance)
-            results.append(
-                SearchResult(
-                    id=doc_id,
-                    url=self._doc_id_to_url[doc_id],
-                    title=self._doc_id_to_title[doc_id],
-                    score=score,
-                )
-            )
-        return results
+        query_embeddings = self._query_cache.get_or_compute_many(queries, self._encode)
+        return self._knn(query_embeddings, k, ef, num_threads=-1)
+
+    def _knn(
+        self,
+        query_embeddings: np.ndarray,
+        k: int,
+        ef: int | None,
+        num_threads: int,
+        exclude: np.ndarray | None = None,
+    ) -> list[list[tuple[int, float]]]:
+        return self._vectors.search(query_embeddings, k, ef, num_threads, exclude)
+
+    def _search_result(self, label: int, score: float) -> SearchResult:
+        return SearchResult(
+            id=self._doc_ids[label],
+            url=self._urls[label],
+            title=self._titles[label],
+            score=score,
+        )
+
+    def save(self, dir: str) -> None:
+        """save
+
+        Writes the index as a snapshot directory: the HNSW graph in hnswlib's
+        native format or the flat vector matrix, the postings, the document
+        metadata and the deleted labels as flat binary arrays and a small json
+        file with the model name and statistics. The model itself is not
+        stored, only referenced by name.
+        """
+        os.makedirs(dir)
+        self._vectors.save(dir)
+        postings_stats = self._inverted_index.save(dir)
+        write_strings(dir, "doc_ids", self._doc_ids)
+        write_strings(dir, "urls", self._urls)
+        write_strings(dir, "titles", (title or "" for title in self._titles))
+        write_array(
+            dir, "has_title", [title is not None for title in self._titles], np.uint8
+        )
+        write_array(dir, "deleted_labels", sorted(self._deleted), np.uint32)
+        write_array(dir, "doc_fingerprints", self.fingerprints, np.uint64)
+        write_meta(
+            dir,
+            dict(
+                model_name=self._model_name,
+                dim=self._vectors.dim,
+                vector_backend=self._vectors.name,
+                num_docs=self._next_label,
+                index_config=asdict(self._config),
+                postings=postings_stats,
+            ),
+        )
+
+    @classmethod
+    def load(
+        cls,
+        dir: str,
+        model: SentenceTransformer | None = None,
+        query_cache: EmbeddingCache | None = None,
+        writable: bool = False,
+    ) -> "InvertedIndex":
+        """load
+
+        Opens a snapshot written by `save`. Postings and document metadata are
+        memory-mapped rather than read, which makes loading fast and lets all
+        server processes share the pages. The loaded index is read-only unless
+        it is `writable`, which reads everything into memory instead, e.g. to
+        update a snapshot with a re-crawl. Pass the `model` of a previously
+        loaded index to avoid loading it again.
+        """
+        meta = read_meta(dir)
+        index = cls.__new__(cls)
+        index._config = IndexConfig(**meta.get("index_config", dict()))
+        index._model_name = meta["model_name"]
+        index._model = (
+            model if model is not None else SentenceTransformer(meta["model_name"])
+        )
+        index._vectors = load_vector_index(
+            meta.get("vector_backend", "hnsw"),
+            dir,
+            meta["dim"],
+            index._config,
+            writable,
+        )
+        index._inverted_index = FrozenPostings(dir, meta["postings"])
+        index._doc_ids = StringTable(dir, "doc_ids")
+        index._urls = StringTable(dir, "urls")
+        index._titles = _OptionalStrings(
+            StringTable(dir, "titles"), open_array(dir, "has_title", np.uint8)
+        )
+        index._deleted = set()
+        if os.path.exists(os.path.join(dir, "deleted_labels.bin")):
+            index._deleted = set(open_array(dir, "deleted_labels", np.uint32).tolist())
+        index._has_text = None
+        index._id_to_label = None
+        index._fingerprints = None
+        if not writable and os.path.exists(os.path.join(dir, "doc_fingerprints.bin")):
+            index._fingerprints = open_array(dir, "doc_fingerprints", np.uint64)
+        index._next_label = meta["num_docs"]
+        index._read_only = not writable
+        if writable:
+            index._inverted_index = index._inverted_index.thaw()
+            index._doc_ids = list(index._doc_ids)
+            index._urls = list(index._urls)
+            index._titles = [index._titles[i] for i in range(index._next_label)]
+            # only documents with text have a vector
+            index._has_text = [False] * index._next_label
+            for label in index._vectors.labels():
+                index._has_text[label] = True
+        index._query_cache = (
+            query_cache if query_cache is not None else EmbeddingCache()
+        )
+        return index
+
+
+class _OptionalStrings:
+    def __init__(self, strings: StringTable, present: np.ndarray):
+        self._strings = strings
+        self._present = present
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+    def __getitem__(self, i: int) -> str | None:
+        return self._strings[i] if self._present[i] else None
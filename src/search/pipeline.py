@@ -0,0 +1,67 @@
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from search.inverted_index import encode, word_count
+
+Analysis = tuple[list[tuple[dict[str, int], int]], np.ndarray | None]
+
+# set once per worker process by _init_worker
+_WORKER_MODEL: SentenceTransformer | None = None
+
+
+def _init_worker(
+    model_name: str, model_factory: Callable[[], SentenceTransformer] | None
+) -> None:
+    global _WORKER_MODEL
+    _WORKER_MODEL = (
+        model_factory()
+        if model_factory is not None
+        else SentenceTransformer(model_name)
+    )
+
+
+def _analyze(texts: list[str | None], batch_size: int) -> Analysis:
+    word_counts = [word_count(text) for text in texts]
+    to_embed = [text for text in texts if text is not None]
+    embeddings = encode(_WORKER_MODEL, to_embed, batch_size) if to_embed else None
+    return word_counts, embeddings
+
+
+class ParallelAnalyzer:
+    """ParallelAnalyzer
+
+    Tokenizes, counts terms and embeds batches of documents in a pool of
+    worker processes, each of which loads the model once when it starts. The
+    results are merged into an `InvertedIndex` with `add_analyzed` in the
+    parent process, which keeps the index itself single-writer.
+
+    Workers are spawned rather than forked so they do not inherit the
+    parent's torch thread pools.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        processes: int | None = None,
+        batch_size: int = 32,
+        model_factory: Callable[[], SentenceTransformer] | None = None,
+    ):
+        self.batch_size = batch_size
+        self.processes = processes if processes is not None else os.cpu_count()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, model_factory),
+        )
+
+    def submit(self, texts: list[str | None]) -> Future:
+        return self._pool.submit(_analyze, texts, self.batch_size)
+
+    def close(self) -> None:
+        self._pool.shutdown()
@@ -0,0 +1,297 @@
+import math
+import os
+from array import array
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from search.snapshot import StringTable, open_array, write_array, write_strings
+
+
+@dataclass(slots=True)
+class PostingsList:
+    doc_ordinals: array | np.ndarray = field(default_factory=lambda: array("I"))
+    term_freqs: array | np.ndarray = field(default_factory=lambda: array("I"))
+
+    def __len__(self) -> int:
+        return len(self.doc_ordinals)
+
+
+@dataclass
+class CorpusStats:
+    """CorpusStats
+
+    The statistics BM25 needs of a corpus that is split over several
+    `Postings`. Each part scores its documents with these rather than its own,
+    so the scores of all parts are comparable and can be merged.
+    """
+
+    num_docs: int
+    total_length: int
+    doc_freqs: dict[str, int]
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self.total_length / self.num_docs if self.num_docs else 0.0
+
+    @classmethod
+    def of(cls, parts: list["Postings"], terms: list[str]) -> "CorpusStats":
+        terms = set(terms)
+        return cls(
+            num_docs=sum(part.num_docs for part in parts),
+            total_length=sum(part._total_length for part in parts),
+            doc_freqs={
+                term: sum(part.doc_freq(term) for part in parts) for term in terms
+            },
+        )
+
+
+class Postings:
+    """Postings
+
+    Maps each term to the documents containing it. Documents are identified by
+    a dense integer ordinal and postings are kept as parallel, sorted `array`s
+    of ordinals and term frequencies, which is far more compact than a dict
+    per term and can be scored with numpy without copying.
+
+    Deleting a document only records its ordinal, which is then skipped when
+    scoring, its entries stay in the lists until `compacted` drops them.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, PostingsList] = dict()
+        self._doc_lengths = array("I")
+        self._deleted: set[int] = set()
+        self._num_docs = 0
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self._postings
+
+    @property
+    def num_docs(self) -> int:
+        return self._num_docs
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self._total_length / self._num_docs if self._num_docs else 0.0
+
+    def add(self, ordinal: int, term_counts: dict[str, int], length: int) -> None:
+        if ordinal < len(self._doc_lengths):
+            raise ValueError(f"Ordinals must be increasing, got {ordinal}")
+        # ordinals may be sparse, pad the lengths so they stay indexable
+        self._doc_lengths.extend([0] * (ordinal - len(self._doc_lengths)))
+        self._doc_lengths.append(length)
+        self._num_docs += 1
+        self._total_length += length
+        for term, count in term_counts.items():
+            postings_list = self._postings.get(term)
+            if postings_list is None:
+                postings_list = self._postings[term] = PostingsList()
+            postings_list.doc_ordinals.append(ordinal)
+            postings_list.term_freqs.append(count)
+
+    def delete(self, ordinal: int) -> None:
+        if ordinal in self._deleted or ordinal >= len(self._doc_lengths):
+            return
+        self._deleted.add(ordinal)
+        self._num_docs -= 1
+        self._total_length -= self._doc_lengths[ordinal]
+        self._doc_lengths[ordinal] = 0
+
+    @property
+    def num_deleted(self) -> int:
+        return len(self._deleted)
+
+    def compacted(self, ordinals: np.ndarray) -> "Postings":
+        """A copy without the deleted documents, renumbered by `ordinals`,
+        which maps every old ordinal to its new one, or to -1 if deleted."""
+        return Postings.merged([self], [ordinals])
+
+    @staticmethod
+    def merged(parts: list["Postings"], ordinals: list[np.ndarray]) -> "Postings":
+        """The union of `parts` without their deleted documents. `ordinals`
+        maps the ordinals of every part to the merged ones, or to -1 for
+        deleted documents, and must keep the parts in order."""
+        postings = Postings(k1=parts[0].k1, b=parts[0].b)
+        size = max((int(o.max(initial=-1)) + 1 for o in ordinals), default=0)
+        lengths = np.zeros(size, dtype=np.uint32)
+        for part, part_ordinals in zip(parts, ordinals):
+            live = np.flatnonzero(part_ordinals[: len(part._doc_lengths)] >= 0)
+            lengths[part_ordinals[live]] = np.asarray(
+                part._doc_lengths, dtype=np.uint32
+            )[live]
+        postings._doc_lengths = array("I", lengths.tobytes())
+        postings._num_docs = sum(part._num_docs for part in parts)
+        postings._total_length = sum(part._total_length for part in parts)
+        merged: dict[str, tuple[list, list]] = dict()
+        for part, part_ordinals in zip(parts, ordinals):
+            for term in part.terms():
+                postings_list = part.get(term)
+                doc_ordinals = part_ordinals[np.asarray(postings_list.doc_ordinals)]
+                kept = doc_ordinals >= 0
+                if kept.any():
+                    term_freqs = np.asarray(postings_list.term_freqs, dtype=np.uint32)
+                    term_ordinals, term_tfs = merged.setdefault(term, ([], []))
+                    term_ordinals.append(doc_ordinals[kept].astype(np.uint32))
+                    term_tfs.append(term_freqs[kept])
+        for term, (term_ordinals, term_tfs) in merged.items():
+            postings._postings[term] = PostingsList(
+                array("I", np.concatenate(term_ordinals).tobytes()),
+                array("I", np.concatenate(term_tfs).tobytes()),
+            )
+        return postings
+
+    def terms(self) -> list[str]:
+        """All terms, sorted by their utf-8 bytes."""
+        return sorted(self._postings, key=str.encode)
+
+    def get(self, term: str) -> PostingsList | None:
+        return self._postings.get(term)
+
+    def doc_freq(self, term: str) -> int:
+        postings_list = self.get(term)
+        return 0 if postings_list is None else len(postings_list)
+
+    def doc_length(self, ordinal: int) -> int:
+        if ordinal >= len(self._doc_lengths):
+            return 0
+        return int(self._doc_lengths[ordinal])
+
+    def idf(self, term: str, stats: CorpusStats | None = None) -> float:
+        num_docs = self._num_docs if stats is None else stats.num_docs
+        doc_freq = self.doc_freq(term) if stats is None else stats.doc_freqs[term]
+        # lists may still hold deleted documents
+        df = min(doc_freq, num_docs)
+        return math.log(1.0 + (num_docs - df + 0.5) / (df + 0.5))
+
+    def bm25(
+        self,
+        terms: list[str],
+        k: int,
+        stats: CorpusStats | None = None,
+        exclude: np.ndarray | None = None,
+    ) -> list[tuple[int, float]]:
+        """The `k` best documents for `terms`, scored with the `stats` of the
+        whole corpus if these postings only hold part of it. Ordinals in
+        `exclude` are skipped like deleted ones."""
+        if self._num_docs == 0:
+            return []
+        k1, b = self.k1, self.b
+        avg_doc_length = (
+            self.avg_doc_length if stats is None else stats.avg_doc_length
+        ) or 1.0
+        doc_lengths = np.asarray(self._doc_lengths, dtype=np.uint32)
+        ordinals, contributions = [], []
+        for term in set(terms):
+            postings_list = self.get(term)
+            if postings_list is None:
+                continue
+            term_ordinals = np.asarray(postings_list.doc_ordinals, dtype=np.uint32)
+            tfs = np.asarray(postings_list.term_freqs, dtype=np.float64)
+            norm = k1 * (1.0 - b + b * doc_lengths[term_ordinals] / avg_doc_length)
+            ordinals.append(term_ordinals)
+            contributions.append(
+                self.idf(term, stats) * tfs * (k1 + 1.0) / (tfs + norm)
+            )
+        if not ordinals:
+            return []
+        # sum the contributions of every term per document
+        matched, inverse = np.unique(np.concatenate(ordinals), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions))
+        if self._deleted:
+            live = ~np.isin(matched, np.fromiter(self._deleted, dtype=np.uint32))
+            matched, scores = matched[live], scores[live]
+        if exclude is not None and len(exclude):
+            live = ~np.isin(matched, exclude)
+            matched, scores = matched[live], scores[live]
+        if not len(matched):
+            return []
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(matched[i]), float(scores[i])) for i in top]
+
+    def save(self, dir: str) -> dict:
+        """Writes the postings as flat arrays: the terms sorted by their utf-8
+        bytes, an offsets array into the concatenated ordinal and frequency
+        arrays, and the document lengths. Returns the scalar statistics."""
+        terms = self.terms()
+        postings_lists = [self.get(term) for term in terms]
+        offsets = [0]
+        for postings_list in postings_lists:
+            offsets.append(offsets[-1] + len(postings_list))
+        write_strings(dir, "terms", terms)
+        write_array(dir, "postings.offsets", offsets, np.uint64)
+        for name, attribute in (
+            ("postings.ordinals", "doc_ordinals"),
+            ("postings.tfs", "term_freqs"),
+        ):
+            with open(f"{dir}/{name}.bin", "wb") as file:
+                for postings_list in postings_lists:
+                    values = getattr(postings_list, attribute)
+                    file.write(np.asarray(values, dtype=np.uint32).tobytes())
+        write_array(dir, "doc_lengths", self._doc_lengths, np.uint32)
+        write_array(dir, "postings.deleted", sorted(self._deleted), np.uint32)
+        return dict(
+            k1=self.k1,
+            b=self.b,
+            num_docs=self._num_docs,
+            total_length=self._total_length,
+        )
+
+
+class FrozenPostings(Postings):
+    """FrozenPostings
+
+    Read-only `Postings` backed by the memory-mapped arrays written by
+    `Postings.save`. Terms are looked up by binary search over the sorted term
+    table, so opening a snapshot does not need to decode any term.
+    """
+
+    def __init__(self, dir: str, stats: dict):
+        super().__init__(k1=stats["k1"], b=stats["b"])
+        self._num_docs = stats["num_docs"]
+        self._total_length = stats["total_length"]
+        self._terms = StringTable(dir, "terms")
+        self._offsets = open_array(dir, "postings.offsets", np.uint64)
+        self._ordinals = open_array(dir, "postings.ordinals", np.uint32)
+        self._tfs = open_array(dir, "postings.tfs", np.uint32)
+        self._doc_lengths = open_array(dir, "doc_lengths", np.uint32)
+        if os.path.exists(os.path.join(dir, "postings.deleted.bin")):
+            self._deleted = set(open_array(dir, "postings.deleted", np.uint32).tolist())
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def __contains__(self, term: str) -> bool:
+        return self._terms.index(term) is not None
+
+    def add(self, ordinal: int, term_counts: dict[str, int], length: int) -> None:
+        raise TypeError("Postings loaded from a snapshot are read-only")
+
+    def delete(self, ordinal: int) -> None:
+        raise TypeError("Postings loaded from a snapshot are read-only")
+
+    def thaw(self) -> Postings:
+        """A mutable copy, read into memory."""
+        postings = self.compacted(np.arange(len(self._doc_lengths)))
+        postings._deleted = set(self._deleted)
+        return postings
+
+    def terms(self) -> list[str]:
+        return list(self._terms)
+
+    def get(self, term: str) -> PostingsList | None:
+        i = self._terms.index(term)
+        if i is None:
+            return None
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return PostingsList(self._ordinals[start:end], self._tfs[start:end])
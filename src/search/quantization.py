@@ -0,0 +1,84 @@
+import numpy as np
+
+# a product quantization code is one byte per subvector
+PQ_CENTROIDS = 256
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Scales every row so its largest component maps to 127. Returns the
+    int8 rows and the float32 scale to multiply them by."""
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.rint(vectors / scales[:, np.newaxis]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _nearest(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # |x - c|^2 without the |x|^2 term, which is the same for every centroid
+    distances = np.sum(centroids**2, axis=1) - 2 * data @ centroids.T
+    return np.argmin(distances, axis=1)
+
+
+def _kmeans(
+    data: np.ndarray, num_centroids: int, iterations: int, rng: np.random.Generator
+) -> np.ndarray:
+    centroids = data[rng.choice(len(data), num_centroids, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, data)
+        counts = np.bincount(assignment, minlength=num_centroids)
+        # empty clusters keep their centroid
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, np.newaxis]
+    return centroids
+
+
+def train_codebooks(
+    vectors: np.ndarray, subvectors: int, iterations: int = 10, seed: int = 0
+) -> np.ndarray:
+    """Learns a product quantizer: the dimensions are split into `subvectors`
+    equal slices and every slice gets its own k-means codebook of up to 256
+    centroids. Returns an array of shape (subvectors, centroids, slice)."""
+    num, dim = vectors.shape
+    if dim % subvectors:
+        raise ValueError(f"{dim} dimensions do not split into {subvectors} slices")
+    rng = np.random.default_rng(seed)
+    num_centroids = min(PQ_CENTROIDS, num)
+    slices = vectors.reshape(num, subvectors, dim // subvectors)
+    return np.stack(
+        [
+            _kmeans(slices[:, i], num_centroids, iterations, rng)
+            for i in range(subvectors)
+        ]
+    ).astype(np.float32)
+
+
+def pq_encode(vectors: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+    """The index of the nearest centroid of every slice, one byte each."""
+    subvectors, _, width = codebooks.shape
+    slices = vectors.reshape(len(vectors), subvectors, width)
+    return np.stack(
+        [_nearest(slices[:, i], codebooks[i]) for i in range(subvectors)], axis=1
+    ).astype(np.uint8)
+
+
+def pq_decode(codes: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+    subvectors = codebooks.shape[0]
+    return codebooks[np.arange(subvectors), codes].reshape(len(codes), -1)
+
+
+def pq_lookup_tables(queries: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+    """The inner product of every query slice with every centroid of its
+    codebook, flattened to one row of subvectors * centroids per query."""
+    subvectors, num_centroids, width = codebooks.shape
+    slices = queries.reshape(len(queries), subvectors, width)
+    tables = np.einsum("qsw,scw->qsc", slices, codebooks)
+    return tables.reshape(len(queries), subvectors * num_centroids)
+
+
+def pq_scores(table: np.ndarray, codes: np.ndarray, num_centroids: int) -> np.ndarray:
+    """The approximate inner products of one query with the coded vectors:
+    the sum of one table entry per slice, without decoding any vector."""
+    offsets = np.arange(codes.shape[1]) * num_centroids
+    return table[codes + offsets].sum(axis=1, dtype=np.float32)
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+import redis
+
+from search.embedding_cache import EmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+Results = list[dict[str, Any]]
+
+
+def result_cache_key(generation: str, query: str, **params) -> str:
+    """Builds a cache key from the index generation, the normalized query and
+    every parameter that influences the ranking. Including the generation
+    means swapping in a new index implicitly invalidates all old entries."""
+    payload = json.dumps(
+        [generation, EmbeddingCache.normalize(query), sorted(params.items())]
+    )
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """ResultCache
+
+    In-process LRU cache of serialized search results with a TTL.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10_000,
+        ttl_seconds: float | None = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[float, Results]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Results | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (
+                self.ttl_seconds is None or self._clock() - entry[0] <= self.ttl_seconds
+            ):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, results: Results) -> None:
+        with self._lock:
+            self._entries[key] = (self._clock(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                backend="memory",
+                size=len(self._entries),
+                max_size=self.max_size,
+                hits=self.hits,
+                misses=self.misses,
+            )
+
+
+class RedisResultCache:
+    """RedisResultCache
+
+    Search result cache shared by every server replica through Redis. Entries
+    expire via Redis TTLs. Redis being unavailable degrades to cache misses
+    rather than failing the search.
+    """
+
+    def __init__(
+        self,
+        redis_url: str,
+        ttl_seconds: float | None = 300.0,
+        prefix: str = "search-results:",
+        client=None,
+    ):
+        self._client = client if client is not None else redis.Redis.from_url(redis_url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Results | None:
+        try:
+            value = self._client.get(self.prefix + key)
+        except redis.RedisError as e:
+            logger.warning(f"Result cache lookup failed: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def put(self, key: str, results: Results) -> None:
+        ex = None if self.ttl_seconds is None else int(max(1, self.ttl_seconds))
+        try:
+            self._client.set(self.prefix + key, json.dumps(results), ex=ex)
+        except redis.RedisError as e:
+            logger.warning(f"Result cache write failed: {e}")
+
+    def stats(self) -> dict:
+        return dict(backend="redis", hits=self.hits, misses=self.misses)
+
+
+def make_result_cache(
+    backend: str | None, redis_url: str, max_size: int, ttl_seconds: float | None
+) -> ResultCache | RedisResultCache | None:
+    if backend is None:
+        return None
+    elif backend == "memory":
+        return ResultCache(max_size, ttl_seconds)
+    elif backend == "redis":
+        return RedisResultCache(redis_url, ttl_seconds)
+    raise ValueError(f"Unknown result cache backend: {backend}")
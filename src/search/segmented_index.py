@@ -0,0 +1,160 @@
+from bisect import bisect_right
+from dataclasses import replace
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from search.embedding_cache import EmbeddingCache
+from search.inverted_index import InvertedIndex, SearchResult, _Searcher
+from search.postings import CorpusStats
+from search.tokenizer import tokenize
+from search.vector_index import IndexConfig
+
+
+class SegmentedIndex(_Searcher):
+    """SegmentedIndex
+
+    Searches a list of immutable `InvertedIndex` segments, oldest first, as
+    one index. A document that is in several segments is only found in the
+    newest one, the older copies are shadowed: the search of their segment
+    skips them like deleted documents. Every query fans out to all segments:
+    BM25 scores with the statistics of the whole corpus and cosine
+    similarities are comparable across segments, so each segment returns its
+    best hits and the union is ranked, and fused for hybrid queries, exactly
+    like the hits of a single index.
+    """
+
+    def __init__(
+        self,
+        segments: list[InvertedIndex],
+        query_cache: EmbeddingCache | None = None,
+        segment_names: list[str] | None = None,
+    ):
+        if not segments:
+            raise ValueError("A segmented index needs at least one segment")
+        self._segments = segments
+        # where the segments came from, to reopen only what changed
+        self.segment_names = segment_names or [str(i) for i in range(len(segments))]
+        # global labels: the labels of a segment follow those of the one before
+        self._offsets = np.cumsum([0] + [s._next_label for s in segments]).tolist()
+        self._shadowed = self._shadowed_labels()
+        # documents without text have no vector to skip
+        self._shadowed_vectors = [
+            (
+                np.intersect1d(shadowed, segment._vectors.labels())
+                if len(shadowed)
+                else shadowed
+            )
+            for segment, shadowed in zip(segments, self._shadowed)
+        ]
+        # the candidate list size at search time applies to every segment
+        self._config = replace(segments[-1].config)
+        self._query_cache = query_cache if query_cache is not None else EmbeddingCache()
+
+    def _shadowed_labels(self) -> list[np.ndarray]:
+        shadowed = []
+        # the ids of deleted documents count too, a newer segment that
+        # deleted a document hides its older copies
+        newer = np.empty(0, dtype=np.uint64)
+        for segment in reversed(self._segments):
+            fingerprints = segment.fingerprints
+            hidden = np.isin(fingerprints, newer)
+            hidden[list(segment._deleted)] = False
+            shadowed.append(np.flatnonzero(hidden))
+            newer = np.union1d(newer, fingerprints)
+        return shadowed[::-1]
+
+    @property
+    def segments(self) -> list[InvertedIndex]:
+        return self._segments
+
+    @property
+    def total_docs(self) -> int:
+        return sum(s.total_docs for s in self._segments) - self.num_shadowed
+
+    @property
+    def num_shadowed(self) -> int:
+        """Older copies of documents that merging segments drops."""
+        return sum(len(shadowed) for shadowed in self._shadowed)
+
+    @property
+    def config(self) -> IndexConfig:
+        return self._config
+
+    @property
+    def vector_backend(self) -> str:
+        return ",".join(sorted({s.vector_backend for s in self._segments}))
+
+    @property
+    def model_name(self) -> str:
+        return self._segments[-1].model_name
+
+    @property
+    def model(self) -> SentenceTransformer:
+        return self._segments[-1].model
+
+    @property
+    def query_cache(self) -> EmbeddingCache:
+        return self._query_cache
+
+    @query_cache.setter
+    def query_cache(self, query_cache: EmbeddingCache):
+        self._query_cache = query_cache
+
+    def warm_query_cache(self, queries: list[str], batch_size: int = 32) -> int:
+        return self._query_cache.warm(
+            queries, lambda batch: self._segments[-1]._encode(batch, batch_size)
+        )
+
+    def _merge(
+        self, segment_hits: list[list[tuple[int, float]]], k: int
+    ) -> list[tuple[int, float]]:
+        """The best `k` of the hits of every segment, by global label."""
+        hits = []
+        for offset, part in zip(self._offsets, segment_hits):
+            hits += [(offset + label, score) for label, score in part]
+        return sorted(hits, key=lambda hit: hit[1], reverse=True)[:k]
+
+    def _lexical_top_k(self, query: str, k: int) -> list[tuple[int, float]]:
+        terms = tokenize(query)
+        postings = [s._inverted_index for s in self._segments]
+        stats = CorpusStats.of(postings, terms)
+        return self._merge(
+            [
+                part.bm25(terms, k, stats, exclude=shadowed)
+                for part, shadowed in zip(postings, self._shadowed)
+            ],
+            k,
+        )
+
+    def _vector_top_k(
+        self, query: str, k: int, ef: int | None = None
+    ) -> list[tuple[int, float]]:
+        return self._vector_top_k_many([query], k, ef, num_threads=1)[0]
+
+    def _vector_top_k_many(
+        self,
+        queries: list[str],
+        k: int,
+        ef: int | None = None,
+        num_threads: int = -1,
+    ) -> list[list[tuple[int, float]]]:
+        if not queries:
+            return []
+        # embedded once for all segments
+        query_embeddings = self._query_cache.get_or_compute_many(
+            queries, self._segments[-1]._encode
+        )
+        ef = ef if ef is not None else self._config.ef_search
+        segment_hits = [
+            segment._knn(query_embeddings, k, ef, num_threads, exclude=shadowed)
+            for segment, shadowed in zip(self._segments, self._shadowed_vectors)
+        ]
+        return [
+            self._merge([hits[i] for hits in segment_hits], k)
+            for i in range(len(queries))
+        ]
+
+    def _search_result(self, label: int, score: float) -> SearchResult:
+        i = bisect_right(self._offsets, label) - 1
+        return self._segments[i]._search_result(label - self._offsets[i], score)
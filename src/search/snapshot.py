@@ -0,0 +1,76 @@
+import json
+import os
+from bisect import bisect_left
+from typing import Iterable
+
+import numpy as np
+
+SNAPSHOT_FORMAT_VERSION = 1
+META_FILE = "meta.json"
+
+
+def write_array(dir: str, name: str, values: Iterable, dtype: np.dtype) -> None:
+    np.asarray(values, dtype=dtype).tofile(os.path.join(dir, f"{name}.bin"))
+
+
+def open_array(dir: str, name: str, dtype: np.dtype) -> np.ndarray:
+    """Maps a flat array read-only. The pages live in the OS page cache, so
+    every process that opens the same snapshot shares them."""
+    path = os.path.join(dir, f"{name}.bin")
+    if os.path.getsize(path) == 0:
+        # mmap refuses empty files
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+def write_strings(dir: str, name: str, strings: Iterable[str]) -> None:
+    offsets = [0]
+    with open(os.path.join(dir, f"{name}.data.bin"), "wb") as file:
+        for string in strings:
+            offsets.append(offsets[-1] + file.write(string.encode()))
+    write_array(dir, f"{name}.offsets", offsets, np.uint64)
+
+
+class StringTable:
+    """StringTable
+
+    Read-only sequence of strings stored as one utf-8 blob plus an offsets
+    array, both memory-mapped. Strings are only decoded when accessed.
+    """
+
+    def __init__(self, dir: str, name: str):
+        self._data = open_array(dir, f"{name}.data", np.uint8)
+        self._offsets = open_array(dir, f"{name}.offsets", np.uint64)
+
+    def __len__(self) -> int:
+        return max(len(self._offsets) - 1, 0)
+
+    def __getitem__(self, i: int) -> str:
+        return self.raw(i).decode()
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def raw(self, i: int) -> bytes:
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._data[int(self._offsets[i]) : int(self._offsets[i + 1])].tobytes()
+
+    def index(self, string: str) -> int | None:
+        """Binary search; only valid for tables written in utf-8 byte order."""
+        key = string.encode()
+        i = bisect_left(range(len(self)), key, key=self.raw)
+        return i if i < len(self) and self.raw(i) == key else None
+
+
+def write_meta(dir: str, meta: dict) -> None:
+    with open(os.path.join(dir, META_FILE), "w") as file:
+        json.dump(dict(meta, format_version=SNAPSHOT_FORMAT_VERSION), file)
+
+
+def read_meta(dir: str) -> dict:
+    with open(os.path.join(dir, META_FILE), "r") as file:
+        meta = json.load(file)
+    if meta.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format in {dir}")
+    return meta
@@ -0,0 +1,28 @@
+import pytest
+
+from web_crawler.node import Node
+
+
+@pytest.fixture
+def node0() -> Node:
+    return Node(
+        raw_url="https://some.page.on.the.internet",
+        text=(
+            "In publishing and graphic design, Lorem ipsum is a placeholder text "
+            "commonly used to demonstrate the visual form of a document or a typeface "
+            "without relying on meaningful content iterators."
+        ),
+        title="lorem ipsum",
+    )
+
+
+@pytest.fixture
+def node1() -> Node:
+    return Node(
+        raw_url="https://some.other.page.on.the.internet",
+        text=(
+            "For clarity and correctness in type hints, you should use Iterable and/or "
+            "Iterator from the typing module to annotate functions that return iterators."
+        ),
+        title="iterable/iterator",
+    )
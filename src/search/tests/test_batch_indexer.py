@@ -0,0 +1,138 @@
+import asyncio
+
+from search.batch_indexer import BatchIndexer
+from search.inverted_index import InvertedIndex
+from search.pipeline import ParallelAnalyzer
+from search.tokenizer import tokenize
+
+
+def test_batches(model, node0, node1):
+    batches = []
+
+    class RecordingIndex(InvertedIndex):
+        def insert_many(self, docs, batch_size=32):
+            batches.append([doc.id for doc in docs])
+            super().insert_many(docs, batch_size)
+
+    inverted_index = RecordingIndex(model=model)
+
+    async def run():
+        indexer = BatchIndexer(inverted_index, batch_size=2, flush_interval=60.0)
+        indexer.start()
+        for node in [node0, node1, node0]:
+            await indexer.put(node)
+        await indexer.close()
+        return indexer
+
+    indexer = asyncio.run(run())
+    assert batches == [[node0.id, node1.id], [node0.id]]
+    assert indexer.docs_indexed == 3
+    assert inverted_index.top_k("ipsum")[0].id == node0.id
+
+
+def test_flush_interval(model, node0):
+    inverted_index = InvertedIndex(model=model)
+
+    async def run():
+        indexer = BatchIndexer(inverted_index, batch_size=100, flush_interval=0.01)
+        indexer.start()
+        await indexer.put(node0)
+        await asyncio.sleep(0.5)
+        indexed_before_close = inverted_index.total_docs
+        await indexer.close()
+        return indexed_before_close
+
+    assert asyncio.run(run()) == 1
+
+
+def test_parallel_analyzer(model, node0, node1):
+    inverted_index = InvertedIndex(model=model)
+    analyzer = ParallelAnalyzer(
+        inverted_index.model_name, processes=2, model_factory=type(model)
+    )
+
+    async def run():
+        indexer = BatchIndexer(
+            inverted_index, batch_size=1, flush_interval=60.0, analyzer=analyzer
+        )
+        indexer.start()
+        for node in [node0, node1]:
+            await indexer.put(node)
+        await indexer.close()
+        return indexer
+
+    try:
+        indexer = asyncio.run(run())
+    finally:
+        analyzer.close()
+    assert indexer.docs_indexed == 2
+    assert inverted_index.total_docs == 2
+    assert inverted_index.top_k("ipsum")[0].id == node0.id
+    assert inverted_index.top_k("type hint", mode="lexical")[0].id == node1.id
+    assert inverted_index.num_words_in_doc(node0.id) == len(tokenize(node0.text))
+
+
+def test_save(model, node0, node1):
+    inverted_index = InvertedIndex(model=model)
+    saved = []
+
+    async def run():
+        indexer = BatchIndexer(inverted_index, batch_size=1, flush_interval=60.0)
+        indexer.start()
+        await indexer.put(node0)
+        while indexer.docs_indexed < 1:
+            await asyncio.sleep(0.01)
+        first = await indexer.save(lambda index: saved.append(index.total_docs))
+        await indexer.put(node1)
+        await indexer.close()
+        second = await indexer.save(lambda index: saved.append(index.total_docs))
+        third = await indexer.save(lambda index: None)
+        return first, second, third
+
+    assert asyncio.run(run()) == (
+        ([node0.id], []),
+        ([node1.id], []),
+        ([], []),
+    )
+    assert saved == [1, 2]
+
+
+def test_save_reports_failed_batches(model, node0, node1):
+    encode = model.encode
+
+    def failing_encode(texts, batch_size=32):
+        if node1.text in texts:
+            raise RuntimeError("out of memory")
+        return encode(texts, batch_size)
+
+    model.encode = failing_encode
+    inverted_index = InvertedIndex(model=model)
+
+    async def run():
+        indexer = BatchIndexer(inverted_index, batch_size=1, flush_interval=60.0)
+        indexer.start()
+        await indexer.put(node0)
+        await indexer.put(node1)
+        await indexer.close()
+        return await indexer.save(lambda index: None)
+
+    assert asyncio.run(run()) == ([node0.id], [node1.id])
+    assert inverted_index.total_docs == 1
+
+
+def test_save_fresh(model, node0, node1):
+    async def run():
+        indexer = BatchIndexer(InvertedIndex(model=model), batch_size=1)
+        indexer.start()
+        await indexer.put(node0)
+        while indexer.docs_indexed < 1:
+            await asyncio.sleep(0.01)
+        saved = []
+        await indexer.save(saved.append, fresh=lambda: InvertedIndex(model=model))
+        await indexer.put(node1)
+        await indexer.close()
+        return saved[0], indexer.index
+
+    saved, index = asyncio.run(run())
+    assert list(saved.id_to_label) == [node0.id]
+    assert list(index.id_to_label) == [node1.id]
@@ -0,0 +1,49 @@
+import numpy as np
+
+from search.benchmark import brute_force_knn, recall_at_k, run, run_flat
+
+
+def test_brute_force_knn():
+    data = np.array([[1, 0], [0, 1], [1, 1], [-1, 0]], dtype=np.float32)
+    queries = np.array([[2, 0.1], [-1, -0.1]], dtype=np.float32)
+    assert brute_force_knn(data, queries, 2).tolist() == [[0, 2], [3, 1]]
+    # k is capped at the number of vectors
+    assert brute_force_knn(data, queries, 10).shape == (2, 4)
+
+
+def test_recall_at_k():
+    ground_truth = np.array([[0, 1], [2, 3]])
+    assert recall_at_k(ground_truth, ground_truth) == 1.0
+    assert recall_at_k(np.array([[1, 5], [6, 7]]), ground_truth) == 0.25
+
+
+def test_run():
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(500, 16)).astype(np.float32)
+    queries = rng.normal(size=(20, 16)).astype(np.float32)
+    results = run(data, queries, k=5, ef_searches=(5, 500))
+    assert [result.ef_search for result in results] == [5, 500]
+    assert all(result.qps > 0 for result in results)
+    # with a candidate list as large as the data the search is exact
+    assert results[-1].recall == 1.0
+    assert results[0].recall <= results[-1].recall
+
+
+def test_run_flat():
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(300, 16)).astype(np.float32)
+    queries = rng.normal(size=(10, 16)).astype(np.float32)
+    results = run_flat(data, queries, k=5, rerank_factors=(0, 60), pq_subvectors=4)
+    assert [(r.dtype, r.rerank_factor) for r in results] == [
+        ("float32", 0),
+        ("float16", 0),
+        ("float16", 60),
+        ("int8", 0),
+        ("int8", 60),
+        ("pq", 0),
+        ("pq", 60),
+    ]
+    assert results[0].recall == 1.0
+    # k * rerank_factor covers all the data, so re-ranking makes pq exact
+    assert results[-1].recall == 1.0
+    assert results[-1].bytes_per_vector < results[0].bytes_per_vector / 8
@@ -0,0 +1,122 @@
+import pickle
+import threading
+
+import numpy as np
+
+from search.embedding_cache import EmbeddingCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _encode(text: str) -> np.ndarray:
+    return np.array([len(text), 1.0], dtype=np.float64)
+
+
+def test_get_or_compute():
+    cache = EmbeddingCache(max_size=10)
+    computed = []
+
+    def compute(text):
+        computed.append(text)
+        return _encode(text)
+
+    first = cache.get_or_compute("  lorem   ipsum ", compute)
+    second = cache.get_or_compute("lorem ipsum", compute)
+    assert computed == ["lorem ipsum"]
+    assert first.dtype == np.float32
+    assert second is first
+    assert not second.flags.writeable
+    assert cache.stats() == dict(size=1, max_size=10, hits=1, misses=1)
+
+
+def test_lru_eviction():
+    cache = EmbeddingCache(max_size=2)
+    cache.put("a", _encode("a"))
+    cache.put("b", _encode("b"))
+    assert cache.get("a") is not None
+    cache.put("c", _encode("c"))
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_ttl():
+    clock = FakeClock()
+    cache = EmbeddingCache(max_size=2, ttl_seconds=10.0, clock=clock)
+    cache.put("a", _encode("a"))
+    clock.now = 10.0
+    assert cache.get("a") is not None
+    clock.now = 10.5
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_warm():
+    cache = EmbeddingCache(max_size=2)
+    batches = []
+
+    def compute_many(texts):
+        batches.append(texts)
+        return np.stack([_encode(t) for t in texts])
+
+    cache.put("cached", _encode("cached"))
+    assert (
+        cache.warm(["cached", "head", " head", "tail", "long tail"], compute_many) == 2
+    )
+    assert batches == [["head", "tail"]]
+    # the most popular query survives eviction of the pre-existing entry
+    assert cache.get("head") is not None
+    assert cache.get("cached") is None
+    assert cache.warm(["head"], compute_many) == 0
+
+
+def test_thread_safety():
+    cache = EmbeddingCache(max_size=50)
+
+    def hammer(offset):
+        for i in range(500):
+            cache.get_or_compute(str((i + offset) % 100), _encode)
+
+    threads = [threading.Thread(target=hammer, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats["size"] == 50
+    assert stats["hits"] + stats["misses"] == 8 * 500
+
+
+def test_pickle():
+    cache = EmbeddingCache(max_size=3, ttl_seconds=None)
+    cache.put("a", _encode("a"))
+    restored = pickle.loads(pickle.dumps(cache))
+    assert restored.max_size == 3
+    assert restored.ttl_seconds is None
+    assert len(restored) == 0
+    restored.put("b", _encode("b"))
+    assert restored.get("b") is not None
+
+
+def test_get_or_compute_many():
+    cache = EmbeddingCache(max_size=1)
+    cache.put("lorem", _encode("lorem"))
+    batches = []
+
+    def compute_many(texts):
+        batches.append(texts)
+        return np.stack([_encode(text) for text in texts])
+
+    embeddings = cache.get_or_compute_many(
+        ["lorem", "ipsum", "dolor  sit", "ipsum"], compute_many
+    )
+    assert batches == [["ipsum", "dolor sit"]]
+    assert embeddings.dtype == np.float32
+    assert embeddings[:, 0].tolist() == [5, 5, 9, 5]
@@ -0,0 +1,32 @@
+import pytest
+
+from search.fusion import fuse, reciprocal_rank_fusion, weighted_score_fusion
+
+
+def test_reciprocal_rank_fusion():
+    lexical = [(1, 12.0), (2, 3.0)]
+    vector = [(2, 0.9), (3, 0.8), (1, 0.1)]
+    fused = reciprocal_rank_fusion([lexical, vector], [1.0, 1.0])
+    assert [label for label, _ in fused] == [2, 1, 3]
+
+    fused = reciprocal_rank_fusion([lexical, vector], [1.0, 0.0])
+    assert [label for label, _ in fused][:2] == [1, 2]
+
+
+def test_weighted_score_fusion():
+    lexical = [(1, 12.0), (2, 3.0)]
+    vector = [(2, 0.9), (3, 0.8), (1, 0.1)]
+    fused = weighted_score_fusion([lexical, vector], [1.0, 1.0])
+    assert fused[0] == (1, 1.0)
+    assert fused[1] == (2, 1.0)
+    assert [label for label, _ in fused] == [1, 2, 3]
+
+    fused = weighted_score_fusion([lexical, vector], [0.0, 1.0])
+    assert [label for label, _ in fused] == [2, 3, 1]
+
+    assert weighted_score_fusion([[(4, 2.0)], []], [1.0, 1.0]) == [(4, 1.0)]
+
+
+def test_fuse_unknown_method():
+    with pytest.raises(ValueError):
+        fuse([], [], method="borda")
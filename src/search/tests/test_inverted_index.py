@@ -1,59 +1,13 @@
 import numpy as np
 import pytest
 
-from web_crawler.node import Node
-from search.inverted_index import InvertedIndex
+from search.inverted_index import IndexConfig, InvertedIndex
 from search.tokenizer import tokenize
+from web_crawler.node import Node
 
 
 @pytest.fixture
-def node0() -> Node:
-    return Node(
-        raw_url="https://some.page.on.the.internet",
-        text=(
-            "In publishing and graphic design, Lorem ipsum is a placeholder text "
-            "commonly used to demonstrate the visual form of a document or a typeface "
-            "without relying on meaningful content iterators."
-        ),
-        title="lorem ipsum",
-    )
-
-
-@pytest.fixture
-def node1() -> Node:
-    return Node(
-        raw_url="https://some.other.page.on.the.internet",
-        text=(
-            "For clarity and correctness in type hints, you should use Iterable and/or "
-            "Iterator from the typing module to annotate functions that return iterators."
-        ),
-        title="iterable/iterator",
-    )
-
-
-@pytest.fixture
-def inverted_index(node0, node1) -> InvertedIndex:
-    class DummyModel:
-        KEYWORDS0 = {"lorem", "ipsum"}
-        KEYWORDS1 = {"type", "hint", "iterators", "iterator"}
-
-        def encode(self, text: str) -> np.ndarray:
-            tokens = text.lower().split()
-            vec = np.array(
-                [
-                    sum(t in self.KEYWORDS0 for t in tokens),
-                    sum(t in self.KEYWORDS1 for t in tokens),
-                ],
-                dtype=np.float32,
-            )
-            if not vec.any():
-                vec = np.array([len(tokens), 0.0], dtype=np.float32)
-            return vec
-
-        def get_sentence_embedding_dimension(self) -> int:
-            return 2
-
-    model = DummyModel()
+def inverted_index(model, node0, node1) -> InvertedIndex:
     inverted_index = InvertedIndex(model=model)
     inverted_index.insert(node0)
     inverted_index.insert(node1)
@@ -86,3 +40,212 @@ def test_paraphrase_minilm_model_simple_example():
         "requires downloading a large SentenceTransformer model",
         allow_module_level=False,
     )
+
+
+def test_top_k_lexical(inverted_index, node0, node1):
+    def encode(text):
+        raise AssertionError("lexical search must not run the model")
+
+    inverted_index._model.encode = encode
+    results = inverted_index.top_k("placeholder typeface", mode="lexical")
+    assert [r.id for r in results] == [node0.id]
+    assert results[0].url == node0.url
+    assert results[0].score > 0
+
+    results = inverted_index.top_k("type hints", mode="lexical")
+    assert [r.id for r in results] == [node1.id]
+
+    assert inverted_index.top_k("nonexistentterm", mode="lexical") == []
+
+
+def test_top_k_unknown_mode(inverted_index):
+    with pytest.raises(ValueError):
+        inverted_index.top_k("lorem", mode="fuzzy")
+
+
+@pytest.mark.parametrize("fusion", ["rrf", "weighted"])
+@pytest.mark.parametrize("parallel", [False, True])
+def test_top_k_hybrid(inverted_index, node0, node1, fusion, parallel):
+    results = inverted_index.top_k(
+        "placeholder iterators", mode="hybrid", fusion=fusion, parallel=parallel
+    )
+    assert {r.id for r in results} == {node0.id, node1.id}
+
+    results = inverted_index.top_k(
+        "placeholder iterators",
+        mode="hybrid",
+        fusion=fusion,
+        lexical_weight=0.0,
+        parallel=parallel,
+    )
+    assert results[0].id == node1.id
+
+    results = inverted_index.top_k(
+        "placeholder iterators",
+        mode="hybrid",
+        fusion=fusion,
+        vector_weight=0.0,
+        parallel=parallel,
+    )
+    assert results[0].id == node0.id
+
+
+def test_insert_many(model, node0, node1):
+    calls = []
+    encode = model.encode
+
+    def counting_encode(text, batch_size=32):
+        if isinstance(text, list):
+            calls.append((text, batch_size))
+        return encode(text, batch_size)
+
+    model.encode = counting_encode
+    inverted_index = InvertedIndex(model=model)
+    inverted_index.insert_many([node0, node1], batch_size=8)
+    assert calls == [([node0.text, node1.text], 8)]
+    assert inverted_index.total_docs == 2
+    assert inverted_index.top_k("ipsum")[0].id == node0.id
+    assert inverted_index.top_k("type hint", mode="lexical")[0].id == node1.id
+
+
+def test_query_embedding_cache(inverted_index, node0):
+    calls = []
+    encode = inverted_index._model.encode
+
+    def counting_encode(text, batch_size=32):
+        calls.append(text)
+        return encode(text, batch_size)
+
+    inverted_index._model.encode = counting_encode
+    assert inverted_index.warm_query_cache(["lorem ipsum", "type hint"]) == 2
+    assert calls == [["lorem ipsum", "type hint"]]
+    assert inverted_index.top_k("lorem  ipsum")[0].id == node0.id
+    assert inverted_index.top_k("lorem ipsum")[0].id == node0.id
+    assert calls == [["lorem ipsum", "type hint"]]
+    assert inverted_index.query_cache.stats()["hits"] == 2
+
+    inverted_index.top_k("ipsum")
+    inverted_index.top_k("ipsum")
+    assert calls[1:] == ["ipsum"]
+
+
+@pytest.mark.parametrize("mode", ["vector", "lexical", "hybrid"])
+def test_top_k_many(inverted_index, mode):
+    queries = ["lorem ipsum", "type hint", "iterators", "lorem ipsum"]
+    calls = []
+    encode = inverted_index._model.encode
+
+    def counting_encode(text, batch_size=32):
+        calls.append(text)
+        return encode(text, batch_size)
+
+    inverted_index._model.encode = counting_encode
+    many = inverted_index.top_k_many(queries, k=2, mode=mode)
+    if mode != "lexical":
+        # every distinct query is embedded in one call
+        assert calls == [["lorem ipsum", "type hint", "iterators"]]
+    assert many == [inverted_index.top_k(query, k=2, mode=mode) for query in queries]
+    assert inverted_index.top_k_many([], mode=mode) == []
+    with pytest.raises(ValueError):
+        inverted_index.top_k_many(queries, mode="unknown")
+
+
+def test_index_config(model, node0, node1, tmp_path):
+    config = IndexConfig(max_elements=10, ef_construction=50, M=8, ef_search=4)
+    inverted_index = InvertedIndex(model=model, config=config)
+    inverted_index.insert(node0)
+    inverted_index.insert(node1)
+    assert inverted_index._vectors._hnsw.get_max_elements() == 10
+    assert [r.id for r in inverted_index.top_k("lorem", 1, mode="vector")] == [node0.id]
+    # a per-query ef overrides the configured one
+    assert [r.id for r in inverted_index.top_k("lorem", 1, mode="vector", ef=2)] == [
+        node0.id
+    ]
+
+    inverted_index.save(str(tmp_path / "snapshot"))
+    loaded = InvertedIndex.load(str(tmp_path / "snapshot"), model=model)
+    assert loaded.config == config
+
+
+def test_upsert(inverted_index, node0, node1):
+    recrawled = Node(raw_url=node0.url, text="type hint lorem", title="new title")
+    inverted_index.insert(recrawled)
+    assert inverted_index.total_docs == 2
+    assert inverted_index.num_deleted == 1
+    for mode in ("vector", "lexical", "hybrid"):
+        results = inverted_index.top_k("lorem type", 10, mode=mode)
+        assert sorted(r.id for r in results) == sorted([node0.id, node1.id])
+        assert [r.title for r in results if r.id == node0.id] == ["new title"]
+    # only the last of the same document in one batch is kept
+    inverted_index.insert_many([node0, recrawled])
+    assert inverted_index.total_docs == 2
+    assert inverted_index.top_k("publishing", mode="lexical") == []
+
+
+def test_delete(inverted_index, node0, node1):
+    assert inverted_index.delete(node0.id)
+    assert not inverted_index.delete(node0.id)
+    assert inverted_index.total_docs == 1
+    for mode in ("vector", "lexical", "hybrid"):
+        results = inverted_index.top_k("lorem ipsum", 10, mode=mode)
+        assert node0.id not in [r.id for r in results]
+    assert inverted_index.delete_many([node1.id, "missing"]) == 1
+    assert inverted_index.top_k("lorem") == []
+
+
+@pytest.mark.parametrize("backend", ["hnsw", "flat"])
+def test_compact(model, node0, node1, backend):
+    inverted_index = InvertedIndex(
+        model=model, config=IndexConfig(vector_backend=backend)
+    )
+    untitled = Node(raw_url="https://no.text", text=None)
+    inverted_index.insert_many([node0, untitled, node1])
+    inverted_index.delete_many([node0.id, untitled.id])
+    inverted_index.insert(node0)
+    expected = inverted_index.top_k("lorem ipsum", mode="hybrid")
+    inverted_index.compact()
+    assert inverted_index.num_deleted == 0
+    assert inverted_index.total_docs == 2
+    assert inverted_index.id_to_label == {node1.id: 0, node0.id: 1}
+    assert inverted_index.top_k("lorem ipsum", mode="hybrid") == expected
+
+
+@pytest.mark.parametrize("backend", ["hnsw", "flat"])
+def test_writable_snapshot(model, node0, node1, tmp_path, backend):
+    inverted_index = InvertedIndex(
+        model=model, config=IndexConfig(vector_backend=backend)
+    )
+    inverted_index.insert_many([node0, node1])
+    inverted_index.delete(node0.id)
+    inverted_index.save(str(tmp_path / "0"))
+
+    loaded = InvertedIndex.load(str(tmp_path / "0"), model=model)
+    assert loaded.total_docs == 1
+    assert [r.id for r in loaded.top_k("lorem ipsum", mode="hybrid")] == [node1.id]
+    with pytest.raises(TypeError):
+        loaded.delete(node1.id)
+    # fingerprints are mapped from the snapshot, not derived from the ids
+    assert isinstance(loaded.fingerprints, np.memmap)
+    assert loaded.fingerprints.tolist() == [node0.fingerprint, node1.fingerprint]
+
+    writable = InvertedIndex.load(str(tmp_path / "0"), model=model, writable=True)
+    writable.insert(node0)
+    writable.insert(node1)
+    assert writable.total_docs == 2
+    assert writable.num_deleted == 2
+    writable.save(str(tmp_path / "1"))
+    expected = [writable.top_k("lorem", 2, mode=mode) for mode in ("vector", "lexical")]
+    writable.compact()
+    writable.save(str(tmp_path / "2"))
+    # compaction only changes the document frequencies of the lexical scores
+    assert [r.id for r in writable.top_k("lorem", 2, mode="lexical")] == [
+        r.id for r in expected[1]
+    ]
+    for dir in ("1", "2"):
+        reloaded = InvertedIndex.load(str(tmp_path / dir), model=model)
+        assert [
+            reloaded.top_k("lorem", 2, mode=mode) for mode in ("vector", "lexical")
+        ] == expected
+        expected = [
+            writable.top_k("lorem", 2, mode=mode) for mode in ("vector", "lexical")
+        ]
@@ -0,0 +1,130 @@
+import tempfile
+
+import numpy as np
+import pytest
+
+from search.postings import CorpusStats, FrozenPostings, Postings
+
+
+@pytest.fixture
+def postings() -> Postings:
+    postings = Postings()
+    postings.add(0, {"lorem": 1, "ipsum": 1}, 2)
+    postings.add(1, {"ipsum": 1, "iterator": 3, "type": 1}, 5)
+    postings.add(3, {"iterator": 2}, 2)
+    return postings
+
+
+def test_add(postings):
+    assert len(postings) == 4
+    assert postings.num_docs == 3
+    assert postings.avg_doc_length == 3.0
+    assert list(postings.get("ipsum").doc_ordinals) == [0, 1]
+    assert list(postings.get("iterator").doc_ordinals) == [1, 3]
+    assert list(postings.get("iterator").term_freqs) == [3, 2]
+    assert postings.get("missing") is None
+    assert postings.doc_freq("missing") == 0
+    assert postings.doc_length(2) == 0
+    assert postings.doc_length(3) == 2
+
+
+def test_add_out_of_order(postings):
+    with pytest.raises(ValueError):
+        postings.add(2, {"lorem": 1}, 1)
+
+
+def test_bm25(postings):
+    assert [ordinal for ordinal, _ in postings.bm25(["lorem"], 10)] == [0]
+    assert [ordinal for ordinal, _ in postings.bm25(["iterator"], 10)] == [3, 1]
+    assert [ordinal for ordinal, _ in postings.bm25(["ipsum", "type"], 1)] == [1]
+    assert postings.bm25(["missing"], 10) == []
+    exclude = np.array([3])
+    assert [
+        ordinal for ordinal, _ in postings.bm25(["iterator"], 1, None, exclude)
+    ] == [1]
+    assert postings.bm25(["lorem"], 10, None, np.array([0])) == []
+    assert Postings().bm25(["lorem"], 10) == []
+
+
+def test_idf(postings):
+    assert postings.idf("lorem") > postings.idf("ipsum")
+
+
+def test_save_frozen(postings):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        stats = postings.save(temp_dir)
+        frozen = FrozenPostings(temp_dir, stats)
+        assert len(frozen) == len(postings)
+        assert frozen.terms() == postings.terms()
+        assert "lorem" in frozen
+        assert "missing" not in frozen
+        assert frozen.num_docs == postings.num_docs
+        assert frozen.avg_doc_length == postings.avg_doc_length
+        assert list(frozen.get("iterator").doc_ordinals) == [1, 3]
+        assert list(frozen.get("iterator").term_freqs) == [3, 2]
+        assert frozen.get("missing") is None
+        assert frozen.doc_length(3) == 2
+        for terms in (["lorem"], ["iterator"], ["ipsum", "type"], ["missing"]):
+            assert frozen.bm25(terms, 10) == postings.bm25(terms, 10)
+        with pytest.raises(TypeError):
+            frozen.add(4, {"lorem": 1}, 1)
+
+
+def test_delete(postings):
+    postings.delete(1)
+    postings.delete(1)
+    assert postings.num_docs == 2
+    assert postings.num_deleted == 1
+    assert postings.avg_doc_length == 2.0
+    assert [ordinal for ordinal, _ in postings.bm25(["iterator", "ipsum"], 10)] == [
+        3,
+        0,
+    ]
+    assert postings.bm25(["type"], 10) == []
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        frozen = FrozenPostings(temp_dir, postings.save(temp_dir))
+        assert frozen.num_deleted == 1
+        assert frozen.bm25(["iterator"], 10) == postings.bm25(["iterator"], 10)
+        with pytest.raises(TypeError):
+            frozen.delete(0)
+        thawed = frozen.thaw()
+    thawed.add(4, {"type": 1}, 1)
+    assert [ordinal for ordinal, _ in thawed.bm25(["type"], 10)] == [4]
+
+
+def test_compacted(postings):
+    postings.delete(1)
+    compacted = postings.compacted(np.array([0, -1, -1, 1]))
+    assert compacted.num_docs == 2
+    assert compacted.num_deleted == 0
+    assert compacted.terms() == ["ipsum", "iterator", "lorem"]
+    assert list(compacted.get("iterator").doc_ordinals) == [1]
+    assert compacted.doc_length(1) == 2
+    # scored as if the deleted document had never been added
+    rebuilt = Postings()
+    rebuilt.add(0, {"lorem": 1, "ipsum": 1}, 2)
+    rebuilt.add(1, {"iterator": 2}, 2)
+    for terms in (["lorem"], ["iterator", "ipsum"], ["type"]):
+        assert compacted.bm25(terms, 10) == rebuilt.bm25(terms, 10)
+
+
+def test_merged_and_corpus_stats(postings):
+    other = Postings()
+    other.add(0, {"type": 2, "lorem": 1}, 3)
+    merged = Postings.merged([postings, other], [np.arange(4), np.array([4])])
+    assert merged.num_docs == 4
+    assert list(merged.get("lorem").doc_ordinals) == [0, 4]
+    assert merged.doc_length(4) == 3
+
+    # parts scored with the statistics of both score like the merged postings
+    terms = ["lorem", "type"]
+    stats = CorpusStats.of([postings, other], terms)
+    assert stats.num_docs == 4
+    assert stats.doc_freqs == {"lorem": 2, "type": 2}
+    hits = postings.bm25(terms, 10, stats) + [
+        (4, score) for _, score in other.bm25(terms, 10, stats)
+    ]
+    assert sorted(hits, key=lambda hit: -hit[1]) == pytest.approx(
+        merged.bm25(terms, 10)
+    )
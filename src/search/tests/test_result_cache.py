@@ -0,0 +1,82 @@
+import redis
+
+from search.result_cache import (
+    RedisResultCache,
+    ResultCache,
+    make_result_cache,
+    result_cache_key,
+)
+
+RESULTS = [dict(id="abc", url="https://some.page", title="some page", score=0.5)]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = dict()
+        self.expiries = dict()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode()
+        self.expiries[key] = ex
+
+
+class BrokenRedis:
+    def get(self, key):
+        raise redis.ConnectionError("down")
+
+    def set(self, key, value, ex=None):
+        raise redis.ConnectionError("down")
+
+
+def test_result_cache_key():
+    key = result_cache_key("gen1", "lorem  ipsum", k=10, mode="hybrid")
+    assert key == result_cache_key("gen1", "lorem ipsum", mode="hybrid", k=10)
+    assert key != result_cache_key("gen2", "lorem ipsum", k=10, mode="hybrid")
+    assert key != result_cache_key("gen1", "lorem ipsum", k=5, mode="hybrid")
+    assert key != result_cache_key("gen1", "lorem ipsum", k=10, mode="vector")
+
+
+def test_result_cache():
+    now = [0.0]
+    cache = ResultCache(max_size=2, ttl_seconds=10.0, clock=lambda: now[0])
+    assert cache.get("a") is None
+    cache.put("a", RESULTS)
+    cache.put("b", [])
+    assert cache.get("a") == RESULTS
+    cache.put("c", [])
+    assert cache.get("b") is None
+    assert len(cache) == 2
+    now[0] = 11.0
+    assert cache.get("a") is None
+    assert cache.stats() == dict(backend="memory", size=1, max_size=2, hits=1, misses=3)
+
+
+def test_redis_result_cache():
+    client = FakeRedis()
+    cache = RedisResultCache("redis://unused", ttl_seconds=30.0, client=client)
+    assert cache.get("a") is None
+    cache.put("a", RESULTS)
+    assert client.expiries == {"search-results:a": 30}
+    assert cache.get("a") == RESULTS
+    # a second replica sees the same entry
+    assert RedisResultCache("redis://unused", client=client).get("a") == RESULTS
+    assert cache.stats() == dict(backend="redis", hits=1, misses=1)
+
+
+def test_redis_result_cache_unavailable():
+    cache = RedisResultCache("redis://unused", client=BrokenRedis())
+    cache.put("a", RESULTS)
+    assert cache.get("a") is None
+
+
+def test_make_result_cache():
+    assert make_result_cache(None, "redis://unused", 10, 1.0) is None
+    assert isinstance(
+        make_result_cache("memory", "redis://unused", 10, 1.0), ResultCache
+    )
+    assert isinstance(
+        make_result_cache("redis", "redis://unused", 10, 1.0), RedisResultCache
+    )
@@ -0,0 +1,115 @@
+from dataclasses import astuple
+
+import pytest
+
+from search.inverted_index import InvertedIndex
+from search.segmented_index import SegmentedIndex
+from search.vector_index import IndexConfig
+from web_crawler.node import Node
+
+QUERIES = ["lorem ipsum", "type hint iterators", "placeholder", "missing"]
+
+
+@pytest.fixture
+def nodes(node0, node1) -> list[Node]:
+    return [
+        node0,
+        node1,
+        Node("https://lorem.ipsum", text="lorem ipsum placeholder", title="lorem"),
+        Node("https://type.hints", text="type hint iterators", title=None),
+        Node("https://no.text", text=None, title="no text"),
+    ]
+
+
+@pytest.fixture(params=["hnsw", "flat"])
+def backend(request) -> str:
+    return request.param
+
+
+def _index(model, nodes: list[Node], backend: str = "hnsw") -> InvertedIndex:
+    index = InvertedIndex(model=model, config=IndexConfig(vector_backend=backend))
+    index.insert_many(nodes)
+    return index
+
+
+def _results(index, query: str, **kwargs) -> list[tuple]:
+    return [astuple(r) for r in index.top_k(query, **kwargs)]
+
+
+@pytest.mark.parametrize("mode", ["lexical", "vector"])
+def test_top_k_like_one_index(model, nodes, mode):
+    single = _index(model, nodes)
+    segmented = SegmentedIndex([_index(model, nodes[:2]), _index(model, nodes[2:])])
+    assert segmented.total_docs == single.total_docs
+    for query in QUERIES:
+        # documents with the same score may come in either order
+        for k in (1, 3):
+            assert [r.score for r in segmented.top_k(query, k=k, mode=mode)] == (
+                pytest.approx([r.score for r in single.top_k(query, k=k, mode=mode)])
+            )
+        assert sorted(_results(segmented, query, mode=mode)) == pytest.approx(
+            sorted(_results(single, query, mode=mode))
+        )
+    assert [
+        sorted(astuple(r) for r in results)
+        for results in segmented.top_k_many(QUERIES, mode=mode)
+    ] == [sorted(_results(single, query, mode=mode)) for query in QUERIES]
+
+
+def test_top_k_hybrid(model, nodes):
+    single = _index(model, nodes)
+    segmented = SegmentedIndex([_index(model, nodes[:2]), _index(model, nodes[2:])])
+    for query in QUERIES:
+        # ties of the vector scores may fuse into different ranks
+        assert {r.id for r in segmented.top_k(query, mode="hybrid")} == {
+            r.id for r in single.top_k(query, mode="hybrid")
+        }
+    assert segmented.top_k("placeholder", k=1, mode="hybrid")[0].id == nodes[2].id
+
+
+def test_newer_segment_shadows(model, nodes, backend):
+    old = Node(nodes[2].url, text="type hint iterators", title="old")
+    segmented = SegmentedIndex(
+        [_index(model, [old, nodes[3]], backend), _index(model, nodes[2:3], backend)]
+    )
+    assert segmented.total_docs == 2
+    assert segmented.num_shadowed == 1
+    assert segmented.segments[1].fingerprints.tolist() == [nodes[2].fingerprint]
+    results = segmented.top_k("type hint iterators", mode="lexical")
+    assert [r.title for r in results] == [None]
+    # the shadowed copy matches best but is skipped inside its segment
+    for mode in ("lexical", "vector"):
+        results = segmented.top_k("type hint iterators", k=1, mode=mode)
+        assert [r.id for r in results] == [nodes[3].id]
+    results = segmented.top_k("lorem", mode="vector")
+    assert [r.title for r in results] == ["lorem", None]
+
+
+def test_shadowed_documents_without_text(model, nodes, backend):
+    other = Node("https://other.no.text", text=None, title="other")
+    # shadowed copies without a vector in the middle and at the end
+    older = _index(model, [nodes[0], nodes[4], nodes[1], other], backend)
+    newer = _index(model, [nodes[4], other], backend)
+    segmented = SegmentedIndex([older, newer])
+    assert segmented.num_shadowed == 2
+    for mode in ("vector", "hybrid"):
+        ids = {r.id for r in segmented.top_k("lorem ipsum", mode=mode)}
+        assert ids == {nodes[0].id, nodes[1].id}
+
+
+def test_delete_hides_older_copies(model, nodes, backend):
+    newer = _index(model, nodes[2:4], backend)
+    newer.delete(nodes[2].id)
+    segmented = SegmentedIndex([_index(model, nodes[:3], backend), newer])
+    assert segmented.total_docs == 3
+    for mode in ("lexical", "vector", "hybrid"):
+        ids = [r.id for r in segmented.top_k("lorem ipsum placeholder", mode=mode)]
+        assert nodes[2].id not in ids
+
+
+def test_empty_segments(model):
+    segmented = SegmentedIndex([InvertedIndex(model=model)])
+    assert segmented.total_docs == 0
+    assert segmented.top_k("lorem") == []
+    with pytest.raises(ValueError):
+        SegmentedIndex([])
@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from search.snapshot import (
+    StringTable,
+    open_array,
+    read_meta,
+    write_array,
+    write_meta,
+    write_strings,
+)
+
+
+def test_arrays():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        write_array(temp_dir, "numbers", [3, 1, 2], np.uint32)
+        write_array(temp_dir, "empty", [], np.uint32)
+        numbers = open_array(temp_dir, "numbers", np.uint32)
+        assert isinstance(numbers, np.memmap)
+        assert numbers.tolist() == [3, 1, 2]
+        assert not numbers.flags.writeable
+        assert open_array(temp_dir, "empty", np.uint32).tolist() == []
+
+
+def test_string_table():
+    strings = sorted(["apple", "", "zebra", "über", "banana"], key=str.encode)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        write_strings(temp_dir, "words", strings)
+        table = StringTable(temp_dir, "words")
+        assert len(table) == 5
+        assert list(table) == strings
+        assert table[strings.index("über")] == "über"
+        for i, string in enumerate(strings):
+            assert table.index(string) == i
+        assert table.index("cherry") is None
+        assert table.index("zzz") is None
+        with pytest.raises(IndexError):
+            table[5]
+
+        write_strings(temp_dir, "nothing", [])
+        empty = StringTable(temp_dir, "nothing")
+        assert len(empty) == 0
+        assert empty.index("apple") is None
+
+
+def test_meta():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        write_meta(temp_dir, dict(model_name="some-model"))
+        assert read_meta(temp_dir)["model_name"] == "some-model"
+
+        with open(os.path.join(temp_dir, "meta.json"), "w") as file:
+            json.dump(dict(format_version=0), file)
+        with pytest.raises(ValueError):
+            read_meta(temp_dir)
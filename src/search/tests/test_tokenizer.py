@@ -1,4 +1,25 @@
-from search.tokenizer import tokenize
+import string
+import types
+
+from nltk.corpus import stopwords
+from nltk.tokenize import word_tokenize
+
+from search.tokenizer import LEMMATIZER, iter_tokens, tokenize, tokenize_many
+
+TEXTS = [
+    "In publishing and graphic design, Lorem ipsum is a placeholder text.",
+    "Iterators (and iterables) -- the typing module's Iterator ... return them!",
+    "",
+]
+
+
+def _reference_tokenize(text: str) -> list[str]:
+    tokens = [word.lower() for word in word_tokenize(text)]
+    return [
+        LEMMATIZER.lemmatize(word)
+        for word in tokens
+        if word not in stopwords.words("english") and word not in string.punctuation
+    ]
 
 
 def test_tokenize():
@@ -28,3 +49,18 @@ def test_tokenize():
         "content",
     ]
     assert list(tokenize(text)) == expected
+
+
+def test_matches_reference():
+    for text in TEXTS:
+        assert tokenize(text) == _reference_tokenize(text)
+
+
+def test_iter_tokens():
+    tokens = iter_tokens(TEXTS[0])
+    assert isinstance(tokens, types.GeneratorType)
+    assert list(tokens) == tokenize(TEXTS[0])
+
+
+def test_tokenize_many():
+    assert tokenize_many(TEXTS) == [tokenize(text) for text in TEXTS]
@@ -0,0 +1,223 @@
+import threading
+
+import numpy as np
+import pytest
+
+from search.benchmark import brute_force_knn, recall_at_k
+from search.inverted_index import InvertedIndex
+from search.vector_index import FlatVectorIndex, HnswVectorIndex, IndexConfig
+from search.vector_index import _EfGate
+from search.vector_index import load_vector_index, make_vector_index
+
+
+@pytest.fixture
+def data() -> np.ndarray:
+    return np.random.default_rng(0).normal(size=(300, 8)).astype(np.float32)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_flat_search(data, dtype):
+    index = FlatVectorIndex(8, IndexConfig(flat_dtype=dtype, rerank_factor=0))
+    # labels need not be ordinals, and the matrix grows as vectors are added
+    index.add(data[:100], np.arange(100) + 1000)
+    index.add(data[100:], np.arange(100, 300) + 1000)
+    assert len(index) == 300
+
+    queries = data[:5] + 0.01
+    hits = index.search(queries, 5, ef=None, num_threads=1)
+    ground_truth = brute_force_knn(data, queries, 5) + 1000
+    assert [row[0][0] for row in hits] == ground_truth[:, 0].tolist()
+    if dtype == "float32":
+        assert [[label for label, _ in row] for row in hits] == ground_truth.tolist()
+    for row in hits:
+        scores = [score for _, score in row]
+        assert scores == sorted(scores, reverse=True)
+        assert scores[0] == pytest.approx(1.0, abs=0.02)
+
+
+def test_flat_save_load(data, tmp_path):
+    config = IndexConfig(flat_dtype="int8", rerank_factor=0)
+    index = FlatVectorIndex(8, config)
+    index.add(data, np.arange(300))
+    index.save(str(tmp_path))
+    loaded = FlatVectorIndex.load(str(tmp_path), 8, config)
+    assert len(loaded) == 300
+    assert loaded.search(data[:3], 3, None, 1) == index.search(data[:3], 3, None, 1)
+    embeddings, labels = loaded.items()
+    assert labels.tolist() == list(range(300))
+    cosine = np.sum(embeddings * data, axis=1) / np.linalg.norm(data, axis=1)
+    assert cosine.min() > 0.99
+
+
+@pytest.mark.parametrize("dtype", ["int8", "pq"])
+def test_rerank(data, dtype, tmp_path):
+    config = IndexConfig(
+        flat_dtype=dtype, rerank_factor=8, pq_subvectors=4, pq_train_size=200
+    )
+    index = FlatVectorIndex(8, config)
+    index.add(data[:100], np.arange(100))
+    index.add(data[100:], np.arange(100, 300))
+    queries = data[:20] + 0.05
+    ground_truth = brute_force_knn(data, queries, 5)
+    for index in [index, _save_load(index, tmp_path, config)]:
+        hits = index.search(queries, 5, None, 1)
+        labels = np.array([[label for label, _ in row] for row in hits])
+        assert recall_at_k(labels, ground_truth) >= 0.9
+        # re-ranked scores are exact cosine similarities
+        label, score = hits[0][0]
+        cosine = queries[0] @ data[label]
+        cosine /= np.linalg.norm(queries[0]) * np.linalg.norm(data[label])
+        assert score == pytest.approx(cosine, abs=1e-5)
+    assert isinstance(index._full, np.memmap)
+
+
+def test_pq_untrained(data, tmp_path):
+    config = IndexConfig(flat_dtype="pq", pq_subvectors=4, pq_train_size=1000)
+    index = FlatVectorIndex(8, config)
+    index.add(data, np.arange(300))
+    # scans exactly until there are enough vectors to train on
+    assert index._codebooks is None
+    hits = index.search(data[:3], 1, None, 1)
+    assert [row[0][0] for row in hits] == [0, 1, 2]
+    # saving trains on what is there
+    loaded = _save_load(index, tmp_path, config)
+    assert loaded._codebooks.shape == (4, 256, 2)
+    assert index.code_bytes == loaded.code_bytes == 300 * (4 + 4)
+
+    with pytest.raises(ValueError):
+        FlatVectorIndex(6, IndexConfig(flat_dtype="pq", pq_subvectors=4))
+
+
+def _save_load(index, tmp_path, config) -> FlatVectorIndex:
+    index.save(str(tmp_path))
+    return FlatVectorIndex.load(str(tmp_path), index.dim, config)
+
+
+def test_empty(data):
+    for index in [FlatVectorIndex(8), HnswVectorIndex(8, IndexConfig())]:
+        assert index.search(data[:2], 5, None, 1) == [[], []]
+
+
+def test_invalid_config():
+    with pytest.raises(ValueError):
+        IndexConfig(vector_backend="faiss")
+    with pytest.raises(ValueError):
+        IndexConfig(flat_dtype="int4")
+
+
+def test_auto_backend(model, node0, node1):
+    config = IndexConfig(vector_backend="auto", flat_max_docs=1)
+    inverted_index = InvertedIndex(model=model, config=config)
+    inverted_index.insert(node0)
+    assert inverted_index.vector_backend == "flat"
+    inverted_index.insert(node1)
+    assert inverted_index.vector_backend == "hnsw"
+    assert [r.id for r in inverted_index.top_k("lorem", 1, mode="vector")] == [node0.id]
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+def test_flat_inverted_index(model, node0, node1, tmp_path, dtype):
+    config = IndexConfig(vector_backend="flat", flat_dtype=dtype)
+    inverted_index = InvertedIndex(model=model, config=config)
+    inverted_index.insert_many([node0, node1])
+    inverted_index.save(str(tmp_path / "snapshot"))
+    loaded = InvertedIndex.load(str(tmp_path / "snapshot"), model=model)
+    assert loaded.vector_backend == "flat"
+    for index in [inverted_index, loaded]:
+        assert [r.id for r in index.top_k("type hint", 2, mode="vector")] == [
+            node1.id,
+            node0.id,
+        ]
+
+
+@pytest.mark.parametrize("backend", ["hnsw", "flat"])
+def test_delete(data, tmp_path, backend):
+    config = IndexConfig(vector_backend=backend, max_elements=300)
+    index = make_vector_index(backend, 8, config)
+    index.add(data, np.arange(300))
+    index.delete(np.array([0, 1, 2]))
+    assert len(index) == 297
+    hits = index.search(data[:3], 1, None, 1)
+    assert all(row[0][0] not in (0, 1, 2) for row in hits)
+    assert 0 not in index.labels()
+    assert len(index.items()[0]) == 297
+    index.save(str(tmp_path))
+    loaded = load_vector_index(backend, str(tmp_path), 8, config, writable=True)
+    assert len(loaded) == 297
+    assert loaded.search(data[:3], 5, None, 1) == index.search(data[:3], 5, None, 1)
+    # new vectors take the place of the deleted ones
+    loaded.add(data[:3], np.arange(300, 303))
+    assert len(loaded) == 300
+    assert [row[0][0] for row in loaded.search(data[:3], 1, None, 1)] == [
+        300,
+        301,
+        302,
+    ]
+    if backend == "hnsw":
+        assert loaded._hnsw.get_current_count() == 300
+
+
+@pytest.mark.parametrize(
+    "backend, dtype", [("hnsw", "float32"), ("flat", "float32"), ("flat", "int8")]
+)
+def test_search_exclude(data, backend, dtype):
+    config = IndexConfig(vector_backend=backend, flat_dtype=dtype, max_elements=300)
+    index = make_vector_index(backend, 8, config)
+    index.add(data, np.arange(300))
+    exclude = np.arange(0, 300, 2)
+    hits = index.search(data[:4], 5, None, 1, exclude)
+    assert [len(row) for row in hits] == [5] * 4
+    assert all(label % 2 == 1 for row in hits for label, _ in row)
+    assert [row[0][0] for row in hits[1::2]] == [1, 3]
+    # never more hits than labels that are not excluded
+    assert len(index.search(data[:1], 300, None, 1, exclude)[0]) == 150
+    assert index.search(data[:1], 5, None, 1, np.arange(300)) == [[]]
+    if backend == "flat":
+        # labels without a vector, in between and after the last row
+        index = make_vector_index(backend, 8, config)
+        index.add(data[:3], np.array([0, 2, 4]))
+        hits = index.search(data[:1], 5, None, 1, np.array([1, 3, 5]))
+        assert sorted(label for label, _ in hits[0]) == [0, 2, 4]
+
+
+def test_hnsw_reuses_deleted_slots(data):
+    index = make_vector_index("hnsw", 8, IndexConfig(max_elements=10))
+    index.add(data[:10], np.arange(10))
+    index.delete(np.array([0, 1, 2]))
+    index.add(data[10:12], np.arange(10, 12))
+    assert len(index) == 9
+    assert index._hnsw.get_current_count() == 10
+    labels = set(index.labels().tolist())
+    assert labels >= set(range(3, 12)) and len(labels) == 9
+    index.add(data[12:14], np.arange(12, 14))
+    assert len(index) == 11
+    assert sorted(index.labels().tolist()) == list(range(3, 14))
+
+
+def test_ef_gate():
+    graph = type("Graph", (), dict(set_ef=lambda self, ef: efs.append(ef)))()
+    gate, efs, searched = _EfGate(), [], []
+
+    def search(ef):
+        with gate.searching(graph, ef):
+            searched.append(ef)
+
+    def start(ef) -> threading.Thread:
+        thread = threading.Thread(target=search, args=(ef,))
+        thread.start()
+        thread.join(0.2)
+        return thread
+
+    with gate.searching(graph, 64):
+        # a search at the same ef runs right away
+        search(64)
+        override = start(128)
+        assert override.is_alive()
+        # and later ones queue behind the waiting override
+        late = start(64)
+        assert late.is_alive()
+        assert searched == [64]
+    override.join(1)
+    late.join(1)
+    assert sorted(searched[1:]) == [64, 128]
+    assert efs[0] == 64 and 128 in efs
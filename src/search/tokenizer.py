@@ -1,4 +1,5 @@
-from typing import Iterator
+from functools import cache, lru_cache
+from typing import Iterable, Iterator
 
 # import re
 #
@@ -24,11 +25,34 @@ nltk.download("wordnet", quiet=True)
 
 LEMMATIZER = WordNetLemmatizer()
 
+# Distinct words are a tiny fraction of the words in a crawl, so lemmas are
+# memoized; the bound keeps long-tail junk tokens from growing it forever.
+LEMMA_CACHE_SIZE = 2**17
 
-def tokenize(text: str) -> Iterator[str]:
-    tokens = [word.lower() for word in word_tokenize(text)]
-    return [
-        LEMMATIZER.lemmatize(word)
-        for word in tokens
-        if word not in stopwords.words("english") and word not in string.punctuation
-    ]
+
+@cache
+def stopword_set() -> frozenset[str]:
+    return frozenset(stopwords.words("english"))
+
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize(word: str) -> str:
+    return LEMMATIZER.lemmatize(word)
+
+
+def iter_tokens(text: str) -> Iterator[str]:
+    stop_words = stopword_set()
+    for word in word_tokenize(text):
+        word = word.lower()
+        # substring test on purpose: it also drops runs like "()" or "--"
+        if word in stop_words or word in string.punctuation:
+            continue
+        yield lemmatize(word)
+
+
+def tokenize(text: str) -> list[str]:
+    return list(iter_tokens(text))
+
+
+def tokenize_many(texts: Iterable[str]) -> list[list[str]]:
+    return [tokenize(text) for text in texts]
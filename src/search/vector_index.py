@@ -0,0 +1,509 @@
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import hnswlib
+import numpy as np
+
+from search.quantization import (
+    pq_decode,
+    pq_encode,
+    pq_lookup_tables,
+    pq_scores,
+    quantize_int8,
+    train_codebooks,
+)
+from search.snapshot import open_array, write_array
+
+VECTOR_BACKENDS = ("hnsw", "flat", "auto")
+FLAT_DTYPES = ("float32", "float16", "int8", "pq")
+# rows of a compressed matrix scored at a time
+_BLOCK_ROWS = 1 << 12
+
+Hits = list[list[tuple[int, float]]]
+
+
+@dataclass
+class IndexConfig:
+    """IndexConfig
+
+    Vector index parameters. `vector_backend` is "hnsw", "flat" for a scan
+    over a matrix compressed as `flat_dtype` (see `FlatVectorIndex`), or
+    "auto", which scans flat until the index holds more than `flat_max_docs`
+    vectors and builds an HNSW graph from then on.
+
+    `M` and `ef_construction` trade HNSW build time and memory for graph
+    quality and are fixed once the graph is built; `ef_search` is the size of
+    the candidate list at query time, never less than `k`, and trades latency
+    for recall. `search.benchmark` measures the trade-offs.
+    """
+
+    max_elements: int = field(default=100_000)
+    ef_construction: int = field(default=200)
+    M: int = field(default=16)
+    ef_search: int = field(default=64)
+    vector_backend: str = field(default="hnsw")
+    flat_dtype: str = field(default="float32")
+    flat_max_docs: int = field(default=200_000)
+    rerank_factor: int = field(default=10)
+    pq_subvectors: int = field(default=48)
+    pq_train_size: int = field(default=10_000)
+
+    def __post_init__(self):
+        if self.vector_backend not in VECTOR_BACKENDS:
+            raise ValueError(f"Unknown vector backend: {self.vector_backend}")
+        if self.flat_dtype not in FLAT_DTYPES:
+            raise ValueError(f"Unknown flat vector dtype: {self.flat_dtype}")
+
+    def backend_for(self, num_vectors: int) -> str:
+        if self.vector_backend != "auto":
+            return self.vector_backend
+        return "flat" if num_vectors <= self.flat_max_docs else "hnsw"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+class _EfGate:
+    """_EfGate
+
+    The candidate list size is a setting of an hnswlib graph, not of a
+    search. Searches at the same `ef` share the graph and run at once, hnswlib
+    releases the GIL while searching; a search at another `ef` waits until
+    they are done to change it. Searches that come in while it waits queue
+    behind it, so an override is not starved by a steady stream of searches.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._ef: int | None = None
+        self._active = 0
+        self._waiting = 0
+
+    @contextmanager
+    def searching(self, hnsw: hnswlib.Index, ef: int):
+        with self._condition:
+            queued = False
+            while self._active and (self._ef != ef or (self._waiting and not queued)):
+                if not queued:
+                    self._waiting += 1
+                    queued = True
+                self._condition.wait()
+            if queued:
+                self._waiting -= 1
+            if self._ef != ef:
+                hnsw.set_ef(ef)
+                self._ef = ef
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                if not self._active:
+                    self._condition.notify_all()
+
+
+class HnswVectorIndex:
+    """HnswVectorIndex
+
+    Approximate cosine search over an hnswlib graph. Deleted vectors are only
+    marked as deleted, and the slots they take in the graph are reused by the
+    next vectors added. The candidate list size is a setting of the graph, so
+    searches only wait on each other when they ask for different `ef`s.
+    """
+
+    name = "hnsw"
+
+    def __init__(self, dim: int, config: IndexConfig):
+        self.config = config
+        self._hnsw = hnswlib.Index(space="cosine", dim=dim)
+        self._hnsw.init_index(
+            max_elements=config.max_elements,
+            ef_construction=config.ef_construction,
+            M=config.M,
+            allow_replace_deleted=True,
+        )
+        # labels marked as deleted, some of whose slots may have been reused
+        # since; `_num_deleted` counts the ones that were not
+        self._deleted: set[int] = set()
+        self._num_deleted = 0
+        self._ef_gate = _EfGate()
+
+    def __len__(self) -> int:
+        return self._hnsw.get_current_count() - self._num_deleted
+
+    @property
+    def dim(self) -> int:
+        return self._hnsw.dim
+
+    def add(self, embeddings: np.ndarray, labels: np.ndarray) -> None:
+        required = len(self) + len(labels)
+        if required > self._hnsw.get_max_elements():
+            self._hnsw.resize_index(max(required, self._hnsw.get_max_elements() * 2))
+        self._hnsw.add_items(
+            np.asarray(embeddings, dtype=np.float32), labels, replace_deleted=True
+        )
+        # labels are new, each takes the slot of a deleted one while any are left
+        self._num_deleted -= min(len(labels), self._num_deleted)
+
+    def delete(self, labels: np.ndarray) -> None:
+        for label in labels:
+            self._hnsw.mark_deleted(int(label))
+            self._deleted.add(int(label))
+            self._num_deleted += 1
+
+    def _deleted_labels(self) -> set[int]:
+        # hnswlib does not tell which slots it reused, only look when needed
+        if len(self._deleted) != self._num_deleted:
+            self._deleted &= set(self._hnsw.get_ids_list())
+        return self._deleted
+
+    def labels(self) -> np.ndarray:
+        deleted = self._deleted_labels()
+        return np.asarray(
+            [label for label in self._hnsw.get_ids_list() if label not in deleted],
+            dtype=np.int64,
+        )
+
+    def items(self) -> tuple[np.ndarray, np.ndarray]:
+        labels = self.labels()
+        embeddings = np.asarray(self._hnsw.get_items(labels), dtype=np.float32)
+        return embeddings.reshape(len(labels), self.dim), labels
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        ef: int | None,
+        num_threads: int,
+        exclude: np.ndarray | None = None,
+    ) -> Hits:
+        """The `k` nearest labels of every query, skipping the live labels in
+        the sorted array `exclude` while traversing the graph."""
+        excluded = set() if exclude is None else set(exclude.tolist())
+        k = min(k, len(self) - len(excluded))
+        if k <= 0:
+            return [[] for _ in queries]
+        with self._ef_gate.searching(self._hnsw, max(k, ef or self.config.ef_search)):
+            labels, distances = self._hnsw.knn_query(
+                queries,
+                k,
+                num_threads=num_threads,
+                filter=(lambda label: label not in excluded) if excluded else None,
+            )
+        return [
+            [
+                (int(label), 1.0 - float(distance))
+                for label, distance in zip(row_labels, row_distances)
+            ]
+            for row_labels, row_distances in zip(labels, distances)
+        ]
+
+    def save(self, dir: str) -> None:
+        self._hnsw.save_index(os.path.join(dir, "hnsw.bin"))
+        write_array(dir, "hnsw_deleted", sorted(self._deleted_labels()), np.int64)
+
+    @classmethod
+    def load(
+        cls, dir: str, dim: int, config: IndexConfig, writable: bool = False
+    ) -> "HnswVectorIndex":
+        # hnswlib reads the whole graph into memory, so it is always writable
+        index = cls.__new__(cls)
+        index.config = config
+        index._hnsw = hnswlib.Index(space="cosine", dim=dim)
+        index._hnsw.load_index(
+            os.path.join(dir, "hnsw.bin"), allow_replace_deleted=True
+        )
+        index._deleted = set()
+        if os.path.exists(os.path.join(dir, "hnsw_deleted.bin")):
+            index._deleted = set(open_array(dir, "hnsw_deleted", np.int64).tolist())
+        index._num_deleted = len(index._deleted)
+        index._ef_gate = _EfGate()
+        return index
+
+
+class FlatVectorIndex:
+    """FlatVectorIndex
+
+    Cosine search by scanning every vector: the normalized vectors are rows
+    of one matrix and a query is a matrix-vector product plus `argpartition`.
+    There is no graph to build, so adding vectors is just a copy.
+
+    The scanned rows can be compressed by `flat_dtype`: "float16" halves the
+    matrix, "int8" quarters it with a scale per row, and "pq" keeps one byte
+    per `pq_subvectors` slice of a vector, scored against per-query lookup
+    tables. The product quantizer is trained on the first `pq_train_size`
+    vectors, and until then the scan is exact. Compressed scores are only
+    approximate, so with a `rerank_factor` the best `k * rerank_factor` rows
+    are re-scored against full precision vectors. A loaded index keeps those
+    memory-mapped, and reads only the pages of the rows it re-ranks.
+
+    Deleted rows are masked out of the scan until the index is rebuilt.
+    """
+
+    name = "flat"
+
+    def __init__(self, dim: int, config: IndexConfig | None = None):
+        self.config = config if config is not None else IndexConfig()
+        self._dim = dim
+        self._count = 0
+        self._num_deleted = 0
+        self._labels = np.empty(0, dtype=np.int64)
+        self._deleted = np.empty(0, dtype=bool)
+        self._scales = np.empty(0, dtype=np.float32)
+        self._codebooks: np.ndarray | None = None
+        if self.config.flat_dtype == "pq":
+            if dim % self.config.pq_subvectors:
+                raise ValueError(
+                    f"{dim} dimensions do not split into "
+                    f"{self.config.pq_subvectors} product quantizer slices"
+                )
+            self._codes = np.empty((0, self.config.pq_subvectors), dtype=np.uint8)
+        else:
+            self._codes = np.empty((0, dim), dtype=self.config.flat_dtype)
+        # the full precision rows, needed to re-rank and to train the quantizer
+        self._full: np.ndarray | None = None
+        if self.config.flat_dtype == "pq" or self._reranks:
+            self._full = np.empty((0, dim), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return self._count - self._num_deleted
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    @property
+    def code_bytes(self) -> int:
+        """Bytes scanned per query."""
+        return self._codes[: self._count].nbytes + self._scales[: self._count].nbytes
+
+    @property
+    def _reranks(self) -> bool:
+        return self.config.flat_dtype != "float32" and self.config.rerank_factor > 0
+
+    @property
+    def _trained(self) -> bool:
+        return self.config.flat_dtype != "pq" or self._codebooks is not None
+
+    def add(self, embeddings: np.ndarray, labels: np.ndarray) -> None:
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        start, end = self._count, self._count + len(vectors)
+        if end > len(self._labels):
+            capacity = max(end, 2 * len(self._labels))
+            self._labels = self._grow(self._labels, capacity)
+            self._deleted = self._grow(self._deleted, capacity)
+            self._scales = self._grow(self._scales, capacity)
+            self._codes = self._grow(self._codes, capacity)
+            if self._full is not None:
+                self._full = self._grow(self._full, capacity)
+        self._labels[start:end] = labels
+        self._deleted[start:end] = False
+        if self._full is not None:
+            self._full[start:end] = vectors
+        self._encode(vectors, start, end)
+        self._count = end
+        if not self._trained and self._count >= self.config.pq_train_size:
+            self._train()
+
+    def _grow(self, array: np.ndarray, capacity: int) -> np.ndarray:
+        grown = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+        grown[: self._count] = array[: self._count]
+        return grown
+
+    def _encode(self, vectors: np.ndarray, start: int, end: int) -> None:
+        self._scales[start:end] = 1
+        if self.config.flat_dtype == "int8":
+            self._codes[start:end], self._scales[start:end] = quantize_int8(vectors)
+        elif self.config.flat_dtype == "pq":
+            if self._trained:
+                self._codes[start:end] = pq_encode(vectors, self._codebooks)
+        else:
+            self._codes[start:end] = vectors
+
+    def _train(self) -> None:
+        rng = np.random.default_rng(0)
+        sample = self._full[: self._count]
+        if self._count > self.config.pq_train_size:
+            sample = sample[
+                rng.choice(self._count, self.config.pq_train_size, replace=False)
+            ]
+        self._codebooks = train_codebooks(sample, self.config.pq_subvectors)
+        self._encode(self._full[: self._count], 0, self._count)
+
+    def _rows(self, labels: np.ndarray) -> np.ndarray:
+        """The live rows of those of `labels` that are in the index."""
+        # labels are added in increasing order
+        rows = np.searchsorted(self._labels[: self._count], labels)
+        rows = rows[rows < self._count]
+        return rows[np.isin(self._labels[rows], labels) & ~self._deleted[rows]]
+
+    def delete(self, labels: np.ndarray) -> None:
+        rows = self._rows(labels)
+        self._deleted[rows] = True
+        self._num_deleted += len(rows)
+
+    def labels(self) -> np.ndarray:
+        return np.array(self._labels[: self._count][~self._deleted[: self._count]])
+
+    def items(self) -> tuple[np.ndarray, np.ndarray]:
+        live = np.flatnonzero(~self._deleted[: self._count])
+        if self._full is not None:
+            embeddings = np.array(self._full[live])
+        elif self._codebooks is not None:
+            embeddings = pq_decode(self._codes[live], self._codebooks)
+        else:
+            embeddings = self._codes[live].astype(np.float32)
+            embeddings *= self._scales[live, np.newaxis]
+        return embeddings, np.array(self._labels[live])
+
+    def _scan(self, queries: np.ndarray) -> np.ndarray:
+        scores = np.empty((len(queries), self._count), dtype=np.float32)
+        if self._codebooks is not None:
+            num_centroids = self._codebooks.shape[1]
+            tables = pq_lookup_tables(queries, self._codebooks)
+        for start in range(0, self._count, _BLOCK_ROWS):
+            end = min(start + _BLOCK_ROWS, self._count)
+            if not self._trained:
+                scores[:, start:end] = queries @ self._full[start:end].T
+            elif self._codebooks is not None:
+                for i, table in enumerate(tables):
+                    scores[i, start:end] = pq_scores(
+                        table, self._codes[start:end], num_centroids
+                    )
+            else:
+                block = self._codes[start:end].astype(np.float32, copy=False)
+                scores[:, start:end] = queries @ block.T
+                scores[:, start:end] *= self._scales[start:end]
+        if self._num_deleted:
+            scores[:, self._deleted[: self._count]] = -np.inf
+        return scores
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        ef: int | None,
+        num_threads: int,
+        exclude: np.ndarray | None = None,
+    ) -> Hits:
+        """The `k` nearest labels of every query, the labels in `exclude` are
+        masked out of the scan like deleted rows."""
+        # a scan, so the candidate list size and threads do not apply
+        excluded = self._rows(exclude) if exclude is not None else np.empty(0, int)
+        num_excluded = len(excluded)
+        k = min(k, len(self) - num_excluded)
+        if k <= 0:
+            return [[] for _ in queries]
+        queries = _normalize(np.asarray(queries, dtype=np.float32))
+        scores = self._scan(queries)
+        if num_excluded:
+            scores[:, excluded] = -np.inf
+        rerank = self._reranks and self._full is not None and self._trained
+        candidates = (
+            min(k * self.config.rerank_factor, len(self) - num_excluded)
+            if rerank
+            else k
+        )
+        rows, scores = _top(scores, candidates)
+        hits = []
+        for query, row_rows, row_scores in zip(queries, rows, scores):
+            if rerank:
+                # sorted rows read the mapped pages front to back
+                row_rows = np.sort(row_rows)
+                row_scores = self._full[row_rows] @ query
+                order = np.argsort(-row_scores, kind="stable")[:k]
+                row_rows, row_scores = row_rows[order], row_scores[order]
+            hits.append(
+                [
+                    (int(self._labels[row]), float(score))
+                    for row, score in zip(row_rows, row_scores)
+                ]
+            )
+        return hits
+
+    def save(self, dir: str) -> None:
+        if not self._trained and self._count > 0:
+            self._train()
+        code_dtype = self._codes.dtype
+        write_array(dir, "vector_labels", self._labels[: self._count], np.int64)
+        write_array(dir, "vector_deleted", self._deleted[: self._count], np.uint8)
+        write_array(dir, "vector_scales", self._scales[: self._count], np.float32)
+        write_array(dir, "vectors", self._codes[: self._count], code_dtype)
+        if self._codebooks is not None:
+            write_array(dir, "pq_codebooks", self._codebooks, np.float32)
+        if self._reranks and self._full is not None:
+            write_array(dir, "vectors_full", self._full[: self._count], np.float32)
+
+    @classmethod
+    def load(
+        cls, dir: str, dim: int, config: IndexConfig, writable: bool = False
+    ) -> "FlatVectorIndex":
+        """Maps the arrays read-only instead of reading them, unless the index
+        has to be `writable`."""
+        index = cls.__new__(cls)
+        index.config = config
+        index._dim = dim
+        index._labels = open_array(dir, "vector_labels", np.int64)
+        index._scales = open_array(dir, "vector_scales", np.float32)
+        index._count = len(index._labels)
+        index._deleted = np.zeros(index._count, dtype=bool)
+        if os.path.exists(os.path.join(dir, "vector_deleted.bin")):
+            index._deleted = open_array(dir, "vector_deleted", np.uint8).view(bool)
+        index._num_deleted = int(np.count_nonzero(index._deleted))
+        index._codebooks = None
+        index._full = None
+        if config.flat_dtype == "pq":
+            index._codes = open_array(dir, "vectors", np.uint8).reshape(
+                -1, config.pq_subvectors
+            )
+            if index._count > 0:
+                index._codebooks = open_array(dir, "pq_codebooks", np.float32).reshape(
+                    config.pq_subvectors, -1, dim // config.pq_subvectors
+                )
+        else:
+            index._codes = open_array(dir, "vectors", config.flat_dtype).reshape(
+                -1, dim
+            )
+        if os.path.exists(os.path.join(dir, "vectors_full.bin")):
+            index._full = open_array(dir, "vectors_full", np.float32).reshape(-1, dim)
+        if writable:
+            for name in ("_labels", "_deleted", "_scales", "_codes", "_full"):
+                if getattr(index, name) is not None:
+                    setattr(index, name, np.array(getattr(index, name)))
+        return index
+
+
+def _top(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """The columns of the `k` highest scores of every row, highest first."""
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    return (
+        np.take_along_axis(top, order, axis=1),
+        np.take_along_axis(top_scores, order, axis=1),
+    )
+
+
+def make_vector_index(
+    backend: str, dim: int, config: IndexConfig
+) -> HnswVectorIndex | FlatVectorIndex:
+    if backend == "hnsw":
+        return HnswVectorIndex(dim, config)
+    elif backend == "flat":
+        return FlatVectorIndex(dim, config)
+    raise ValueError(f"Unknown vector backend: {backend}")
+
+
+def load_vector_index(
+    backend: str, dir: str, dim: int, config: IndexConfig, writable: bool = False
+) -> HnswVectorIndex | FlatVectorIndex:
+    if backend == "hnsw":
+        return HnswVectorIndex.load(dir, dim, config, writable)
+    elif backend == "flat":
+        return FlatVectorIndex.load(dir, dim, config, writable)
+    raise ValueError(f"Unknown vector backend: {backend}")
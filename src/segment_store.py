@@ -0,0 +1,258 @@
+import glob
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime
+from typing import Optional
+
+from sentence_transformers import SentenceTransformer
+
+from pickle_store import Artifact
+from search.inverted_index import InvertedIndex
+from search.segmented_index import SegmentedIndex
+from search.snapshot import StringTable, read_meta
+from snapshot_store import SnapshotStore
+
+logger = logging.getLogger(__name__)
+
+
+def merge_candidates(
+    sizes: list[int], merge_factor: int, min_merge_docs: int
+) -> tuple[int, int] | None:
+    """merge_candidates
+
+    The start and end of the oldest run of `merge_factor` adjacent segments
+    of the same size class, or None. Segments of up to `min_merge_docs`
+    documents are the smallest class and every further factor of
+    `merge_factor` is the next, so a document is merged about
+    log(documents / min_merge_docs) times over the life of the index.
+    """
+    levels = []
+    for size in sizes:
+        level, bound = 0, min_merge_docs
+        while size > bound:
+            level, bound = level + 1, bound * merge_factor
+        levels.append(level)
+    start = 0
+    for end in range(1, len(levels) + 1):
+        if end == len(levels) or levels[end] != levels[start]:
+            if end - start >= merge_factor:
+                return start, start + merge_factor
+            start = end
+    return None
+
+
+class SegmentStore:
+    """SegmentStore
+
+    Keeps an index as immutable `InvertedIndex` segments in one directory.
+    Which segments make up the index, oldest first, is recorded by numbered
+    manifests, `segments_<generation>.json`. Writing a new manifest is the
+    commit point of adding a segment or of replacing a run of segments by
+    their merge, so readers always open a complete index. A directory with an
+    `InvertedIndex` snapshot and no manifest yet is read as an index of that
+    one segment. Segments only reference their model by name, `model` is the
+    one to open them with, if already loaded.
+    """
+
+    prefix = "segments"
+
+    def __init__(
+        self,
+        dir: str,
+        merge_factor: int = 10,
+        min_merge_docs: int = 1_000,
+        model: SentenceTransformer | None = None,
+    ):
+        if not os.path.isdir(dir):
+            raise FileNotFoundError(f"Directory does not exist: {dir}")
+        if merge_factor < 2:
+            raise ValueError("merge_factor must be at least 2")
+        self.dir = dir
+        self.merge_factor = merge_factor
+        self.min_merge_docs = min_merge_docs
+        self.model = model
+        # commits of the crawler, the merger and pruning happen one at a time
+        self._lock = threading.Lock()
+
+    def _manifest_paths(self) -> list[str]:
+        return sorted(glob.glob(f"{self.dir}/{self.prefix}_*.json"))
+
+    def latest_path(self) -> Optional[str]:
+        paths = self._manifest_paths()
+        return paths[-1] if paths else None
+
+    def _read(self, path: str | None) -> tuple[int, list[str]]:
+        if path is None:
+            snapshot_path = SnapshotStore(self.dir).latest_path()
+            if snapshot_path is None:
+                return 0, []
+            return 0, [os.path.basename(snapshot_path)]
+        with open(path, "r") as file:
+            manifest = json.load(file)
+        return manifest["generation"], manifest["segments"]
+
+    def segments(self) -> list[str]:
+        """The segments of the latest generation, oldest first."""
+        return self._read(self.latest_path())[1]
+
+    def _commit(self, generation: int, segments: list[str]) -> None:
+        path = f"{self.dir}/{self.prefix}_{generation:012d}.json"
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(dict(generation=generation, segments=segments), file)
+        os.replace(tmp_path, path)
+
+    def _write(self, index: InvertedIndex) -> str:
+        """Writes `index` under a temporary name, `_install` renames it into
+        place."""
+        formatted_date = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        tmp_dir = f"{self.dir}/segment_{formatted_date}.tmp"
+        try:
+            index.save(tmp_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return tmp_dir
+
+    def _install(self, tmp_dir: str) -> str:
+        segment_dir = tmp_dir.removesuffix(".tmp")
+        os.rename(tmp_dir, segment_dir)
+        return os.path.basename(segment_dir)
+
+    def add(self, index: InvertedIndex) -> str | None:
+        """Writes `index` as the newest segment and commits it; its documents
+        replace their copies in older segments. Returns the new segment, None
+        for an empty index, which is not written."""
+        if index._next_label == 0:
+            return None
+        tmp_dir = self._write(index)
+        with self._lock:
+            generation, segments = self._read(self.latest_path())
+            segment = self._install(tmp_dir)
+            self._commit(generation + 1, segments + [segment])
+        return segment
+
+    def merge(self) -> str | None:
+        """merge
+
+        Merges the run of segments `merge_candidates` picks into one and
+        commits it in their place. Copies of documents that newer segments
+        replaced are dropped. A document deleted in the run but still in an
+        older segment has to stay hidden, so the run then extends to the
+        oldest segment. Returns the merged segment, None if no run of
+        segments needed merging. Segments are only ever removed here, so run
+        this from one thread at a time.
+        """
+        segments = self.segments()
+        sizes = [read_meta(f"{self.dir}/{segment}")["num_docs"] for segment in segments]
+        candidates = merge_candidates(sizes, self.merge_factor, self.min_merge_docs)
+        if candidates is None:
+            return None
+        start, end = candidates
+        newer_ids = set()
+        for segment in segments[end:]:
+            newer_ids.update(StringTable(f"{self.dir}/{segment}", "doc_ids"))
+        model = self.model
+        indexes = []
+        for segment in segments[start:end]:
+            index = InvertedIndex.load(
+                f"{self.dir}/{segment}", model=model, writable=True
+            )
+            model = index.model
+            indexes.append(index)
+        live_ids = set()
+        for index in indexes:
+            live_ids.update(index.id_to_label)
+        deleted_ids = {
+            doc_id
+            for index in indexes
+            for label, doc_id in enumerate(index._doc_ids)
+            if label in index._deleted
+        }
+        tombstones = deleted_ids - live_ids - newer_ids
+        if start > 0 and any(
+            doc_id in tombstones
+            for segment in segments[:start]
+            for doc_id in StringTable(f"{self.dir}/{segment}", "doc_ids")
+        ):
+            for segment in segments[start - 1 :: -1]:
+                indexes.insert(
+                    0, InvertedIndex.load(f"{self.dir}/{segment}", model, writable=True)
+                )
+            start = 0
+        # newest first, each segment drops what the segments after it replaced
+        for index in reversed(indexes):
+            index.delete_many(
+                [doc_id for doc_id in index.id_to_label if doc_id in newer_ids]
+            )
+            newer_ids.update(index._doc_ids)
+        merged = InvertedIndex.merged(indexes, indexes[-1].config)
+        tmp_dir = self._write(merged)
+        with self._lock:
+            # segments added meanwhile all come after the run
+            generation, latest = self._read(self.latest_path())
+            segment = self._install(tmp_dir)
+            self._commit(generation + 1, latest[:start] + [segment] + latest[end:])
+        logger.info(
+            f"Merged {end - start} segments with {sum(sizes[start:end])} documents "
+            f"into {segment} with {merged.total_docs} documents"
+        )
+        return segment
+
+    def prune(self, keep: int) -> list[str]:
+        """Deletes all but the newest `keep` manifests and the segments none
+        of the remaining ones refers to. Readers that still map the files of a
+        deleted segment keep them until they let go."""
+        with self._lock:
+            paths = self._manifest_paths()
+            if not paths:
+                return []
+            for path in paths[: max(0, len(paths) - keep)]:
+                os.remove(path)
+            referenced = set()
+            for path in self._manifest_paths():
+                referenced.update(self._read(path)[1])
+            # snapshots of the single index the segments started from too
+            pruned = [
+                path
+                for path in glob.glob(f"{self.dir}/segment_*")
+                + SnapshotStore(self.dir)._paths()
+                if os.path.isdir(path)
+                and not path.endswith(".tmp")
+                and os.path.basename(path) not in referenced
+            ]
+            for path in pruned:
+                shutil.rmtree(path, ignore_errors=True)
+        return pruned
+
+    def get_latest(self, previous: SegmentedIndex | None = None) -> Optional[Artifact]:
+        """Opens the latest generation. Segments that the `previous` index
+        already has open are reused, as is its model when it matches, so
+        opening a generation that added a segment only maps that segment."""
+        latest_path = self.latest_path()
+        segments = self._read(latest_path)[1]
+        if not segments:
+            return None
+        opened = dict()
+        models = dict()
+        if previous is not None:
+            opened = dict(zip(previous.segment_names, previous.segments))
+            models[previous.model_name] = previous.model
+        indexes = []
+        for segment in segments:
+            if segment not in opened:
+                segment_dir = f"{self.dir}/{segment}"
+                model_name = read_meta(segment_dir)["model_name"]
+                index = InvertedIndex.load(
+                    segment_dir, model=models.get(model_name, self.model)
+                )
+                models[model_name] = index.model
+                opened[segment] = index
+            indexes.append(opened[segment])
+        return Artifact(
+            latest_path or f"{self.dir}/{segments[0]}",
+            SegmentedIndex(indexes, segment_names=segments),
+        )
@@ -0,0 +1,70 @@
+import glob
+import os
+import shutil
+from datetime import datetime
+from typing import Optional
+
+from pickle_store import Artifact
+from search.inverted_index import InvertedIndex
+from search.snapshot import read_meta
+
+
+class SnapshotStore:
+    """SnapshotStore
+
+    Keeps timestamped `InvertedIndex` snapshot directories. A snapshot is
+    written under a temporary name and renamed into place once complete, so
+    readers never see a partial one.
+    """
+
+    prefix = "inverted_index"
+
+    def __init__(self, dir: str):
+        if not os.path.isdir(dir):
+            raise FileNotFoundError(f"Directory does not exist: {dir}")
+        self.dir = dir
+
+    def save(self, index: InvertedIndex) -> str:
+        formatted_date = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        snapshot_dir = f"{self.dir}/{self.prefix}_{formatted_date}"
+        tmp_dir = f"{snapshot_dir}.tmp"
+        try:
+            index.save(tmp_dir)
+            os.rename(tmp_dir, snapshot_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return snapshot_dir
+
+    def _paths(self) -> list[str]:
+        return sorted(
+            path
+            for path in glob.glob(f"{self.dir}/{self.prefix}_*")
+            if os.path.isdir(path) and not path.endswith(".tmp")
+        )
+
+    def latest_path(self) -> Optional[str]:
+        paths = self._paths()
+        return paths[-1] if paths else None
+
+    def prune(self, keep: int) -> list[str]:
+        """Deletes all but the newest `keep` snapshots. Readers that still map
+        the files of a deleted snapshot keep them until they let go."""
+        paths = self._paths()
+        pruned = paths[: max(0, len(paths) - keep)]
+        for path in pruned:
+            shutil.rmtree(path, ignore_errors=True)
+        return pruned
+
+    def get_latest(self, previous: InvertedIndex | None = None) -> Optional[Artifact]:
+        """Loads the newest snapshot. Snapshots only reference their model by
+        name, so the model of the `previous` index is reused when it matches."""
+        latest_path = self.latest_path()
+        if latest_path is None:
+            return None
+        model = None
+        if (
+            previous is not None
+            and previous.model_name == read_meta(latest_path)["model_name"]
+        ):
+            model = previous.model
+        return Artifact(latest_path, InvertedIndex.load(latest_path, model=model))
@@ -0,0 +1,80 @@
+import logging
+import tempfile
+
+import redis
+
+from analytics_sink import AnalyticsSink
+from autocomplete.log_reader import AnalyticsLogReader
+
+
+class FakeRedis:
+    def __init__(self):
+        self.streams = dict()
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def xadd(self, name, fields, maxlen=None, approximate=True):
+        self.commands.append((name, fields))
+
+    def execute(self):
+        for name, fields in self.commands:
+            self.client.streams.setdefault(name, []).append(fields)
+
+
+class BrokenPipeline(FakePipeline):
+    def execute(self):
+        raise redis.ConnectionError("down")
+
+
+def _logger(sink: AnalyticsSink) -> logging.Logger:
+    analytics_logger = logging.Logger("analytics")
+    analytics_logger.addHandler(sink.handler())
+    return analytics_logger
+
+
+def test_writes_log_reader_format():
+    with tempfile.NamedTemporaryFile() as log_file:
+        sink = AnalyticsSink(log_file.name, max_batch=2)
+        analytics_logger = _logger(sink)
+        sink.start()
+        for query in ["fireplace", "floor", "floor", "garage door"]:
+            analytics_logger.info(query)
+        sink.stop()
+        assert sink.records_written == 4
+
+        lines = open(log_file.name).read().splitlines()
+        assert lines[0].startswith("INFO:analytics:")
+        assert lines[0].endswith(" - fireplace")
+        reader = AnalyticsLogReader(log_file.name, None)
+        assert reader.unique_count() == {"fireplace": 1, "floor": 2, "garage door": 1}
+
+
+def test_redis_stream():
+    client = FakeRedis()
+    sink = AnalyticsSink(None, client, stream="queries")
+    analytics_logger = _logger(sink)
+    sink.start()
+    analytics_logger.info("fireplace")
+    analytics_logger.info("floor")
+    sink.stop()
+    assert [fields["message"] for fields in client.streams["queries"]] == [
+        "fireplace",
+        "floor",
+    ]
+
+    # an unavailable stream does not stop the log from being written
+    client.pipeline = lambda transaction=True: BrokenPipeline(client)
+    with tempfile.NamedTemporaryFile() as log_file:
+        sink = AnalyticsSink(log_file.name, client, stream="queries")
+        analytics_logger = _logger(sink)
+        sink.start()
+        analytics_logger.info("garage")
+        sink.stop()
+        assert open(log_file.name).read().endswith(" - garage\n")
@@ -0,0 +1,78 @@
+import threading
+
+from background_loader import BackgroundLoader
+from pickle_store import Artifact
+
+
+def test_load_validate_warm_swap():
+    calls = []
+    active = dict(artifact=Artifact("/tmp/trie_1.pkl", "old"))
+    release = threading.Event()
+
+    def load():
+        release.wait(5)
+        calls.append("load")
+        return Artifact("/tmp/trie_2.pkl", "new")
+
+    def validate(artifact):
+        calls.append("validate")
+        assert active["artifact"].artifact == "old"
+
+    def warm(artifact):
+        calls.append("warm")
+        assert active["artifact"].artifact == "old"
+
+    def swap(artifact):
+        calls.append("swap")
+        active["artifact"] = artifact
+
+    loader = BackgroundLoader(
+        "trie", load, swap, validate, warm, active_generation="trie_1"
+    )
+    assert loader.status()["state"] == "idle"
+    assert loader.start()
+    # a second load while the first one is running is refused
+    assert not loader.start()
+    assert loader.status()["state"] == "loading"
+    assert active["artifact"].artifact == "old"
+    release.set()
+    loader.wait(5)
+
+    assert calls == ["load", "validate", "warm", "swap"]
+    assert active["artifact"].artifact == "new"
+    status = loader.status()
+    assert status["state"] == "idle"
+    assert status["active_generation"] == "trie_2"
+    assert status["pending_generation"] is None
+    assert status["error"] is None
+    assert status["finished_at"] >= status["started_at"]
+
+
+def test_failed_validation_keeps_active_artifact():
+    swapped = []
+
+    def validate(artifact):
+        raise ValueError("broken index")
+
+    loader = BackgroundLoader(
+        "inverted index",
+        load=lambda: Artifact("/tmp/inverted_index_2", "new"),
+        swap=swapped.append,
+        validate=validate,
+        active_generation="inverted_index_1",
+    )
+    loader.start()
+    loader.wait(5)
+    status = loader.status()
+    assert swapped == []
+    assert status["state"] == "failed"
+    assert "broken index" in status["error"]
+    assert status["active_generation"] == "inverted_index_1"
+    assert status["pending_generation"] == "inverted_index_2"
+
+    # nothing to load is reported as a failure as well
+    loader = BackgroundLoader("trie", load=lambda: None, swap=swapped.append)
+    loader.start()
+    loader.wait(5)
+    assert loader.status()["state"] == "failed"
+    assert swapped == []
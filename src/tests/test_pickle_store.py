@@ -1,6 +1,7 @@
 import tempfile
 
 from pickle_store import PickleStore
+from autocomplete.compact_trie import CompactTrie
 from autocomplete.subgraph_cache_trie import SubgraphCacheTrie
 
 
@@ -31,3 +32,24 @@ def test_get_latest():
             trie_storage.get_latest(SubgraphCacheTrie).artifact.find("second!").value
             == 2
         )
+
+
+def test_generation():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        trie_storage = PickleStore(temp_dir)
+        trie_storage.save(SubgraphCacheTrie())
+        artifact = trie_storage.get_latest(SubgraphCacheTrie)
+        assert artifact.generation.startswith("trie_")
+        assert artifact.generation in artifact.file_path
+        assert not artifact.generation.endswith(".pkl")
+
+
+def test_compact_trie():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        trie_storage = PickleStore(temp_dir)
+        trie_storage.save(SubgraphCacheTrie())
+        assert trie_storage.get_latest(CompactTrie) is None
+        trie_storage.save(CompactTrie.from_items([("first!", 1)]))
+        artifact = trie_storage.get_latest(CompactTrie)
+        assert artifact.generation.startswith("compact_trie_")
+        assert artifact.artifact.suggest("f") == ["first!"]
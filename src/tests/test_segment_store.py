@@ -0,0 +1,106 @@
+import os
+
+from search.inverted_index import InvertedIndex
+from segment_store import SegmentStore, merge_candidates
+from snapshot_store import SnapshotStore
+from web_crawler.node import Node
+
+
+def _segment(model, *texts: str) -> InvertedIndex:
+    index = InvertedIndex(model=model)
+    index.insert_many([Node(f"https://{text}.page", text=text) for text in texts])
+    return index
+
+
+def _ids(artifact) -> set[str]:
+    index = artifact.artifact
+    return {r.id for r in index.top_k("lorem", k=100, mode="vector")}
+
+
+def test_merge_candidates():
+    assert merge_candidates([5, 5], 3, 10) is None
+    assert merge_candidates([5, 5, 5], 3, 10) == (0, 3)
+    assert merge_candidates([30, 5, 5, 5, 5], 3, 10) == (1, 4)
+    # a run of larger segments merges before newer small ones
+    assert merge_candidates([90, 80, 70, 5, 5, 5], 3, 10) == (0, 3)
+    assert merge_candidates([90, 5, 80, 70, 5], 3, 10) is None
+
+
+def test_add_and_get_latest(model, tmp_path):
+    store = SegmentStore(str(tmp_path), model=model)
+    assert store.get_latest() is None
+    assert store.add(InvertedIndex(model=model)) is None
+
+    first = store.add(_segment(model, "lorem", "ipsum"))
+    artifact = store.get_latest(previous=None)
+    assert artifact.generation == "segments_000000000001"
+    assert artifact.artifact.total_docs == 2
+
+    # re-crawled documents go into the newer segment and replace old copies
+    second = store.add(_segment(model, "ipsum", "dolor"))
+    assert store.segments() == [first, second]
+    reopened = store.get_latest(previous=artifact.artifact)
+    assert reopened.generation == "segments_000000000002"
+    assert reopened.artifact.segments[0] is artifact.artifact.segments[0]
+    assert reopened.artifact.total_docs == 3
+    assert reopened.artifact.num_shadowed == 1
+
+
+def test_merge(model, tmp_path):
+    store = SegmentStore(str(tmp_path), merge_factor=2, min_merge_docs=10, model=model)
+    assert store.merge() is None
+    store.add(_segment(model, "lorem", "ipsum"))
+    assert store.merge() is None
+    updated = _segment(model, "ipsum", "dolor")
+    updated.delete(Node("https://dolor.page").id)
+    store.add(updated)
+    newest = store.add(_segment(model, "sit"))
+    before = store.get_latest()
+
+    merged = store.merge()
+    assert store.segments() == [merged, newest]
+    after = store.get_latest(previous=before.artifact)
+    assert after.artifact.num_shadowed == 0
+    assert after.artifact.total_docs == before.artifact.total_docs == 3
+    assert _ids(after) == _ids(before)
+
+
+def test_merge_keeps_deletes_of_older_segments(model, tmp_path):
+    store = SegmentStore(str(tmp_path), merge_factor=2, min_merge_docs=2, model=model)
+    store.add(_segment(model, "lorem", "ipsum", "dolor"))
+    deleted = _segment(model, "lorem", "sit")
+    deleted.delete(Node("https://lorem.page").id)
+    store.add(deleted)
+    store.add(_segment(model, "amet"))
+    before = store.get_latest()
+    assert before.artifact.total_docs == 4
+
+    # the two small segments are the run, but their delete hides a document
+    # of the large one, so all three are merged
+    store.merge()
+    assert len(store.segments()) == 1
+    after = store.get_latest()
+    assert after.artifact.total_docs == 4
+    assert _ids(after) == _ids(before)
+
+
+def test_prune(model, tmp_path):
+    store = SegmentStore(str(tmp_path), merge_factor=2, min_merge_docs=10, model=model)
+    first = store.add(_segment(model, "lorem"))
+    second = store.add(_segment(model, "ipsum"))
+    merged = store.merge()
+    assert store.prune(keep=2) == []
+    pruned = store.prune(keep=1)
+    assert sorted(os.path.basename(path) for path in pruned) == [first, second]
+    assert store.segments() == [merged]
+    assert store.get_latest().artifact.total_docs == 2
+
+
+def test_opens_snapshot_without_manifest(model, tmp_path):
+    snapshot = SnapshotStore(str(tmp_path)).save(_segment(model, "lorem", "ipsum"))
+    store = SegmentStore(str(tmp_path), model=model)
+    assert store.get_latest().artifact.total_docs == 2
+
+    segment = store.add(_segment(model, "dolor"))
+    assert store.segments() == [os.path.basename(snapshot), segment]
+    assert store.get_latest().artifact.total_docs == 3
@@ -0,0 +1,74 @@
+import os
+import tempfile
+from dataclasses import astuple
+
+import pytest
+
+from snapshot_store import SnapshotStore
+from search.inverted_index import InvertedIndex
+from web_crawler.node import Node
+
+QUERIES = ["lorem ipsum", "type hint iterators", "placeholder", "missing"]
+
+
+@pytest.fixture
+def inverted_index(model) -> InvertedIndex:
+    inverted_index = InvertedIndex(model=model)
+    inverted_index.insert_many(
+        [
+            Node("https://lorem.ipsum", text="lorem ipsum placeholder", title="lorem"),
+            Node("https://type.hints", text="type hint iterators", title=None),
+            Node("https://no.text", text=None, title="no text"),
+        ]
+    )
+    return inverted_index
+
+
+def test_save_and_get_latest(inverted_index):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = SnapshotStore(temp_dir)
+        assert store.get_latest() is None
+        path = store.save(inverted_index)
+        assert os.path.isdir(path)
+        assert not os.path.exists(os.path.join(path, "model.pkl"))
+
+        artifact = store.get_latest(previous=inverted_index)
+        loaded = artifact.artifact
+        assert artifact.file_path == path
+        assert artifact.generation == os.path.basename(path)
+        assert loaded.model is inverted_index.model
+        assert loaded.total_docs == inverted_index.total_docs
+        assert loaded.total_terms == inverted_index.total_terms
+        for doc_id in inverted_index.id_to_label:
+            assert loaded.num_words_in_doc(doc_id) == inverted_index.num_words_in_doc(
+                doc_id
+            )
+        for query in QUERIES:
+            for mode in ("vector", "lexical", "hybrid"):
+                assert [astuple(r) for r in loaded.top_k(query, mode=mode)] == [
+                    astuple(r) for r in inverted_index.top_k(query, mode=mode)
+                ]
+
+        with pytest.raises(TypeError):
+            loaded.insert(Node("https://new.page", text="new page"))
+
+
+def test_get_latest_ignores_partial_snapshots(inverted_index):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = SnapshotStore(temp_dir)
+        path = store.save(inverted_index)
+        os.mkdir(os.path.join(temp_dir, "inverted_index_99999999999999999999.tmp"))
+        assert store.latest_path() == path
+        second_path = store.save(inverted_index)
+        assert second_path > path
+        assert store.latest_path() == second_path
+
+
+def test_prune(inverted_index):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = SnapshotStore(temp_dir)
+        paths = [store.save(inverted_index) for _ in range(3)]
+        assert store.prune(keep=2) == paths[:1]
+        assert not os.path.exists(paths[0])
+        assert store.latest_path() == paths[-1]
+        assert store.prune(keep=2) == []
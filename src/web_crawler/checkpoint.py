@@ -0,0 +1,64 @@
+import sqlite3
+
+from web_crawler.node import Node
+
+
+class CrawlCheckpoint:
+    """CrawlCheckpoint
+
+    The pages of a crawl that are queued or being crawled, in a SQLite file.
+    `queued` and `done` are buffered in memory and `commit` writes them in a
+    single transaction, so a crawl that is killed resumes from the frontier
+    of its last commit. A page only counts as done once whatever it
+    contributes, its links and its place in a saved index, is committed too.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        # the write-ahead log commits with a single sequential write
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS frontier "
+            "(id TEXT PRIMARY KEY, url TEXT NOT NULL, depth INTEGER NOT NULL)"
+        )
+        self._connection.commit()
+        self._queued: dict[str, Node] = dict()
+        self._done: set[str] = set()
+
+    def __len__(self) -> int:
+        """The number of committed pages."""
+        return self._connection.execute("SELECT COUNT(*) FROM frontier").fetchone()[0]
+
+    def pending(self) -> list[Node]:
+        """The committed pages, shallowest first."""
+        rows = self._connection.execute(
+            "SELECT url, depth FROM frontier ORDER BY depth, rowid"
+        )
+        return [Node(url, depth) for url, depth in rows]
+
+    def queued(self, node: Node) -> None:
+        self._queued[node.id] = node
+
+    def done(self, ids: str | list[str]) -> None:
+        if isinstance(ids, str):
+            ids = [ids]
+        for id in ids:
+            # never written, nothing to delete
+            if self._queued.pop(id, None) is None:
+                self._done.add(id)
+
+    def commit(self) -> None:
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO frontier (id, url, depth) VALUES (?, ?, ?)",
+                [(id, node.url, node.depth) for id, node in self._queued.items()],
+            )
+            self._connection.executemany(
+                "DELETE FROM frontier WHERE id = ?", [(id,) for id in self._done]
+            )
+        self._queued = dict()
+        self._done = set()
+
+    def close(self) -> None:
+        self._connection.close()
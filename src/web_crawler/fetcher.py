@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import Callable
+from urllib.parse import urljoin, urlparse
+
+import aiohttp
+import validators
+
+logger = logging.getLogger(__name__)
+
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+# pages with less visible text than this that run scripts get rendered
+MIN_STATIC_TEXT_LENGTH = 200
+
+_SKIPPED_TAGS = {"head", "script", "style", "noscript", "template", "svg"}
+_BLOCK_TAGS = set(
+    "address article aside blockquote br dd div dl dt fieldset figcaption figure "
+    "footer form h1 h2 h3 h4 h5 h6 header hr li main nav ol p pre section table "
+    "td th tr ul".split()
+)
+
+
+class FetchError(Exception):
+    pass
+
+
+@dataclass
+class Page:
+    url: str
+    title: str | None = field(default=None)
+    text: str | None = field(default=None)
+    links: set[str] = field(default_factory=set)
+    fetch_time: float = field(default=0.0)
+    needs_rendering: bool = field(default=False)
+
+
+class _PageParser(HTMLParser):
+    def __init__(self, url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = url
+        self.title: str | None = None
+        self.hrefs: list[str] = []
+        self.scripts = 0
+        self._parts: list[str] = []
+        self._skipping: list[str] = []
+        self._in_title = False
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]):
+        if tag == "title" and self.title is None:
+            self._in_title = True
+            self.title = ""
+        elif tag == "base":
+            href = dict(attrs).get("href")
+            if href:
+                self.base_url = urljoin(self.base_url, href)
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.hrefs.append(href)
+        if tag == "script":
+            self.scripts += 1
+        if tag == "body":
+            # the end tag of the head is optional
+            self._skipping.clear()
+        if tag in _SKIPPED_TAGS:
+            self._skipping.append(tag)
+        elif tag in _BLOCK_TAGS:
+            self._parts.append("\n")
+
+    def handle_endtag(self, tag: str):
+        if tag == "title":
+            self._in_title = False
+        if self._skipping and tag == self._skipping[-1]:
+            self._skipping.pop()
+        elif tag in _BLOCK_TAGS:
+            self._parts.append("\n")
+
+    def handle_data(self, data: str):
+        if self._in_title:
+            self.title += data
+        elif not self._skipping:
+            # line breaks in the source are whitespace, block tags break lines
+            self._parts.append(data.replace("\n", " "))
+
+    def text(self) -> str:
+        lines = (" ".join(line.split()) for line in "".join(self._parts).split("\n"))
+        return "\n".join(line for line in lines if line)
+
+
+def is_local_url(url: str) -> bool:
+    host = urlparse(url).hostname
+    return host in {"localhost", "0.0.0.0"} or (
+        host is not None and host.startswith("127.")
+    )
+
+
+def parse_html(url: str, html: str, exclude_local_links: bool = True) -> Page:
+    """Extracts the title, the visible text and the absolute http(s) links of
+    a page, the way a browser would show them before any script runs."""
+    parser = _PageParser(url)
+    parser.feed(html)
+    parser.close()
+    links = set()
+    for href in parser.hrefs:
+        link = urljoin(parser.base_url, href.strip())
+        if urlparse(link).scheme not in ("http", "https"):
+            continue
+        if validators.url(link) and not (exclude_local_links and is_local_url(link)):
+            links.add(link)
+    text = parser.text()
+    title = None if parser.title is None else " ".join(parser.title.split())
+    return Page(
+        url=url,
+        title=title,
+        text=text,
+        links=links,
+        needs_rendering=parser.scripts > 0 and len(text) < MIN_STATIC_TEXT_LENGTH,
+    )
+
+
+class HttpFetcher:
+    """HttpFetcher
+
+    Fetches pages over one pooled `aiohttp` session: connections are kept
+    alive and reused, at most `max_connections` are open at once and at most
+    `max_connections_per_host` to any one host. Only HTML is parsed, other
+    content types yield no page.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_connections_per_host: int = 4,
+        timeout_seconds: float = 15.0,
+        max_bytes: int = 5 << 20,
+        user_agent: str = "search-engine-crawler/1.0",
+        exclude_local_links: bool = True,
+    ):
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout_seconds = timeout_seconds
+        self.max_bytes = max_bytes
+        self.user_agent = user_agent
+        self.exclude_local_links = exclude_local_links
+        self._session: aiohttp.ClientSession | None = None
+
+    async def __aenter__(self) -> "HttpFetcher":
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+            ),
+            timeout=aiohttp.ClientTimeout(total=self.timeout_seconds),
+            headers={"User-Agent": self.user_agent},
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._session.close()
+        self._session = None
+
+    async def fetch(self, url: str) -> Page | None:
+        start_time = time.perf_counter()
+        try:
+            async with self._session.get(url) as response:
+                if response.status >= 400:
+                    raise FetchError(f"HTTP {response.status} fetching {url}")
+                if response.content_type not in HTML_CONTENT_TYPES:
+                    return None
+                body = bytearray()
+                # a single read only returns what has arrived so far
+                async for chunk in response.content.iter_chunked(1 << 16):
+                    body += chunk
+                    if len(body) >= self.max_bytes:
+                        break
+                body = bytes(body[: self.max_bytes])
+                final_url = str(response.url)
+                encoding = response.charset or "utf-8"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise FetchError(f"Failed to fetch {url}: {e!r}") from e
+        try:
+            html = body.decode(encoding, errors="replace")
+        except LookupError:
+            html = body.decode("utf-8", errors="replace")
+        page = parse_html(final_url, html, self.exclude_local_links)
+        page.fetch_time = time.perf_counter() - start_time
+        return page
+
+
+class BrowserFetcher:
+    """BrowserFetcher
+
+    Renders pages in headless Chrome. Browsers are expensive, so there are
+    at most `browsers` of them, started on first use and shared by every
+    caller; each blocks one executor thread while it loads a page. A browser
+    that fails to render a page is closed and replaced on the next render.
+    """
+
+    def __init__(self, browsers: int = 2, scraper_factory: Callable | None = None):
+        self.browsers = browsers
+        self._scraper_factory = scraper_factory
+        # idle browsers, and None for each slot of a browser that was closed
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._slots = 0
+        self._scrapers: list = []
+
+    async def _acquire(self):
+        if self._idle.empty() and self._slots < self.browsers:
+            self._slots += 1
+            return await self._start()
+        scraper = await self._idle.get()
+        if scraper is None:
+            return await self._start()
+        return scraper
+
+    async def _start(self):
+        """Starts a browser in a slot that is already taken."""
+        loop = asyncio.get_running_loop()
+        try:
+            scraper = await loop.run_in_executor(None, self._new_scraper)
+        except Exception as e:
+            self._idle.put_nowait(None)
+            raise FetchError(f"Failed to start a browser: {e!r}") from e
+        except BaseException:
+            self._idle.put_nowait(None)
+            raise
+        self._scrapers.append(scraper)
+        return scraper
+
+    def _new_scraper(self):
+        factory = self._scraper_factory
+        if factory is None:
+            # only import selenium when a page actually needs a browser
+            from web_crawler.web_scraper import WebScraper
+
+            factory = WebScraper
+        return factory()
+
+    def _discard(self, scraper) -> None:
+        self._scrapers.remove(scraper)
+        self._idle.put_nowait(None)
+        try:
+            scraper.close()
+        except Exception as e:
+            logger.warning(f"Failed to close a browser: {e!r}")
+
+    async def fetch(self, url: str) -> Page:
+        scraper = await self._acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            page = await loop.run_in_executor(None, self._render, scraper, url)
+        except FetchError:
+            # the browser may have crashed
+            self._discard(scraper)
+            raise
+        except BaseException:
+            self._idle.put_nowait(scraper)
+            raise
+        else:
+            self._idle.put_nowait(scraper)
+            return page
+
+    def _render(self, scraper, url: str) -> Page:
+        try:
+            fetch_time = scraper.navigate_sync(url)
+            return Page(
+                url=url,
+                title=scraper.driver.title,
+                text=scraper.extract_rendered_text(),
+                links=scraper.find_all_links(),
+                fetch_time=fetch_time,
+            )
+        except Exception as e:
+            raise FetchError(f"Failed to render {url}: {e!r}") from e
+
+    def close(self) -> None:
+        for scraper in self._scrapers:
+            scraper.close()
+        self._scrapers = []
+
+
+class Fetcher:
+    """Fetcher
+
+    Fetches every page over HTTP and only renders the ones whose static HTML
+    is a script-driven shell in a browser.
+    """
+
+    def __init__(self, http: HttpFetcher, browser: BrowserFetcher | None = None):
+        self.http = http
+        self.browser = browser
+        self.pages_fetched = 0
+        self.pages_rendered = 0
+
+    async def fetch(self, url: str) -> Page | None:
+        page = await self.http.fetch(url)
+        if page is not None and page.needs_rendering and self.browser is not None:
+            static_fetch_time = page.fetch_time
+            page = await self.browser.fetch(page.url)
+            page.fetch_time += static_fetch_time
+            self.pages_rendered += 1
+        self.pages_fetched += page is not None
+        return page
@@ -0,0 +1,138 @@
+import asyncio
+import heapq
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+from web_crawler.node import Node
+
+
+@dataclass
+class _Host:
+    """_Host
+
+    The queued pages of one net location, shallowest first, and its token
+    bucket: a fetch takes a token, tokens refill at `rate` per second up to
+    `burst`.
+    """
+
+    tokens: float
+    updated_at: float
+    nodes: list[tuple[int, int, Node]] = field(default_factory=list)
+    scheduled: bool = field(default=False)
+
+    def refill(self, now: float, rate: float, burst: int) -> None:
+        self.tokens = min(burst, self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+
+    def ready_at(self, rate: float) -> float:
+        """When the next token is available."""
+        return self.updated_at + max(0.0, 1 - self.tokens) / rate
+
+
+class Frontier:
+    """Frontier
+
+    The pages waiting to be crawled, queued per net location. Every host has
+    a token bucket that allows `host_rate` fetches per second with bursts of
+    up to `host_burst`, and the hosts with queued pages sit in a heap keyed
+    on the time their next fetch is allowed, so `get` hands out a page of
+    whichever host is ready first and never waits on a throttled host while
+    another one has work. Like `asyncio.Queue`, every `get` is matched by a
+    `task_done` and `join` waits for all of them.
+    """
+
+    def __init__(
+        self,
+        host_rate: float = 1.0,
+        host_burst: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if host_rate <= 0 or host_burst < 1:
+            raise ValueError("host_rate must be positive and host_burst at least 1")
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self._clock = clock
+        self._hosts: dict[str, _Host] = dict()
+        # (ready at, sequence number, netloc)
+        self._ready: list[tuple[float, int, str]] = []
+        self._sequence = itertools.count()
+        self._size = 0
+        self._unfinished = 0
+        self._changed = asyncio.Event()
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    @property
+    def num_hosts(self) -> int:
+        return len(self._hosts)
+
+    def put(self, node: Node) -> None:
+        host = self._hosts.get(node.netloc)
+        if host is None:
+            host = _Host(tokens=self.host_burst, updated_at=self._clock())
+            self._hosts[node.netloc] = host
+        heapq.heappush(host.nodes, (node.depth, next(self._sequence), node))
+        self._size += 1
+        self._unfinished += 1
+        self._finished.clear()
+        if not host.scheduled:
+            self._schedule(node.netloc, host)
+        self._changed.set()
+
+    def _schedule(self, netloc: str, host: _Host) -> None:
+        host.scheduled = True
+        heapq.heappush(
+            self._ready,
+            (host.ready_at(self.host_rate), next(self._sequence), netloc),
+        )
+
+    def get_nowait(self) -> Node | None:
+        """A page of the host that is allowed to be fetched first, None if no
+        host is ready yet."""
+        if not self._ready or self._ready[0][0] > self._clock():
+            return None
+        _, _, netloc = heapq.heappop(self._ready)
+        host = self._hosts[netloc]
+        host.refill(self._clock(), self.host_rate, self.host_burst)
+        host.tokens -= 1
+        _, _, node = heapq.heappop(host.nodes)
+        self._size -= 1
+        if host.nodes:
+            self._schedule(netloc, host)
+        else:
+            host.scheduled = False
+        return node
+
+    async def get(self) -> Node:
+        while True:
+            node = self.get_nowait()
+            if node is not None:
+                return node
+            self._changed.clear()
+            timeout = None if not self._ready else self._ready[0][0] - self._clock()
+            try:
+                # a newly queued host may be ready before the earliest one
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def task_done(self) -> None:
+        if self._unfinished <= 0:
+            raise ValueError("task_done() called too many times")
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._finished.set()
+
+    async def join(self) -> None:
+        await self._finished.wait()
@@ -1,21 +1,33 @@
 import hashlib
 from dataclasses import dataclass, field
+from functools import cached_property
 from urllib.parse import urlparse, urlunparse
 
 
+def fingerprint(id: str) -> int:
+    """The first 64 bits of a `Node.id`."""
+    return int(id[:16], 16)
+
+
 @dataclass
 class Node:
     raw_url: str
     depth: int = field(default=0)
     title: str | None = field(default=None)
     text: str | None = field(default=None)
-    priority: float = field(default=-float("inf"))
 
-    @property
+    # the normalized URL and everything derived from it are computed once,
+    # the crawler looks them up for every discovered link
+
+    @cached_property
     def id(self) -> str:
         return hashlib.sha1(self.url.encode()).hexdigest()
 
-    @property
+    @cached_property
+    def fingerprint(self) -> int:
+        return fingerprint(self.id)
+
+    @cached_property
     def url(self) -> str:
         # Parse the URL into components
         parsed_url = urlparse(self.raw_url)
@@ -33,12 +45,6 @@ class Node:
         )
         return stripped_url
 
-    @property
+    @cached_property
     def netloc(self) -> str:
         return urlparse(self.raw_url).netloc
-
-    # This is a hack to get Node to work with priority queues
-    def __lt__(self, other: "Node") -> bool:
-        assert self.priority is not None
-        assert other.priority is not None
-        return self.priority < other.priority
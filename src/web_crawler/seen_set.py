@@ -0,0 +1,209 @@
+import math
+import os
+from array import array
+
+import numpy as np
+
+SEEN_SET_BACKENDS = ("fingerprints", "bloom")
+
+
+class FingerprintSet:
+    """FingerprintSet
+
+    An exact set of 64-bit URL fingerprints in one open-addressing table of
+    unsigned 64-bit integers with linear probing, 8 bytes per slot instead of
+    a Python string and set entry per URL. Zero marks an empty slot, so the
+    fingerprint 0 is stored as 1. Two URLs only collide with a probability
+    of about n^2 / 2^65.
+    """
+
+    kind = "fingerprints"
+
+    def __init__(self, capacity: int = 1 << 16):
+        self._size = 0
+        self._table = self._empty_table(capacity)
+
+    @staticmethod
+    def _empty_table(capacity: int) -> array:
+        # at most half full
+        slots = 1 << max(4, (2 * capacity - 1).bit_length())
+        return array("Q", bytes(8 * slots))
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _slot(self, fingerprint: int) -> int:
+        table = self._table
+        mask = len(table) - 1
+        slot = fingerprint & mask
+        while table[slot] != 0 and table[slot] != fingerprint:
+            slot = (slot + 1) & mask
+        return slot
+
+    def __contains__(self, fingerprint: int) -> bool:
+        fingerprint = fingerprint or 1
+        return self._table[self._slot(fingerprint)] != 0
+
+    def add(self, fingerprint: int) -> bool:
+        """Adds the fingerprint, returns False if it was already there."""
+        fingerprint = fingerprint or 1
+        slot = self._slot(fingerprint)
+        if self._table[slot] != 0:
+            return False
+        self._table[slot] = fingerprint
+        self._size += 1
+        if 2 * self._size > len(self._table):
+            self._grow()
+        return True
+
+    def _grow(self) -> None:
+        old = self._table
+        self._table = self._empty_table(2 * self._size)
+        for fingerprint in old:
+            if fingerprint != 0:
+                self._table[self._slot(fingerprint)] = fingerprint
+
+    def save(self, path: str) -> None:
+        _save(
+            path,
+            kind=self.kind,
+            size=self._size,
+            table=np.frombuffer(self._table, np.uint64),
+        )
+
+    @classmethod
+    def _from_arrays(cls, arrays) -> "FingerprintSet":
+        seen = cls.__new__(cls)
+        seen._size = int(arrays["size"])
+        seen._table = array("Q", arrays["table"].tobytes())
+        return seen
+
+
+def _next_prime(n: int) -> int:
+    while any(n % d == 0 for d in range(2, math.isqrt(n) + 1)):
+        n += 1
+    return n
+
+
+class _BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        # a prime number of bits, every step of the double hashing below then
+        # visits distinct bits
+        self.num_bits = _next_prime(
+            max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        )
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _bits(self, fingerprint: int):
+        # double hashing: the halves of the fingerprint generate every index
+        h1 = fingerprint & 0xFFFFFFFF
+        h2 = 1 + (fingerprint >> 32) % (self.num_bits - 1)
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def __contains__(self, fingerprint: int) -> bool:
+        bits = self.bits
+        return all(bits[bit >> 3] & (1 << (bit & 7)) for bit in self._bits(fingerprint))
+
+    def add(self, fingerprint: int) -> None:
+        for bit in self._bits(fingerprint):
+            self.bits[bit >> 3] |= 1 << (bit & 7)
+        self.count += 1
+
+
+class BloomFilter:
+    """BloomFilter
+
+    A scalable Bloom filter of URL fingerprints: once a filter holds as many
+    fingerprints as it was sized for, a new one with twice the capacity and
+    half the false positive rate is started, so the overall false positive
+    rate stays below `error_rate` however many URLs are added. It
+    takes about 1.44 * log2(1 / error_rate) bits per URL but may report an
+    unseen URL as seen, which skips that page.
+    """
+
+    kind = "bloom"
+
+    def __init__(self, capacity: int = 1 << 16, error_rate: float = 1e-4):
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._filters = [_BloomFilter(capacity, error_rate / 2)]
+
+    def __len__(self) -> int:
+        return sum(f.count for f in self._filters)
+
+    def __contains__(self, fingerprint: int) -> bool:
+        return any(fingerprint in f for f in self._filters)
+
+    def add(self, fingerprint: int) -> bool:
+        """Adds the fingerprint, returns False if it was (probably) already
+        there."""
+        if fingerprint in self:
+            return False
+        current = self._filters[-1]
+        if current.count >= current.capacity:
+            current = _BloomFilter(2 * current.capacity, current.error_rate / 2)
+            self._filters.append(current)
+        current.add(fingerprint)
+        return True
+
+    def save(self, path: str) -> None:
+        _save(
+            path,
+            kind=self.kind,
+            capacity=self.capacity,
+            error_rate=self.error_rate,
+            counts=np.array([f.count for f in self._filters]),
+            **{
+                f"bits{i}": np.frombuffer(f.bits, np.uint8)
+                for i, f in enumerate(self._filters)
+            },
+        )
+
+    @classmethod
+    def _from_arrays(cls, arrays) -> "BloomFilter":
+        seen = cls(int(arrays["capacity"]), float(arrays["error_rate"]))
+        seen._filters = []
+        capacity, error_rate = seen.capacity, seen.error_rate / 2
+        for i, count in enumerate(arrays["counts"]):
+            bloom = _BloomFilter(capacity, error_rate)
+            bloom.bits = bytearray(arrays[f"bits{i}"].tobytes())
+            bloom.count = int(count)
+            seen._filters.append(bloom)
+            capacity, error_rate = 2 * capacity, error_rate / 2
+        return seen
+
+
+def _save(path: str, **arrays) -> None:
+    # written under a temporary name and renamed, a crash never leaves a
+    # partial file behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def make_seen_set(
+    backend: str, capacity: int = 1 << 16, error_rate: float = 1e-4
+) -> FingerprintSet | BloomFilter:
+    if backend == "fingerprints":
+        return FingerprintSet(capacity)
+    elif backend == "bloom":
+        return BloomFilter(capacity, error_rate)
+    raise ValueError(f"Unknown seen set backend: {backend}")
+
+
+def load_seen_set(path: str) -> FingerprintSet | BloomFilter:
+    with np.load(path) as arrays:
+        kind = str(arrays["kind"])
+        if kind == "fingerprints":
+            return FingerprintSet._from_arrays(arrays)
+        elif kind == "bloom":
+            return BloomFilter._from_arrays(arrays)
+    raise ValueError(f"Unknown seen set backend: {kind}")
@@ -0,0 +1,45 @@
+from web_crawler.checkpoint import CrawlCheckpoint
+from web_crawler.node import Node
+
+
+def test_resume(tmp_path):
+    path = str(tmp_path / "frontier.sqlite")
+    seed = Node("https://seed.com")
+    links = [Node(f"https://seed.com/{i}", depth=1) for i in range(3)]
+
+    checkpoint = CrawlCheckpoint(path)
+    assert checkpoint.pending() == []
+    checkpoint.queued(seed)
+    checkpoint.commit()
+    for link in links:
+        checkpoint.queued(link)
+    checkpoint.done(seed.id)
+    # a page that was queued and done between two commits is never written
+    checkpoint.done([links[0].id])
+    # uncommitted changes are lost
+    checkpoint.close()
+
+    checkpoint = CrawlCheckpoint(path)
+    assert [node.url for node in checkpoint.pending()] == [seed.url]
+    for link in links:
+        checkpoint.queued(link)
+    checkpoint.done([seed.id, links[0].id])
+    checkpoint.commit()
+    checkpoint.close()
+
+    checkpoint = CrawlCheckpoint(path)
+    pending = checkpoint.pending()
+    assert len(checkpoint) == 2
+    assert [node.url for node in pending] == [links[1].url, links[2].url]
+    assert [node.depth for node in pending] == [1, 1]
+    assert pending[0].id == links[1].id
+    checkpoint.close()
+
+
+def test_shallowest_first(tmp_path):
+    checkpoint = CrawlCheckpoint(str(tmp_path / "frontier.sqlite"))
+    checkpoint.queued(Node("https://deep.com", depth=2))
+    checkpoint.queued(Node("https://shallow.com", depth=0))
+    checkpoint.commit()
+    assert [node.depth for node in checkpoint.pending()] == [0, 2]
+    checkpoint.close()
@@ -0,0 +1,283 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from web_crawler.fetcher import (
+    BrowserFetcher,
+    Fetcher,
+    FetchError,
+    HttpFetcher,
+    parse_html,
+)
+
+STATIC_PAGE = """<!doctype html>
+<html>
+<head>
+  <title> Static
+  page </title>
+  <style>body { color: red }</style>
+</head>
+<body>
+  <h1>Heading</h1>
+  <p>First paragraph &amp; more.</p>
+  <script>var hidden = "not text";</script>
+  <p>Second <b>paragraph</b>.</p>
+  <p>
+    Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod
+    tempor incididunt ut labore et dolore magna aliqua. Ut enim ad minim
+    veniam, quis nostrud exercitation ullamco laboris nisi ut aliquip.
+  </p>
+  <a href="/relative">relative</a>
+  <a href="other">sibling</a>
+  <a href="https://example.com/absolute#section">absolute</a>
+  <a href="mailto:someone@example.com">mail</a>
+  <a href="javascript:void(0)">script</a>
+</body>
+</html>
+"""
+
+SCRIPT_SHELL = """<html><head><title>Shell</title></head>
+<body><div id="root"></div><script src="/app.js"></script></body></html>
+"""
+
+PAGES = {
+    "/static/index.html": ("text/html; charset=utf-8", STATIC_PAGE),
+    "/shell": ("text/html", SCRIPT_SHELL),
+    "/data.json": ("application/json", '{"a": 1}'),
+}
+
+
+# sent in two writes with a pause in between, so it arrives in two chunks
+STREAMED_PAGE = (
+    STATIC_PAGE.replace("</body>", "<p>" + "padding " * 250 + "</p>"),
+    '<p>SECONDPART</p><a href="/second">second</a></body></html>',
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/streamed":
+            parts = [part.encode() for part in STREAMED_PAGE]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(sum(map(len, parts))))
+            self.end_headers()
+            for part in parts:
+                self.wfile.write(part)
+                self.wfile.flush()
+                time.sleep(0.2)
+            return
+        if self.path not in PAGES:
+            self.send_error(404)
+            return
+        content_type, body = PAGES[self.path]
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class _FakeScraper:
+    def __init__(self):
+        self.driver = type("Driver", (), dict(title="Rendered"))()
+        self.urls = []
+        self.closed = False
+
+    def navigate_sync(self, url: str) -> float:
+        self.urls.append(url)
+        return 0.5
+
+    def extract_rendered_text(self) -> str:
+        return "rendered text"
+
+    def find_all_links(self) -> set[str]:
+        return {"https://example.com/rendered"}
+
+    def close(self):
+        self.closed = True
+
+
+def test_parse_html():
+    page = parse_html("https://example.com/dir/page.html", STATIC_PAGE)
+    assert page.title == "Static page"
+    assert page.text.split("\n") == [
+        "Heading",
+        "First paragraph & more.",
+        "Second paragraph.",
+        "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod "
+        "tempor incididunt ut labore et dolore magna aliqua. Ut enim ad minim "
+        "veniam, quis nostrud exercitation ullamco laboris nisi ut aliquip.",
+        "relative sibling absolute mail script",
+    ]
+    assert page.links == {
+        "https://example.com/relative",
+        "https://example.com/dir/other",
+        "https://example.com/absolute#section",
+    }
+    assert not page.needs_rendering
+
+
+def test_parse_html_base_and_local_links():
+    html = (
+        '<head><base href="https://other.org/sub/"></head>'
+        '<body><a href="page">page</a><a href="http://127.0.0.1:8080/">local</a>'
+    )
+    assert parse_html("https://example.com", html).links == {
+        "https://other.org/sub/page"
+    }
+    assert parse_html("https://example.com", html, exclude_local_links=False).links == {
+        "https://other.org/sub/page",
+        "http://127.0.0.1:8080/",
+    }
+
+
+def test_parse_html_unclosed_head():
+    page = parse_html("https://example.com", "<title>t</title><body><p>visible")
+    assert page.title == "t"
+    assert page.text == "visible"
+
+
+def test_parse_html_script_shell():
+    page = parse_html("https://example.com", SCRIPT_SHELL)
+    assert page.title == "Shell"
+    assert page.needs_rendering
+
+
+def test_http_fetcher(server_url):
+    async def fetch():
+        async with HttpFetcher(exclude_local_links=False) as fetcher:
+            return await fetcher.fetch(f"{server_url}/static/index.html")
+
+    page = asyncio.run(fetch())
+    assert page.url == f"{server_url}/static/index.html"
+    assert page.title == "Static page"
+    assert "First paragraph & more." in page.text
+    assert "not text" not in page.text
+    assert page.links == {
+        f"{server_url}/relative",
+        f"{server_url}/static/other",
+        "https://example.com/absolute#section",
+    }
+    assert page.fetch_time > 0
+
+
+def test_http_fetcher_streamed_body(server_url):
+    async def fetch(max_bytes):
+        fetcher = HttpFetcher(max_bytes=max_bytes, exclude_local_links=False)
+        async with fetcher:
+            return await fetcher.fetch(f"{server_url}/streamed")
+
+    page = asyncio.run(fetch(5 << 20))
+    assert "SECONDPART" in page.text
+    assert f"{server_url}/second" in page.links
+
+    # bodies are cut off at max_bytes
+    page = asyncio.run(fetch(len(STREAMED_PAGE[0])))
+    assert "padding" in page.text
+    assert "SECONDPART" not in page.text
+
+
+def test_http_fetcher_skips_non_html(server_url):
+    async def fetch():
+        async with HttpFetcher() as fetcher:
+            return await fetcher.fetch(f"{server_url}/data.json")
+
+    assert asyncio.run(fetch()) is None
+
+
+def test_http_fetcher_errors(server_url):
+    async def fetch(url):
+        async with HttpFetcher(timeout_seconds=2) as fetcher:
+            return await fetcher.fetch(url)
+
+    with pytest.raises(FetchError, match="404"):
+        asyncio.run(fetch(f"{server_url}/missing"))
+    # nothing listens on the discard port
+    with pytest.raises(FetchError):
+        asyncio.run(fetch("http://127.0.0.1:9/"))
+
+
+def test_fetcher_renders_script_shells_only(server_url):
+    scrapers = []
+
+    def scraper_factory():
+        scrapers.append(_FakeScraper())
+        return scrapers[-1]
+
+    async def crawl():
+        browser = BrowserFetcher(browsers=1, scraper_factory=scraper_factory)
+        async with HttpFetcher() as http:
+            fetcher = Fetcher(http, browser)
+            pages = await asyncio.gather(
+                fetcher.fetch(f"{server_url}/static/index.html"),
+                fetcher.fetch(f"{server_url}/shell"),
+                fetcher.fetch(f"{server_url}/shell"),
+                fetcher.fetch(f"{server_url}/data.json"),
+            )
+        browser.close()
+        return fetcher, pages
+
+    fetcher, (static, shell, _, data) = asyncio.run(crawl())
+    assert static.title == "Static page"
+    assert shell.title == "Rendered"
+    assert shell.text == "rendered text"
+    assert shell.links == {"https://example.com/rendered"}
+    assert shell.fetch_time >= 0.5
+    assert data is None
+    assert fetcher.pages_fetched == 3
+    assert fetcher.pages_rendered == 2
+    # one browser shared by both renders
+    assert len(scrapers) == 1
+    assert scrapers[0].urls == [f"{server_url}/shell"] * 2
+    assert scrapers[0].closed
+
+
+def test_browser_failures():
+    scrapers = []
+
+    def broken_factory():
+        raise RuntimeError("chrome not installed")
+
+    def scraper_factory():
+        scrapers.append(_FakeScraper())
+        if len(scrapers) == 1:
+            # the first browser crashes on its first page
+            scrapers[0].navigate_sync = lambda url: 1 / 0
+        return scrapers[-1]
+
+    async def render(browser, urls):
+        return await asyncio.gather(
+            *(browser.fetch(url) for url in urls), return_exceptions=True
+        )
+
+    browser = BrowserFetcher(browsers=1, scraper_factory=broken_factory)
+    results = asyncio.run(render(browser, ["https://a.com", "https://b.com"]))
+    assert all(isinstance(result, FetchError) for result in results)
+
+    browser = BrowserFetcher(browsers=1, scraper_factory=scraper_factory)
+    crashed, page = asyncio.run(render(browser, ["https://a.com", "https://b.com"]))
+    assert isinstance(crashed, FetchError)
+    assert page.title == "Rendered"
+    # the crashed browser was closed and replaced
+    assert len(scrapers) == 2
+    assert scrapers[0].closed
+    assert scrapers[1].urls == ["https://b.com"]
+    browser.close()
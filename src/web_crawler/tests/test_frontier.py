@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from web_crawler.frontier import Frontier
+from web_crawler.node import Node
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+def test_host_rate(clock):
+    frontier = Frontier(host_rate=0.5, host_burst=1, clock=clock)
+    for i in range(3):
+        frontier.put(Node(f"https://a.com/{i}"))
+    frontier.put(Node("https://b.com/0"))
+
+    # the throttled host does not hold up the other one
+    assert frontier.get_nowait().url == "https://a.com/0"
+    assert frontier.get_nowait().url == "https://b.com/0"
+    assert frontier.get_nowait() is None
+    assert len(frontier) == 2
+
+    clock.now = 1.9
+    assert frontier.get_nowait() is None
+    clock.now = 2.0
+    assert frontier.get_nowait().url == "https://a.com/1"
+    assert frontier.get_nowait() is None
+    clock.now = 4.0
+    assert frontier.get_nowait().url == "https://a.com/2"
+    assert frontier.empty()
+
+
+def test_host_burst(clock):
+    frontier = Frontier(host_rate=1.0, host_burst=2, clock=clock)
+    for i in range(4):
+        frontier.put(Node(f"https://a.com/{i}"))
+    assert frontier.get_nowait().url == "https://a.com/0"
+    assert frontier.get_nowait().url == "https://a.com/1"
+    assert frontier.get_nowait() is None
+    clock.now = 1.0
+    assert frontier.get_nowait().url == "https://a.com/2"
+    assert frontier.get_nowait() is None
+
+    # an idle host refills up to the burst, not beyond
+    clock.now = 10.0
+    frontier.put(Node("https://a.com/4"))
+    assert frontier.get_nowait().url == "https://a.com/3"
+    assert frontier.get_nowait().url == "https://a.com/4"
+    frontier.put(Node("https://a.com/5"))
+    assert frontier.get_nowait() is None
+
+
+def test_shallow_pages_first(clock):
+    frontier = Frontier(clock=clock)
+    frontier.put(Node("https://a.com/deep", depth=2))
+    frontier.put(Node("https://a.com/shallow", depth=1))
+    assert frontier.get_nowait().url == "https://a.com/shallow"
+
+
+def test_hosts_ordered_by_ready_time(clock):
+    frontier = Frontier(host_rate=1.0, clock=clock)
+    frontier.put(Node("https://a.com/0"))
+    frontier.put(Node("https://a.com/1"))
+    frontier.get_nowait()
+    clock.now = 0.5
+    frontier.put(Node("https://b.com/0"))
+    frontier.put(Node("https://b.com/1"))
+    frontier.get_nowait()
+    clock.now = 2.0
+    assert [frontier.get_nowait().netloc for _ in range(2)] == ["a.com", "b.com"]
+
+
+def test_invalid_rate():
+    with pytest.raises(ValueError):
+        Frontier(host_rate=0)
+    with pytest.raises(ValueError):
+        Frontier(host_burst=0)
+
+
+def test_get_waits_for_ready_host():
+    async def crawl():
+        frontier = Frontier(host_rate=20.0, host_burst=1)
+        frontier.put(Node("https://a.com/0"))
+        frontier.put(Node("https://a.com/1"))
+        urls = []
+
+        async def worker():
+            while True:
+                node = await frontier.get()
+                urls.append(node.url)
+                if node.url == "https://a.com/0":
+                    # discovered while a.com is throttled
+                    frontier.put(Node("https://b.com/0"))
+                frontier.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(2)]
+        await asyncio.wait_for(frontier.join(), timeout=5)
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        return urls
+
+    assert asyncio.run(crawl()) == [
+        "https://a.com/0",
+        "https://b.com/0",
+        "https://a.com/1",
+    ]
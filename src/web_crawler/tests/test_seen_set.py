@@ -0,0 +1,75 @@
+import pytest
+
+from web_crawler.node import Node
+from web_crawler.seen_set import (
+    SEEN_SET_BACKENDS,
+    BloomFilter,
+    FingerprintSet,
+    load_seen_set,
+    make_seen_set,
+)
+
+
+def _fingerprints(n: int, prefix: str = "https://example.com/") -> list[int]:
+    return [Node(f"{prefix}{i}").fingerprint for i in range(n)]
+
+
+@pytest.mark.parametrize("backend", SEEN_SET_BACKENDS)
+def test_add(backend):
+    # small enough to grow several times, with next to no false positives
+    seen = make_seen_set(backend, capacity=128, error_rate=1e-6)
+    fingerprints = _fingerprints(1_000)
+    assert all(seen.add(f) for f in fingerprints)
+    assert not any(seen.add(f) for f in fingerprints)
+    assert len(seen) == 1_000
+    assert all(f in seen for f in fingerprints)
+
+
+def test_fingerprint_set_exact():
+    seen = FingerprintSet(capacity=16)
+    fingerprints = _fingerprints(1_000)
+    for f in fingerprints:
+        seen.add(f)
+    assert not any(f in seen for f in _fingerprints(1_000, "https://other.org/"))
+    # zero is a valid fingerprint
+    assert 0 not in seen
+    assert seen.add(0)
+    assert 0 in seen
+    assert not seen.add(0)
+
+
+def test_bloom_filter_false_positives():
+    seen = BloomFilter(capacity=1_000, error_rate=0.01)
+    for f in _fingerprints(5_000):
+        seen.add(f)
+    false_positives = sum(f in seen for f in _fingerprints(10_000, "https://o.org/"))
+    assert false_positives / 10_000 < 0.02
+
+
+@pytest.mark.parametrize("backend", SEEN_SET_BACKENDS)
+def test_save_load(backend, tmp_path):
+    seen = make_seen_set(backend, capacity=16)
+    fingerprints = _fingerprints(100)
+    for f in fingerprints:
+        seen.add(f)
+    path = str(tmp_path / "seen.npz")
+    seen.save(path)
+    loaded = load_seen_set(path)
+    assert type(loaded) is type(seen)
+    assert len(loaded) == 100
+    assert all(f in loaded for f in fingerprints)
+    assert loaded.add(Node("https://new.page").fingerprint)
+    assert not loaded.add(fingerprints[0])
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        make_seen_set("set")
+
+
+def test_node_fingerprint():
+    node = Node("https://example.com/page?query=1#fragment")
+    assert node.url == "https://example.com/page"
+    assert node.fingerprint == int(node.id[:16], 16)
+    assert node.fingerprint == Node("https://example.com/page").fingerprint
+    assert node.netloc == "example.com"
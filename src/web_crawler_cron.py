@@ -1,134 +1,303 @@
 import logging
 import asyncio
+import os
 import sys
-import time
+from typing import Callable
 
-from selenium.common.exceptions import WebDriverException, TimeoutException
-from urllib3.exceptions import MaxRetryError, ReadTimeoutError
-from web_crawler.web_scraper import WebScraper
+from web_crawler.checkpoint import CrawlCheckpoint
+from web_crawler.fetcher import BrowserFetcher, Fetcher, FetchError, HttpFetcher
+from web_crawler.frontier import Frontier
 from web_crawler.node import Node
+from web_crawler.seen_set import (
+    BloomFilter,
+    FingerprintSet,
+    load_seen_set,
+    make_seen_set,
+)
 
-from search.inverted_index import InvertedIndex
-from pickle_store import PickleStore
-from env import INVERTED_INDEX_STORAGE_PATH
+from search.batch_indexer import BatchIndexer
+from search.inverted_index import IndexConfig, InvertedIndex
+from search.pipeline import ParallelAnalyzer
+from segment_store import SegmentStore
+from util import notify_server
+from env import (
+    CRAWLER_BROWSERS,
+    CRAWLER_CHECKPOINT_PATH,
+    CRAWLER_CHECKPOINT_SECONDS,
+    CRAWLER_FETCH_TIMEOUT_SECONDS,
+    CRAWLER_GENERATIONS_KEPT,
+    CRAWLER_HOST_BURST,
+    CRAWLER_HOST_RATE,
+    CRAWLER_MAX_CONNECTIONS,
+    CRAWLER_MAX_CONNECTIONS_PER_HOST,
+    CRAWLER_MAX_DEPTH,
+    CRAWLER_SEEN_SET_BACKEND,
+    CRAWLER_SEEN_SET_CAPACITY,
+    CRAWLER_SEEN_SET_PATH,
+    CRAWLER_WORKERS,
+    FLAT_MAX_DOCS,
+    FLAT_RERANK_FACTOR,
+    FLAT_VECTOR_DTYPE,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+    HNSW_M,
+    HNSW_MAX_ELEMENTS,
+    INDEX_MERGE_FACTOR,
+    INDEX_MERGE_MIN_DOCS,
+    INDEXING_PROCESSES,
+    INVERTED_INDEX_STORAGE_PATH,
+    PQ_SUBVECTORS,
+    VECTOR_BACKEND,
+)
 
 logging.basicConfig(level=logging.INFO, stream=sys.stdout)
 
 
-START_TIME = time.perf_counter()
-
-
-def seconds_since_program_start():
-    current_time = time.perf_counter()
-    return int(current_time - START_TIME)
-
-
 async def worker(
     worker_id: int,
-    inverted_index: InvertedIndex,
+    fetcher: Fetcher,
+    indexer: BatchIndexer,
     max_depth: int,
-    visited: set[str],
-    netloc_last_visited_at: dict[str, int],
-    queue: asyncio.PriorityQueue,
+    seen: FingerprintSet | BloomFilter,
+    frontier: Frontier,
+    crawl_checkpoint: CrawlCheckpoint,
 ) -> None:
     logger = logging.getLogger(f"worker{worker_id}")
 
-    scraper = WebScraper()
-
     logger.info("Started worker.")
 
+    while True:
+        node = await frontier.get()
+        try:
+            page = await fetcher.fetch(node.url)
+            if page is None:
+                # not an HTML page
+                crawl_checkpoint.done(node.id)
+                continue
+
+            # links are queued before the page can be indexed and checkpointed
+            # as done
+            if (node.depth + 1) <= max_depth:
+                for link in page.links:
+                    link_node = Node(link, node.depth + 1)
+                    if seen.add(link_node.fingerprint):
+                        frontier.put(link_node)
+                        crawl_checkpoint.queued(link_node)
+
+            node.text = page.text
+            node.title = page.title
+
+            await indexer.put(node)
+
+            logger.info(
+                f"index_terms={indexer.index.total_terms} "
+                f"queue_size={frontier.qsize()} "
+                f"hosts={frontier.num_hosts} "
+                f"depth={node.depth} "
+                f"fetch_time={round(page.fetch_time, 4)}s "
+                f"url={node.url}"
+            )
+        except FetchError as e:
+            logger.error(f"Failed to fetch error {e} URL: {node.url}")
+            crawl_checkpoint.done(node.id)
+        finally:
+            frontier.task_done()
+
+
+def notify_index_loaded() -> None:
     try:
-        while True:
-            node = await queue.get()
-            try:
-                fetch_time = await scraper.navigate(node.url)
-                netloc_last_visited_at[node.netloc] = seconds_since_program_start()
-
-                node.text = scraper.extract_rendered_text()
-                node.title = scraper.driver.title
-
-                inverted_index.insert(node)
-
-                links = scraper.find_all_links()
-
-                if (node.depth + 1) <= max_depth:
-                    for link in links:
-                        link_node = Node(link, node.depth + 1)
-                        # we prefer net locations we haven't seen before to avoid rate limiting
-                        if netloc_last_visited_at.get(link_node.netloc) is not None:
-                            # prioritize longer time since last visit; mult by -1 since PriorityQueue prioritizes lower numbers
-                            link_node.priority = -1 * (
-                                time.perf_counter()
-                                - netloc_last_visited_at[link_node.netloc]
-                            )
-                        if link_node.url in visited:
-                            continue
-                        visited.add(link_node.url)
-                        await queue.put(link_node)
-
-                logger.info(
-                    f"index_bytes={sys.getsizeof(inverted_index._inverted_index)} "
-                    f"queue_size={queue.qsize()} "
-                    f"depth={node.depth} "
-                    f"priority={node.priority} "
-                    f"fetch_time={round(fetch_time, 4)}s "
-                    f"url={node.url}"
-                )
-            except (
-                WebDriverException,
-                MaxRetryError,
-                TimeoutException,
-                ReadTimeoutError,
-            ) as e:
-                logger.error(f"Failed to fetch error {e} URL: {node.url}")
-            finally:
-                queue.task_done()
-                if queue.empty():
-                    break
-    finally:
-        scraper.close()
+        notify_server("inverted-index/load")
+    except OSError as e:
+        # a server that is not up opens the latest segments when it starts
+        logging.warning(f"Failed to notify the server of new segments: {e}")
+
+
+async def checkpoint(
+    indexer: BatchIndexer,
+    segment_store: SegmentStore,
+    new_segment: Callable[[], InvertedIndex],
+    segment_added: asyncio.Event,
+    crawl_checkpoint: CrawlCheckpoint,
+    seen: FingerprintSet | BloomFilter,
+    seen_set_path: str,
+) -> None:
+    # the pages indexed since the last checkpoint are saved as a segment first
+    # and only those, and the pages that failed to index, which are not
+    # retried, are committed as done; the seen set is saved last, so it never
+    # misses a page of the committed frontier
+    indexed_ids, failed_ids = await indexer.save(segment_store.add, fresh=new_segment)
+    crawl_checkpoint.done(indexed_ids + failed_ids)
+    crawl_checkpoint.commit()
+    seen.save(seen_set_path)
+    segment_store.prune(keep=CRAWLER_GENERATIONS_KEPT)
+    if indexed_ids:
+        segment_added.set()
+        await asyncio.get_running_loop().run_in_executor(None, notify_index_loaded)
+    logging.info(
+        f"Checkpointed {len(indexed_ids)} indexed pages, "
+        f"{len(failed_ids)} failed, {len(crawl_checkpoint)} pages pending."
+    )
+
+
+async def merge_segments(
+    stopped: asyncio.Event, segment_added: asyncio.Event, segment_store: SegmentStore
+) -> None:
+    loop = asyncio.get_running_loop()
+    while not stopped.is_set():
+        await segment_added.wait()
+        segment_added.clear()
+        # a merged segment can complete a run of larger ones to merge
+        while await loop.run_in_executor(None, segment_store.merge) is not None:
+            await loop.run_in_executor(None, notify_index_loaded)
+
+
+async def checkpoint_periodically(stopped: asyncio.Event, **checkpoint_args) -> None:
+    while not stopped.is_set():
+        try:
+            await asyncio.wait_for(stopped.wait(), CRAWLER_CHECKPOINT_SECONDS)
+        except asyncio.TimeoutError:
+            await checkpoint(**checkpoint_args)
 
 
 async def main():
-    max_depth = 2
-    num_workers = 32
     seed_url = "https://news.ycombinator.com"
 
-    inverted_index = InvertedIndex()
-    pickle_store = PickleStore(f"../{INVERTED_INDEX_STORAGE_PATH}")
+    # pages are indexed into a small in-memory index that every checkpoint
+    # saves as the newest segment and replaces with an empty one; re-crawled
+    # pages replace their old versions in older segments
+    config = IndexConfig(
+        max_elements=HNSW_MAX_ELEMENTS,
+        ef_construction=HNSW_EF_CONSTRUCTION,
+        M=HNSW_M,
+        ef_search=HNSW_EF_SEARCH,
+        vector_backend=VECTOR_BACKEND,
+        flat_dtype=FLAT_VECTOR_DTYPE,
+        flat_max_docs=FLAT_MAX_DOCS,
+        rerank_factor=FLAT_RERANK_FACTOR,
+        pq_subvectors=PQ_SUBVECTORS,
+    )
+    inverted_index = InvertedIndex(config=config)
+
+    def new_segment() -> InvertedIndex:
+        return InvertedIndex(
+            model=inverted_index.model,
+            model_name=inverted_index.model_name,
+            config=config,
+        )
+
+    segment_store = SegmentStore(
+        f"../{INVERTED_INDEX_STORAGE_PATH}",
+        merge_factor=INDEX_MERGE_FACTOR,
+        min_merge_docs=INDEX_MERGE_MIN_DOCS,
+        model=inverted_index.model,
+    )
+    analyzer = (
+        ParallelAnalyzer(inverted_index.model_name, processes=INDEXING_PROCESSES)
+        if INDEXING_PROCESSES != 0
+        else None
+    )
+    indexer = BatchIndexer(inverted_index, analyzer=analyzer)
+    indexer.start()
 
-    seed_node = Node(seed_url)
-    visited = set([seed_node.url])
-    netloc_last_visited_at = dict()
+    # pages seen by earlier crawls are not fetched again, only the seed is
+    seen_set_path = f"../{CRAWLER_SEEN_SET_PATH}"
+    seen = (
+        load_seen_set(seen_set_path)
+        if os.path.exists(seen_set_path)
+        else make_seen_set(CRAWLER_SEEN_SET_BACKEND, CRAWLER_SEEN_SET_CAPACITY)
+    )
 
-    queue = asyncio.PriorityQueue()
+    # politeness: every host is fetched at most CRAWLER_HOST_RATE times per
+    # second, workers take pages of whichever host is ready
+    frontier = Frontier(host_rate=CRAWLER_HOST_RATE, host_burst=CRAWLER_HOST_BURST)
 
-    # start with the seed url
-    await queue.put(seed_node)
+    # an interrupted crawl resumes from the frontier of its last checkpoint,
+    # otherwise start with the seed url
+    crawl_checkpoint = CrawlCheckpoint(f"../{CRAWLER_CHECKPOINT_PATH}")
+    pending = crawl_checkpoint.pending()
+    if pending:
+        logging.info(f"Resuming crawl with {len(pending)} pending pages.")
+    else:
+        pending = [Node(seed_url)]
+        crawl_checkpoint.queued(pending[0])
+    for node in pending:
+        seen.add(node.fingerprint)
+        frontier.put(node)
 
-    # start workers
-    workers = [
-        asyncio.create_task(
-            worker(
-                worker_id=i,
-                inverted_index=inverted_index,
-                max_depth=max_depth,
-                visited=visited,
-                netloc_last_visited_at=netloc_last_visited_at,
-                queue=queue,
+    # small segments are merged in the background as they add up
+    segment_added = asyncio.Event()
+    merges_stopped = asyncio.Event()
+    merges = asyncio.create_task(
+        merge_segments(merges_stopped, segment_added, segment_store)
+    )
+
+    checkpoint_args = dict(
+        indexer=indexer,
+        segment_store=segment_store,
+        new_segment=new_segment,
+        segment_added=segment_added,
+        crawl_checkpoint=crawl_checkpoint,
+        seen=seen,
+        seen_set_path=seen_set_path,
+    )
+    checkpoints_stopped = asyncio.Event()
+    checkpoints = asyncio.create_task(
+        checkpoint_periodically(checkpoints_stopped, **checkpoint_args)
+    )
+
+    # pages are fetched over pooled HTTP connections, only script-driven
+    # pages are rendered in one of a few shared browsers
+    browser_fetcher = BrowserFetcher(browsers=CRAWLER_BROWSERS)
+    async with HttpFetcher(
+        max_connections=CRAWLER_MAX_CONNECTIONS,
+        max_connections_per_host=CRAWLER_MAX_CONNECTIONS_PER_HOST,
+        timeout_seconds=CRAWLER_FETCH_TIMEOUT_SECONDS,
+    ) as http_fetcher:
+        fetcher = Fetcher(http_fetcher, browser_fetcher)
+
+        # start workers
+        workers = [
+            asyncio.create_task(
+                worker(
+                    worker_id=i,
+                    fetcher=fetcher,
+                    indexer=indexer,
+                    max_depth=CRAWLER_MAX_DEPTH,
+                    seen=seen,
+                    frontier=frontier,
+                    crawl_checkpoint=crawl_checkpoint,
+                )
             )
-        )
-        for i in range(num_workers)
-    ]
+            for i in range(CRAWLER_WORKERS)
+        ]
+
+        await frontier.join()
+
+        for w in workers:
+            w.cancel()
+
+        await asyncio.gather(*workers, return_exceptions=True)
+    browser_fetcher.close()
+    logging.info(
+        f"pages_fetched={fetcher.pages_fetched} "
+        f"pages_rendered={fetcher.pages_rendered}"
+    )
 
-    await queue.join()
+    checkpoints_stopped.set()
+    await checkpoints
 
-    for w in workers:
-        w.cancel()
+    # index whatever is still waiting in the last partial batch
+    await indexer.close()
+    if analyzer is not None:
+        analyzer.close()
 
-    await asyncio.gather(*workers, return_exceptions=True)
+    # the last checkpoint leaves no page pending
+    await checkpoint(**checkpoint_args)
+    crawl_checkpoint.close()
 
-    pickle_store.save(inverted_index)
+    merges_stopped.set()
+    segment_added.set()
+    await merges
 
 
 if __name__ == "__main__":